@@ -0,0 +1,236 @@
+"""Database, mail and user loading for the coroutine views enabled by
+``ASYNC_VIEWS``.
+
+Flask hands coroutine views to ``app.async_to_sync``, which by default
+starts a new event loop for every request. Here each process runs one
+long-lived loop in a thread instead: every coroutine view and hook runs on
+it, so the async engine's pooled connections stay on the loop that opened
+them and requests waiting on the database or the mail server overlap.
+Nothing on the loop may block, CPU-heavy work goes to ``asyncio.to_thread``.
+"""
+import asyncio
+import os
+import threading
+
+import sqlalchemy as sa
+from flask import current_app, g, session
+from flask_mail import email_dispatched
+
+from . import user_cache
+from .database import is_memory_database, set_sqlite_pragmas
+from .email import build_message
+from .models import OutboxMessage, User
+
+
+DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg',
+           'mysql': 'aiomysql'}
+
+
+def async_database_url(url):
+    """Swap the driver of a database URL for its asyncio counterpart."""
+    url = sa.engine.make_url(url)
+    backend = url.get_backend_name()
+    if backend not in DRIVERS:
+        raise ValueError(f'No asyncio driver known for {backend!r}, '
+                         f'set ASYNC_DATABASE_URL.')
+    return url.set(drivername=f'{backend}+{DRIVERS[backend]}')
+
+
+class MailSession(sa.orm.Session):
+    """Sync side of the async sessions, sends the mail queued with
+    :func:`send_email` once the transaction commits.
+    """
+
+
+@sa.event.listens_for(MailSession, 'after_commit')
+def deliver_pending_mail(sync_session):
+    for app, msg in sync_session.info.pop('pending_mail', ()):
+        app.extensions['async_db'].spawn(deliver(app, msg))
+
+
+@sa.event.listens_for(MailSession, 'after_rollback')
+def discard_pending_mail(sync_session):
+    sync_session.info.pop('pending_mail', None)
+
+
+class _AsyncState:
+    def __init__(self, app, url):
+        self.app = app
+        self.url = url
+        self.engine = None
+        self.sessionmaker = None
+        self.loop = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.tasks = set()
+
+    def start(self):
+        # The loop and the engine belong to the process that created them,
+        # a forked server worker starts its own on first use.
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                # Imported here, only processes serving async views pay
+                # for the asyncio extension and its driver.
+                from sqlalchemy.ext.asyncio import (async_sessionmaker,
+                                                    create_async_engine)
+                self.engine = create_async_engine(
+                    self.url, **self.app.config['SQLALCHEMY_ENGINE_OPTIONS']
+                )
+                if self.engine.dialect.name == 'sqlite':
+                    set_sqlite_pragmas(self.engine.sync_engine,
+                                       self.app.config['SQLITE_PRAGMAS'])
+                self.sessionmaker = async_sessionmaker(
+                    self.engine, sync_session_class=MailSession,
+                    expire_on_commit=False
+                )
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self.loop.run_forever, name='async-views',
+                    daemon=True
+                ).start()
+                self.pid = os.getpid()
+            return self.loop
+
+    def run(self, coro):
+        # The callback scheduling the coroutine copies this thread's
+        # context, so the request and app contexts are visible on the loop.
+        return asyncio.run_coroutine_threadsafe(coro, self.start()).result()
+
+    def async_to_sync(self, func):
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+        return wrapper
+
+    def spawn(self, coro):
+        """Run ``coro`` in the background. Only call from the loop."""
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def session(self):
+        self.start()
+        return self.sessionmaker()
+
+    async def _drain(self):
+        while self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def join(self):
+        """Wait for the mail sent in the background."""
+        if self.loop is not None and self.pid == os.getpid():
+            self.run(self._drain())
+
+    def shutdown(self):
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                return
+            loop, self.loop = self.loop, None
+        asyncio.run_coroutine_threadsafe(self._drain(), loop).result()
+        asyncio.run_coroutine_threadsafe(self.engine.dispose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+class AsyncDatabase:
+    """Async SQLAlchemy sessions for the coroutine views, on an engine for
+    ``ASYNC_DATABASE_URL`` (by default the main database URL with its
+    asyncio driver).
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['ASYNC_VIEWS']:
+            return
+        url = (app.config['ASYNC_DATABASE_URL']
+               or async_database_url(app.config['SQLALCHEMY_DATABASE_URI']))
+        if is_memory_database(url):
+            raise ValueError('ASYNC_VIEWS needs a database the async engine '
+                             'can share, not an in-memory one.')
+        state = app.extensions['async_db'] = _AsyncState(app, url)
+        app.async_to_sync = state.async_to_sync
+
+    @property
+    def state(self):
+        return current_app.extensions['async_db']
+
+    def session(self):
+        """A new :class:`~sqlalchemy.ext.asyncio.AsyncSession`, use it as
+        ``async with async_db.session() as db_session:``.
+        """
+        return self.state.session()
+
+    def join(self):
+        self.state.join()
+
+    def shutdown(self):
+        self.state.shutdown()
+
+
+async_db = AsyncDatabase()
+
+
+async def load_user_async(user_id):
+    """Async counterpart of ``models.load_user``."""
+    data = user_cache.get(int(user_id))
+    if data is None:
+        async with async_db.session() as db_session:
+            user = await db_session.get(User, int(user_id))
+        if user is None:
+            return None
+        data = user.to_cache()
+        user_cache.set(user.id, data)
+    return User.from_cache(data)
+
+
+def preload_user():
+    """Load the logged in user on the async engine, before anything asks
+    Flask-Login for ``current_user`` on the loop. ``models.load_user``
+    picks it up. Called from the request thread, where reading the session
+    store may block.
+    """
+    user_id = session.get('_user_id')
+    if user_id is not None and 'preloaded_user' not in g:
+        g.preloaded_user = current_app.extensions['async_db'].run(
+            load_user_async(user_id)
+        )
+
+
+def send_email(db_session, to, subject, template, **kwargs):
+    """``app.email.send_email`` for an async session: the message joins the
+    session's transaction, in the outbox table or, without ``MAIL_OUTBOX``,
+    sent over SMTP from the loop once the transaction commits.
+    """
+    app = current_app._get_current_object()
+    msg = build_message(to, subject, template, **kwargs)
+    if app.config['MAIL_OUTBOX']:
+        db_session.add(OutboxMessage.from_message(msg))
+    else:
+        db_session.sync_session.info.setdefault('pending_mail', []).append(
+            (app, msg)
+        )
+
+
+async def deliver(app, msg):
+    if app.extensions['mail'].suppress:
+        email_dispatched.send(msg, app=app)
+        return
+    import aiosmtplib
+    config = app.config
+    try:
+        await aiosmtplib.send(
+            msg.as_bytes(),
+            sender=msg.sender,
+            recipients=list(msg.send_to),
+            hostname=config['MAIL_SERVER'],
+            port=config['MAIL_PORT'],
+            username=config['MAIL_USERNAME'],
+            password=config['MAIL_PASSWORD'],
+            use_tls=config.get('MAIL_USE_SSL', False),
+            start_tls=config['MAIL_USE_TLS'],
+        )
+    except (aiosmtplib.SMTPException, OSError):
+        app.logger.exception('Failed to send mail to %s',
+                             ', '.join(msg.recipients))
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import current_app, request, send_file, send_from_directory
+from werkzeug.utils import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def encoders():
+    yield 'br', '.br', brotli.compress if brotli is not None else None
+    yield 'gzip', '.gz', lambda data: gzip.compress(data, 9, mtime=0)
+
+
+def precompress(data, path):
+    """Write the gzip and brotli variants of ``data`` next to ``path``,
+    keeping only those that are actually smaller.
+    """
+    written = []
+    for encoding, suffix, compress in encoders():
+        if compress is None:
+            continue
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+def walk(folder, skip=None):
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != skip]
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, folder).replace(os.sep, '/')
+
+
+def build(static_folder, vendor=None):
+    """Fingerprint every file in ``static_folder`` into its ``dist``
+    directory, precompress the copies and write the manifest mapping the
+    original names to the fingerprinted ones.
+
+    ``vendor`` maps a name to another static folder (e.g. Flask-Bootstrap's)
+    whose files are precompressed into ``dist/<name>`` without renaming.
+    Files from earlier builds are left in place for pages still cached.
+    """
+    dist = os.path.join(static_folder, DIST)
+    manifest = {}
+    for source, name in walk(static_folder, skip=dist):
+        with open(source, 'rb') as f:
+            data = f.read()
+        base, ext = os.path.splitext(name)
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        hashed = f'{DIST}/{base}.{digest}{ext}'
+        target = os.path.join(static_folder, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+        precompress(data, target)
+        manifest[name] = hashed
+    for prefix, folder in (vendor or {}).items():
+        for source, name in walk(folder):
+            target = os.path.join(dist, prefix, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(source, 'rb') as f:
+                precompress(f.read(), target)
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def send_precompressed(directory, filename, variants):
+    """Send ``filename`` from ``directory``, or its precompressed variant
+    from ``variants`` when the client accepts that encoding.
+    """
+    for encoding, suffix, compress in encoders():
+        if not request.accept_encodings[encoding]:
+            continue
+        variant = safe_join(variants, filename + suffix)
+        if variant is not None and os.path.isfile(variant):
+            mimetype = (
+                mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            )
+            response = send_file(variant, mimetype=mimetype, conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def cache_forever(response):
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response
+
+
+class Assets:
+    """Serves the output of ``flask assets build``: ``url_for('static')``
+    returns fingerprinted names, which are sent precompressed and cached
+    for a year. Without a build, static files are served as before.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.load_manifest(app)
+        app.url_defaults(self.fingerprint)
+        app.view_functions['static'] = self.send_static
+        if 'bootstrap.static' in app.view_functions:
+            app.view_functions['bootstrap.static'] = self.send_bootstrap
+
+    def load_manifest(self, app):
+        path = os.path.join(app.static_folder, DIST, MANIFEST)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        app.extensions['assets'] = {
+            'manifest': manifest,
+            'fingerprinted': set(manifest.values())
+        }
+
+    def fingerprint(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            manifest = current_app.extensions['assets']['manifest']
+            values['filename'] = manifest.get(
+                values['filename'], values['filename']
+            )
+
+    def send_static(self, filename):
+        static_folder = current_app.static_folder
+        response = send_precompressed(static_folder, filename, static_folder)
+        if filename in current_app.extensions['assets']['fingerprinted']:
+            cache_forever(response)
+        return response
+
+    def send_bootstrap(self, filename):
+        blueprint = current_app.blueprints['bootstrap']
+        variants = os.path.join(current_app.static_folder, DIST, 'bootstrap')
+        response = send_precompressed(blueprint.static_folder, filename,
+                                      variants)
+        # Flask-Bootstrap revs its URLs with a version query string.
+        if request.args.get('bootstrap'):
+            cache_forever(response)
+        return response
+
@@ -0,0 +1,93 @@
+"""Coroutine versions of the auth views that wait on the database and the
+mail server, used instead of the ones in views.py when ``ASYNC_VIEWS`` is
+set. See app/aio.py.
+"""
+import asyncio
+
+from flask import flash, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+from sqlalchemy.exc import IntegrityError
+
+from app import password_hasher
+from app.aio import async_db, preload_user, send_email
+from app.auth.forms import RegistrationForm
+from app.models import User, default_role_id
+from app.querybudget import query_budget
+
+
+@query_budget(6)
+async def register():
+    form = RegistrationForm()
+    async with async_db.session() as db_session:
+        if not (form.is_submitted() and await form.validate_async(db_session)):
+            return render_template('auth/register.html', form=form)
+        # Hashing is CPU-bound, it must not hold up the event loop.
+        password_hash = await asyncio.to_thread(password_hasher.hash,
+                                                form.password.data)
+        # The role table may need the sync session, off the loop too.
+        role_id = await asyncio.to_thread(default_role_id)
+        user = User(
+            email=form.email.data,
+            username=form.username.data,
+            password_hash=password_hash,
+            role_id=role_id
+        )
+        db_session.add(user)
+        try:
+            await db_session.flush()
+        except IntegrityError as e:
+            await db_session.rollback()
+            form.add_integrity_error(e)
+            return render_template('auth/register.html', form=form)
+        token = user.generate_confirmation_token()
+        send_email(
+            db_session,
+            user.email,
+            'Confirm Your Account',
+            'auth/email/confirm',
+            user=user,
+            token=token
+        )
+        await db_session.commit()
+    flash('A confirmation email has been sent to you by email.')
+    return redirect(url_for('main.index'))
+
+
+@query_budget(4)
+@login_required
+async def resend_confirmation():
+    token = current_user.generate_confirmation_token()
+    async with async_db.session() as db_session:
+        send_email(
+            db_session,
+            current_user.email,
+            'Confirm Your Account',
+            'auth/email/confirm',
+            user=current_user,
+            token=token
+        )
+        await db_session.commit()
+    flash('A new confirmation email has been sent to you by email.')
+    return redirect(url_for('main.index'))
+
+
+ENDPOINTS = {
+    'auth.register': register,
+    'auth.resend_confirmation': resend_confirmation,
+}
+
+
+def preload():
+    # A plain function: a coroutine hook would send every request, sync
+    # views included, through the loop.
+    if request.endpoint in ENDPOINTS:
+        preload_user()
+
+
+def init_app(app):
+    from app.auth.views import before_request
+    async_db.init_app(app)
+    app.view_functions.update(ENDPOINTS)
+    # Load the user before auth's before_request hook asks Flask-Login.
+    hooks = app.before_request_funcs.setdefault(None, [])
+    hooks.insert(hooks.index(before_request), preload)
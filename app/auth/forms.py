@@ -1,6 +1,9 @@
+from .. import db
+from ..database import read_replica
 from ..models import User
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, ValidationError
+from sqlalchemy import or_, select
+from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, Length, Email, Regexp, EqualTo
 
 
@@ -41,13 +44,61 @@ class RegistrationForm(FlaskForm):
     password2 = PasswordField('Confirm password', validators=[DataRequired()])
     submit = SubmitField('Register')
 
-    def validate_email(self, field):
-        if User.query.filter_by(email=field.data).first():
-            raise ValidationError('Email already registered.')
+    duplicate_messages = {
+        'email': 'Email already registered.',
+        'username': 'Username already in use.'
+    }
 
-    def validate_username(self, field):
-        if User.query.filter_by(username=field.data).first():
-            raise ValidationError('Username already in use.')
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        return self.check_taken(self.taken_fields())
+
+    async def validate_async(self, db_session, extra_validators=None):
+        """validate() with the duplicate check awaited on an AsyncSession."""
+        if not super().validate(extra_validators):
+            return False
+        return self.check_taken(await self.taken_fields_async(db_session))
+
+    def check_taken(self, taken):
+        for name in taken:
+            self[name].errors.append(self.duplicate_messages[name])
+        return not taken
+
+    def taken_query(self):
+        return select(User.email, User.username).where(or_(
+            User.email == self.email.data,
+            User.username == self.username.data
+        ))
+
+    @read_replica()
+    def taken_fields(self):
+        return self.taken_from_rows(db.session.execute(self.taken_query()))
+
+    async def taken_fields_async(self, db_session):
+        return self.taken_from_rows(
+            await db_session.execute(self.taken_query())
+        )
+
+    def taken_from_rows(self, rows):
+        taken = set()
+        for email, username in rows:
+            if email == self.email.data:
+                taken.add('email')
+            if username == self.username.data:
+                taken.add('username')
+        return taken
+
+    def add_integrity_error(self, error):
+        # The unique indexes catch registrations that raced past validate().
+        # Only look at the part of the message naming the index: PostgreSQL
+        # puts the submitted value on a DETAIL line and MySQL before the key.
+        message = str(error.orig).splitlines()[0].rpartition(' for key ')[2]
+        for name in ('username', 'email'):
+            if f'users.{name}' in message or f'ix_users_{name}' in message:
+                self[name].errors.append(self.duplicate_messages[name])
+                return
+        raise error
 
 
 class ChangePasswordForm(FlaskForm):
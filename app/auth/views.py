@@ -1,10 +1,12 @@
 from flask import render_template, redirect, request, url_for, flash
 from flask_login import current_user, login_user, login_required, logout_user 
+from sqlalchemy.exc import IntegrityError
 
-from app import db
+from app import confirm_cache, db
 from app.email import send_email
 from app.auth import auth
 from app.models import User
+from app.querybudget import query_budget
 from app.auth.forms import LoginForm, RegistrationForm, ChangePasswordForm
 
 
@@ -20,6 +22,7 @@ def before_request():
 
 
 @auth.route('/login', methods=['GET', 'POST'])
+@query_budget(5)
 def login():
     form = LoginForm()
     if not form.validate_on_submit():
@@ -33,6 +36,9 @@ def login():
             flash('Invalid username or password.')
             return redirect(url_for('auth.login'))
         else:
+            if user.password_needs_rehash():
+                user.password = form.password.data
+                db.session.commit()
             login_user(user, form.remember_me.data)
             next = request.args.get('next')
             if (next is None) or (not next.startswith('/')):
@@ -41,6 +47,7 @@ def login():
 
 
 @auth.route('/register', methods=['GET', 'POST'])
+@query_budget(6)
 def register():
     form = RegistrationForm()
     if not form.validate_on_submit():
@@ -52,7 +59,12 @@ def register():
             password=form.password.data
         )
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.flush()
+        except IntegrityError as e:
+            db.session.rollback()
+            form.add_integrity_error(e)
+            return render_template('auth/register.html', form=form)
         token = user.generate_confirmation_token()
         send_email(
             user.email, 
@@ -61,11 +73,13 @@ def register():
             user=user,
             token=token
         )
+        db.session.commit()
         flash('A confirmation email has been sent to you by email.')
         return redirect(url_for('main.index'))
 
 
 @auth.route('/unconfirmed')
+@query_budget(3)
 def unconfirmed():
     if (current_user.is_anonymous) or (current_user.confirmed):
         return redirect(url_for('main.index'))
@@ -73,19 +87,23 @@ def unconfirmed():
 
 
 @auth.route('/confirm/<token>')
-@login_required
+@query_budget(4)
 def confirm(token):
-    if current_user.confirmed:
-        return redirect(url_for('main.index'))
-    elif current_user.confirm(token):
-        db.session.commit()
-        flash('You have confirmed your account. Thanks!')
-    else:
+    # The token identifies the account, so no session is needed, and
+    # repeated clicks on a link already used are answered from the cache.
+    user_id = User.verify_confirmation_token(token)
+    if user_id is None:
         flash('The confirmation link is invalid or has expired.')
+    elif not confirm_cache.get(token):
+        if User.confirm_id(user_id):
+            db.session.commit()
+            flash('You have confirmed your account. Thanks!')
+        confirm_cache.set(token, True)
     return redirect(url_for('main.index'))
 
 
 @auth.route('/confirm')
+@query_budget(4)
 @login_required
 def resend_confirmation():
     token = current_user.generate_confirmation_token()
@@ -96,11 +114,13 @@ def resend_confirmation():
         user=current_user,
         token=token
     )
+    db.session.commit()
     flash('A new confirmation email has been sent to you by email.')
     return redirect(url_for('main.index'))
 
 
 @auth.route('/logout')
+@query_budget(4)
 @login_required
 def logout():
     logout_user()
@@ -109,6 +129,7 @@ def logout():
 
 
 @auth.route('/change-password', methods=['GET', 'POST'])
+@query_budget(4)
 @login_required
 def change_password():
     form = ChangePasswordForm()
@@ -124,3 +145,11 @@ def change_password():
             db.session.commit()
             flash('Your password has been updated.')
             return redirect(url_for('main.index'))
+
+
+@auth.record_once
+def use_async_views(state):
+    if state.app.config['ASYNC_VIEWS']:
+        # Imported here, the asyncio stack is only loaded when enabled.
+        from app.auth import async_views
+        async_views.init_app(state.app)
@@ -0,0 +1,158 @@
+import csv
+import itertools
+import json
+import time
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from . import db, password_hasher
+from .models import User, default_role_id
+
+
+EXPORT_FIELDS = ('email', 'username', 'password_hash', 'confirmed', 'role_id')
+
+
+def read_users(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ['true', 'on', '1', 'yes']
+    return bool(value)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def clean(row):
+    """A row as read from either format, with empty strings (how CSV
+    writes NULL) as None. Raises ValueError for a row that cannot be
+    imported.
+    """
+    row = {key: (None if value == '' else value) for key, value in row.items()}
+    if row.get('email') is None and row.get('username') is None:
+        raise ValueError('neither an email nor a username')
+    if row.get('role_id') is not None:
+        row['role_id'] = int(row['role_id'])
+    return row
+
+
+def import_users(rows, batch_size=1000, progress=None, reject=None):
+    """Insert users in batches, skipping rows whose email or username is
+    already taken. Rows carry a ``password`` (hashed on the password
+    hashing pool), an exported ``password_hash`` or neither, like the
+    accounts the index page creates. Rows without a ``role_id`` get the
+    default role.
+
+    Rows that cannot be imported are counted as rejected and passed to
+    ``reject(row, reason)``, the rest of the batch is still imported.
+    """
+    stats = {'read': 0, 'imported': 0, 'skipped': 0, 'rejected': 0}
+    default_role = default_role_id()
+    start = time.perf_counter()
+
+    def rejected(row, reason):
+        stats['rejected'] += 1
+        if reject is not None:
+            reject(row, reason)
+
+    for batch in batched(rows, batch_size):
+        stats['read'] += len(batch)
+        valid = []
+        for row in batch:
+            try:
+                valid.append(clean(row))
+            except (ValueError, TypeError) as e:
+                rejected(row, str(e))
+        emails = {row['email'] for row in valid} - {None}
+        usernames = {row['username'] for row in valid} - {None}
+        taken = db.session.execute(
+            select(User.email, User.username).where(or_(
+                User.email.in_(emails), User.username.in_(usernames)
+            ))
+        ).all()
+        taken_emails = {email for email, _ in taken}
+        taken_usernames = {username for _, username in taken}
+
+        new = []
+        for row in valid:
+            if (
+                (row.get('email') in taken_emails)
+                or (row.get('username') in taken_usernames)
+            ):
+                stats['skipped'] += 1
+                continue
+            # NULL never collides with another NULL.
+            if row.get('email') is not None:
+                taken_emails.add(row['email'])
+            if row.get('username') is not None:
+                taken_usernames.add(row['username'])
+            new.append(row)
+
+        to_hash = [row for row in new
+                   if not row.get('password_hash') and row.get('password')]
+        hashes = password_hasher.hash_many(row['password'] for row in to_hash)
+        for row, password_hash in zip(to_hash, hashes):
+            row['password_hash'] = password_hash
+        values = [
+            {
+                'email': row.get('email'),
+                'username': row.get('username'),
+                'password_hash': row.get('password_hash'),
+                'confirmed': to_bool(row.get('confirmed') or False),
+                'role_id': row.get('role_id') or default_role,
+            }
+            for row in new
+        ]
+        if values:
+            try:
+                db.session.execute(insert(User), values)
+                db.session.commit()
+                stats['imported'] += len(values)
+            except IntegrityError:
+                # Find the offending rows one by one.
+                db.session.rollback()
+                for row, value in zip(new, values):
+                    try:
+                        with db.session.begin_nested():
+                            db.session.execute(insert(User), [value])
+                    except IntegrityError as e:
+                        rejected(row, str(e.orig))
+                    else:
+                        stats['imported'] += 1
+                db.session.commit()
+        if progress is not None:
+            progress(stats, time.perf_counter() - start)
+    return stats
+
+
+def export_users(stream, fmt, batch_size=1000):
+    query = (
+        select(*(getattr(User, field) for field in EXPORT_FIELDS))
+        .order_by(User.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(EXPORT_FIELDS)
+    count = 0
+    for row in db.session.execute(query):
+        if fmt == 'csv':
+            writer.writerow(row)
+        else:
+            stream.write(json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n')
+        count += 1
+    return count
@@ -0,0 +1,322 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache:
+    """Thread-safe in-process cache with a size bound and a per-entry TTL."""
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires <= self.clock():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = self.clock() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalRedis:
+    """In-process stand-in for the subset of the redis client used here.
+
+    Lets the shared backend run in development and tests without a server.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            item = self._data.get(name)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires <= time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        expires = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[name] = (value, expires)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(
+                self._data.pop(name, None) is not None for name in names
+            )
+
+    def scan_iter(self, match=None):
+        prefix = match[:-1] if match and match.endswith('*') else match
+        with self._lock:
+            keys = list(self._data)
+        return [
+            key for key in keys if prefix is None or key.startswith(prefix)
+        ]
+
+
+class RedisCache:
+    """Shared cache storing JSON values in redis (or a LocalRedis)."""
+
+    def __init__(self, client, prefix='flasky:', ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(f'{self.prefix}{key}')
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(
+            f'{self.prefix}{key}', json.dumps(value), ex=self.ttl or None
+        )
+
+    def delete(self, key):
+        self.client.delete(f'{self.prefix}{key}')
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f'{self.prefix}*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class FileSystemCache:
+    """Cache storing one JSON file per key, shareable between processes on
+    the same host.
+
+    Like cachelib's FileSystemCache, the number of entries is kept in a
+    count file, and a ``set`` that takes it past ``threshold`` prunes the
+    directory: the expired entries go first, then the oldest ones until it
+    is back under the threshold.
+    """
+
+    count_name = '__count'
+
+    def __init__(self, directory, ttl=300, threshold=1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.threshold = threshold
+        os.makedirs(directory, exist_ok=True)
+        if threshold and not os.path.exists(self._count_path):
+            self._write_count(len(self._entries()))
+
+    @property
+    def _count_path(self):
+        return os.path.join(self.directory, self.count_name)
+
+    def _path(self, key):
+        name = hashlib.sha1(str(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _read_count(self):
+        try:
+            with open(self._count_path) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _write_count(self, count):
+        self._write(self._count_path, count)
+
+    def _update_count(self, delta):
+        # Processes racing here can lose an update; the next prune() counts
+        # the directory again.
+        count = max(self._read_count() + delta, 0)
+        self._write_count(count)
+        return count
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if (entry.name.endswith('.tmp')
+                        or entry.name == self.count_name):
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        return entries
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if item['expires'] is not None and item['expires'] <= time.time():
+            self.delete(key)
+            return None
+        return item['value']
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        path = self._path(key)
+        new = not os.path.exists(path)
+        self._write(path, {'expires': expires, 'value': value})
+        if (new and self.threshold
+                and self._update_count(1) > self.threshold):
+            self.prune()
+
+    def prune(self):
+        entries = self._entries()
+        if len(entries) > self.threshold:
+            # Every entry expires ttl seconds after it was written.
+            expired = time.time() - self.ttl if self.ttl else None
+            entries.sort()
+            excess = len(entries) - self.threshold
+            for i, (mtime, path) in enumerate(entries):
+                if i >= excess and (expired is None or mtime > expired):
+                    entries = entries[i:]
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            else:
+                entries = []
+        self._write_count(len(entries))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            return
+        if self.threshold:
+            self._update_count(-1)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        if self.threshold:
+            self._write_count(0)
+
+
+def redis_client(url):
+    if url == 'memory://':
+        return LocalRedis()
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError(
+            'The redis package is required for the redis cache backend.'
+        )
+    return redis.Redis.from_url(url)
+
+
+def make_cache(config, prefix):
+    cache_type = config.get(f'{prefix}_TYPE', 'simple')
+    ttl = config.get(f'{prefix}_TTL', 300)
+    if cache_type == 'null':
+        return NullCache()
+    elif cache_type == 'simple':
+        return LRUCache(maxsize=config.get(f'{prefix}_SIZE', 1024), ttl=ttl)
+    elif cache_type == 'filesystem':
+        return FileSystemCache(config[f'{prefix}_DIR'], ttl=ttl,
+                               threshold=config.get(f'{prefix}_SIZE', 1024))
+    elif cache_type == 'redis':
+        return RedisCache(
+            redis_client(config.get(f'{prefix}_REDIS_URL', 'memory://')),
+            prefix=f'flasky:{prefix.lower()}:',
+            ttl=ttl
+        )
+    raise ValueError(f'Unknown {prefix}_TYPE: {cache_type!r}')
+
+
+class Cache:
+    """Flask extension wrapping a cache backend built from ``<PREFIX>_*``
+    configuration keys (``_TYPE``, ``_SIZE``, ``_TTL``, ``_REDIS_URL``,
+    ``_DIR``).
+    """
+
+    def __init__(self, prefix, app=None):
+        self.prefix = prefix
+        self.name = prefix.lower()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions[self.name] = make_cache(app.config, self.prefix)
+
+    @property
+    def backend(self):
+        return current_app.extensions[self.name]
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
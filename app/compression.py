@@ -0,0 +1,154 @@
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_options_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """WSGI middleware compressing responses with brotli or gzip, whichever
+    the client prefers.
+
+    Only responses with an allowed content type are compressed, and only
+    when they have no encoding yet and are at least ``min_size`` bytes.
+    Responses without a Content-Length are taken to be streamed: they are
+    compressed chunk by chunk, flushing after each chunk so that the client
+    receives data as soon as the application produces it.
+    """
+
+    def __init__(self, wsgi_app, level=6, brotli_quality=4, min_size=500,
+                 mimetypes=()):
+        self.wsgi_app = wsgi_app
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+        self.mimetypes = set(mimetypes)
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def negotiate(self, environ):
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        qualities = [(accepted[encoding], encoding)
+                     for encoding in self.encodings if accepted[encoding]]
+        if not qualities:
+            return None
+        # max() keeps the first of equal qualities, brotli when available.
+        return max(qualities, key=lambda item: item[0])[1]
+
+    def compressor(self, encoding):
+        if encoding == 'br':
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.level)
+
+    def compressible(self, status, headers):
+        mimetype = parse_options_header(headers.get('Content-Type', ''))[0]
+        return (
+            (mimetype in self.mimetypes)
+            and (int(status.split(None, 1)[0]) not in (204, 206, 304))
+            and ('Content-Encoding' not in headers)
+            and ('no-transform' not in headers.get('Cache-Control', ''))
+        )
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            encoding = None
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            headers = Headers(headers)
+            if self.compressible(status, headers):
+                vary = headers.get('Vary')
+                if not vary:
+                    headers['Vary'] = 'Accept-Encoding'
+                elif 'accept-encoding' not in vary.lower():
+                    headers['Vary'] = f'{vary}, Accept-Encoding'
+                length = headers.get('Content-Length', type=int)
+                if (
+                    (encoding is not None)
+                    and (length is None or length >= self.min_size)
+                ):
+                    state['compressor'] = self.compressor(encoding)
+                    state['streamed'] = length is None
+                    headers.remove('Content-Length')
+                    headers['Content-Encoding'] = encoding
+                    # A compressed body is only semantically equivalent to
+                    # the original, and weak validators still let the
+                    # application answer If-None-Match with 304.
+                    etag = headers.get('ETag')
+                    if etag and not etag.startswith('W/'):
+                        headers['ETag'] = f'W/{etag}'
+            write = start_response(status, headers.to_wsgi_list(), exc_info)
+            if 'compressor' not in state:
+                return write
+            return lambda data: write(state['compressor'].compress(data))
+
+        app_iter = self.wsgi_app(environ, compressing_start_response)
+        if 'compressor' not in state:
+            return app_iter
+        return self.compress(app_iter, state['compressor'], state['streamed'])
+
+    def compress(self, app_iter, compressor, streamed):
+        try:
+            for chunk in app_iter:
+                data = compressor.compress(chunk)
+                if streamed:
+                    data += compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+class Compress:
+    """Installs :class:`CompressionMiddleware` around the application,
+    configured from the ``COMPRESS_*`` settings.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['COMPRESS_ENABLED']:
+            return
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app,
+            level=app.config['COMPRESS_LEVEL'],
+            brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'],
+            min_size=app.config['COMPRESS_MIN_SIZE'],
+            mimetypes=app.config['COMPRESS_MIMETYPES']
+        )
@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from importlib import import_module
+
+import sqlalchemy as sa
+from flask import current_app
+from flask_sqlalchemy.session import Session
+
+
+class RoutingSession(Session):
+    """Session that sends queries made inside ``read_replica()`` to the
+    read replica, when one is configured. Flushes always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # A session bound to a connection, such as a test's outer
+        # transaction, uses it for everything.
+        if bind is None and isinstance(self.bind, sa.engine.Connection):
+            return self.bind
+        if bind is None and self.info.get('use_replica') and not self._flushing:
+            replica = current_app.extensions.get('replica_engine')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+@contextmanager
+def read_replica():
+    """Route the reads in the block (or decorated function) to the read
+    replica. Only use it for code that never reads its own writes.
+    """
+    info = current_app.extensions['sqlalchemy'].session().info
+    previous = info.get('use_replica', False)
+    info['use_replica'] = True
+    try:
+        yield
+    finally:
+        info['use_replica'] = previous
+
+
+def insert_ignore(session, model, values, index_elements):
+    """Insert a row unless one with the same ``index_elements`` (a unique
+    index) exists, in one statement where the database supports it.
+    Returns True if the row was inserted.
+    """
+    table = model.__table__
+    dialect = session.get_bind(model).dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = import_module(f'sqlalchemy.dialects.{dialect}').insert
+        statement = insert(table).values(values).on_conflict_do_nothing(
+            index_elements=index_elements
+        )
+    elif dialect in ('mysql', 'mariadb'):
+        statement = sa.insert(table).values(values).prefix_with('IGNORE')
+    else:
+        try:
+            with session.begin_nested():
+                session.execute(sa.insert(table).values(values))
+        except sa.exc.IntegrityError:
+            return False
+        return True
+    return session.execute(statement).rowcount == 1
+
+
+def prefix_filter(column, prefix):
+    """``column`` starts with ``prefix``, as a range the index on the column
+    can answer. LIKE 'prefix%' only uses an index under some collations.
+    """
+    # The smallest string after every string starting with the prefix.
+    stripped = prefix.rstrip(chr(0x10ffff))
+    if not stripped:
+        return column >= prefix
+    upper = stripped[:-1] + chr(ord(stripped[-1]) + 1)
+    return sa.and_(column >= prefix, column < upper)
+
+
+def is_memory_database(uri):
+    url = sa.engine.make_url(uri)
+    return (
+        url.get_backend_name() == 'sqlite'
+        and url.database in (None, '', ':memory:')
+    )
+
+
+def configure_database(app):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from the DATABASE_* settings."""
+    config = app.config
+    options = {
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+    }
+    if not is_memory_database(config['SQLALCHEMY_DATABASE_URI']):
+        options.update({
+            'pool_size': config['DATABASE_POOL_SIZE'],
+            'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+            'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        })
+    options = {key: value for key, value in options.items()
+               if value is not None}
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', options)
+
+
+def configure_engines(app, db):
+    """Create the replica engine and apply SQLITE_PRAGMAS on connect."""
+    with app.app_context():
+        engines = list(db.engines.values())
+    # The replica is not a Flask-SQLAlchemy bind: it has no tables of its
+    # own and must stay invisible to create_all() and migrations.
+    if app.config['DATABASE_REPLICA_URL']:
+        replica = sa.create_engine(
+            app.config['DATABASE_REPLICA_URL'],
+            **app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        )
+        app.extensions['replica_engine'] = replica
+        engines.append(replica)
+
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            set_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
+
+
+def engines(app):
+    """Every engine of the application, the read replica included. Needs
+    an application context.
+    """
+    engines = list(app.extensions['sqlalchemy'].engines.values())
+    if 'replica_engine' in app.extensions:
+        engines.append(app.extensions['replica_engine'])
+    return engines
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Apply ``pragmas`` to every new connection of a SQLite engine."""
+    if not pragmas:
+        return
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    sa.event.listen(engine, 'connect', on_connect)
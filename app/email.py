@@ -1,17 +1,200 @@
-from threading import Thread
+import atexit
+import os
+import queue
+import smtplib
+import threading
+import time
 
 from flask import current_app, render_template
 from flask_mail import Message
+from sqlalchemy.orm import Session
 
-from . import mail
+from . import db, mail
+from .metrics import metrics
+from .models import OutboxMessage
 
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+class MailQueueFull(Exception):
+    pass
 
 
-def send_email(to, subject, template, **kwargs):
+class _WorkerPool:
+    def __init__(self, app):
+        self.app = app
+        self.num_workers = app.config['MAIL_WORKERS']
+        self.enqueue_timeout = app.config['MAIL_ENQUEUE_TIMEOUT']
+        self.idle_timeout = app.config['MAIL_IDLE_TIMEOUT']
+        self.max_retries = app.config['MAIL_MAX_RETRIES']
+        self.retry_backoff = app.config['MAIL_RETRY_BACKOFF']
+        self.queue = queue.Queue(maxsize=app.config['MAIL_QUEUE_SIZE'])
+        self.workers = []
+        self.pid = None
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                # The threads do not survive a fork, a forked server worker
+                # starts its own, with a queue of its own.
+                self.pid = os.getpid()
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self.workers = []
+            if self.workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self.run, args=(self.queue,),
+                    name=f'mail-worker-{i}', daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+            atexit.register(self.shutdown)
+
+    def submit(self, msg):
+        self.start()
+        try:
+            self.queue.put(
+                (msg, time.monotonic()), timeout=self.enqueue_timeout
+            )
+        except queue.Full:
+            raise MailQueueFull(
+                f'Mail queue is full ({self.queue.maxsize} messages).'
+            )
+
+    def run(self, work_queue):
+        with self.app.app_context():
+            connection = None
+            while True:
+                try:
+                    item = work_queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    connection = self.disconnect(connection)
+                    continue
+                try:
+                    if item is None:
+                        self.disconnect(connection)
+                        return
+                    connection = self.deliver(connection, *item)
+                finally:
+                    work_queue.task_done()
+
+    def deliver(self, connection, msg, enqueued):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if isinstance(msg, TemplateMessage):
+                    msg.render()
+                if connection is None:
+                    connection = mail.connect().__enter__()
+                connection.send(msg)
+            except (smtplib.SMTPException, OSError):
+                connection = self.disconnect(connection)
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    self.app.logger.exception(
+                        'Failed to send mail to %s', ', '.join(msg.recipients)
+                    )
+                    return connection
+                self.retried += 1
+                time.sleep(self.retry_backoff * 2 ** attempt)
+            except Exception:
+                self.failed += 1
+                self.app.logger.exception(
+                    'Failed to send mail to %s', ', '.join(msg.recipients)
+                )
+                return connection
+            else:
+                latency = time.monotonic() - enqueued
+                self.sent += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                return connection
+
+    def disconnect(self, connection):
+        if connection is not None:
+            close_connection(connection)
+        return None
+
+    def join(self):
+        self.queue.join()
+
+    def shutdown(self, timeout=None):
+        with self.lock:
+            workers, self.workers = self.workers, []
+        for _ in workers:
+            self.queue.put(None)
+        for worker in workers:
+            worker.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'workers': len(self.workers),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+            'latency_max': self.latency_max,
+        }
+
+
+class MailDispatcher:
+    """Sends mail from a bounded queue drained by a pool of worker threads,
+    each of which keeps its SMTP connection open between messages.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['mail_dispatcher'] = _WorkerPool(app)
+
+    @property
+    def pool(self):
+        return current_app.extensions['mail_dispatcher']
+
+    def submit(self, msg):
+        self.pool.submit(msg)
+
+    def join(self):
+        self.pool.join()
+
+    def shutdown(self, timeout=None):
+        self.pool.shutdown(timeout)
+
+    def stats(self):
+        return self.pool.stats()
+
+
+dispatcher = MailDispatcher()
+
+
+class TemplateMessage(Message):
+    """A message rendered by the mail worker that sends it, so the request
+    queueing it does no rendering. The context is used from the worker's
+    thread and must hold plain values, not model instances.
+    """
+
+    def __init__(self, subject, template, context, **kwargs):
+        super().__init__(subject, **kwargs)
+        self.template = template
+        self.context = context
+
+    def render(self):
+        if self.template is not None:
+            self.body = render_template(self.template + '.txt', **self.context)
+            self.html = render_template(self.template + '.html',
+                                        **self.context)
+            self.template = None
+        return self
+
+
+def build_message(to, subject, template, **kwargs):
     app = current_app._get_current_object()
     msg = Message(
         app.config['MAIL_SUBJECT_PREFIX'] + subject,
@@ -20,6 +203,133 @@ def send_email(to, subject, template, **kwargs):
     )
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
+    return msg
+
+
+def send_email(to, subject, template, **kwargs):
+    dispatch(build_message(to, subject, template, **kwargs))
+
+
+def queue_email(to, subject, template, **kwargs):
+    """Like send_email(), but the templates are rendered by the mail worker
+    (or, with MAIL_OUTBOX, here). Only for templates that need no request,
+    with plain values in ``kwargs``.
+    """
+    app = current_app._get_current_object()
+    dispatch(TemplateMessage(
+        app.config['MAIL_SUBJECT_PREFIX'] + subject,
+        template,
+        kwargs,
+        sender=app.config['MAIL_SENDER'],
+        recipients=[to]
+    ))
+
+
+def dispatch(msg):
+    app = current_app._get_current_object()
+    with metrics.timer('mail_enqueue'):
+        if app.config['MAIL_OUTBOX']:
+            if isinstance(msg, TemplateMessage):
+                msg.render()
+            db.session.add(OutboxMessage.from_message(msg))
+        elif db.session().in_transaction():
+            db.session.info.setdefault('pending_mail', []).append(msg)
+        else:
+            dispatcher.submit(msg)
+
+
+# Mail sent while a transaction is open goes out only if that transaction
+# commits, the same guarantee the outbox gives through its table.
+@db.event.listens_for(db.session, 'after_commit')
+def submit_pending_mail(session):
+    pending = list(session.info.pop('pending_mail', ()))
+    while pending:
+        try:
+            dispatcher.submit(pending[0])
+        except MailQueueFull:
+            # The changes are committed, failing the request now would
+            # only lose the mail: keep it in the outbox instead.
+            current_app.logger.warning(
+                "Mail queue is full, %d message(s) moved to the outbox "
+                "for 'flask send-mail'", len(pending)
+            )
+            store_in_outbox(session, pending)
+            return
+        pending.pop(0)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_pending_mail(session):
+    session.info.pop('pending_mail', None)
+
+
+def store_in_outbox(session, messages):
+    """Add ``messages`` to the outbox in a transaction of their own, for
+    use once ``session`` has committed.
+    """
+    with Session(bind=session.get_bind(OutboxMessage)) as outbox_session:
+        for msg in messages:
+            if isinstance(msg, TemplateMessage):
+                msg.render()
+            outbox_session.add(OutboxMessage.from_message(msg))
+        outbox_session.commit()
+
+
+def drain_outbox(batch_size=100, max_attempts=5):
+    """Send up to ``batch_size`` queued outbox messages over a single SMTP
+    connection and return the number of messages sent.
+
+    Each message is claimed, sent and then deleted (or its failed attempt
+    recorded) in a transaction of its own, so a failure part way through
+    the batch never sends the earlier messages again.
+    """
+    sent = 0
+    last_id = 0
+    connection = None
+    try:
+        for _ in range(batch_size):
+            message = (
+                OutboxMessage.query
+                .filter(OutboxMessage.attempts < max_attempts,
+                        OutboxMessage.id > last_id)
+                .order_by(OutboxMessage.id)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if message is None:
+                break
+            last_id = message.id
+            if connection is None:
+                connection = mail.connect().__enter__()
+            try:
+                connection.send(message.to_message())
+            except smtplib.SMTPRecipientsRefused as e:
+                message.attempts += 1
+                message.last_error = str(e)
+                db.session.commit()
+            except (smtplib.SMTPException, OSError) as e:
+                # The connection is unusable, leave the rest of the batch
+                # for the next run.
+                message.attempts += 1
+                message.last_error = str(e)
+                db.session.commit()
+                break
+            else:
+                db.session.delete(message)
+                db.session.commit()
+                sent += 1
+    finally:
+        db.session.rollback()
+        if connection is not None:
+            close_connection(connection)
+    return sent
+
+
+def close_connection(connection):
+    # QUIT on a connection the server dropped raises, there is nothing
+    # left to close then.
+    try:
+        connection.__exit__(None, None, None)
+    except (smtplib.SMTPException, OSError):
+        if connection.host is not None:
+            connection.host.close()
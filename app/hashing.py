@@ -0,0 +1,106 @@
+import os
+import threading
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from .metrics import metrics
+
+
+class _HashPool:
+    def __init__(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.salt_length = app.config['PASSWORD_SALT_LENGTH']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.executor = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self._method_prefix = None
+
+    def get_executor(self):
+        # The pool belongs to the process that created it, a forked server
+        # worker starts its own on first use.
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                # Imported here, most processes never start a pool.
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self.pid = os.getpid()
+            return self.executor
+
+    def run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        return self.get_executor().submit(fn, *args).result()
+
+    def map(self, fn, *iterables, chunksize=1):
+        if not self.workers:
+            return map(fn, *iterables)
+        return self.get_executor().map(fn, *iterables, chunksize=chunksize)
+
+    @property
+    def method_prefix(self):
+        # Werkzeug fills in defaults (e.g. the iteration count), so compare
+        # against what it actually writes for the configured method.
+        if self._method_prefix is None:
+            self._method_prefix = generate_password_hash(
+                '', self.method, 1
+            ).split('$', 1)[0]
+        return self._method_prefix
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None and self.pid == os.getpid():
+                self.executor.shutdown()
+            self.executor = None
+
+
+class PasswordHasher:
+    """Hashes passwords with the method and cost configured in
+    ``PASSWORD_HASH_METHOD``, on a process pool of
+    ``PASSWORD_HASH_WORKERS`` processes (inline when 0).
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['password_hasher'] = _HashPool(app)
+
+    @property
+    def pool(self):
+        return current_app.extensions['password_hasher']
+
+    def hash(self, password):
+        pool = self.pool
+        with metrics.timer('password_hash', operation='hash'):
+            return pool.run(
+                generate_password_hash, password, pool.method,
+                pool.salt_length
+            )
+
+    def hash_many(self, passwords):
+        pool = self.pool
+        passwords = list(passwords)
+        return list(pool.map(
+            generate_password_hash,
+            passwords,
+            [pool.method] * len(passwords),
+            [pool.salt_length] * len(passwords),
+            chunksize=max(1, len(passwords) // (4 * (pool.workers or 1)))
+        ))
+
+    def verify(self, pwhash, password):
+        with metrics.timer('password_hash', operation='verify'):
+            return self.pool.run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.pool.method_prefix
+
+    def shutdown(self):
+        self.pool.shutdown()
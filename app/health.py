@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+
+import sqlalchemy as sa
+from flask import current_app, jsonify, request
+
+from .database import engines
+
+
+def warm_up(app):
+    """Pay the first-request costs of a worker up front: open the pool's
+    connections, compile every template, render the WARMUP_PATHS pages
+    and prime the in-process caches. Returns the seconds spent per step.
+    """
+    timings = {}
+
+    def step(name, fn):
+        start = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - start
+
+    with app.app_context():
+        step('database', lambda: open_connections(app))
+        step('caches', prime_caches)
+        step('templates', lambda: compile_templates(app))
+        step('pages', lambda: render_pages(app))
+    return timings
+
+
+def open_connections(app):
+    # Check out pool_size connections at once, so that the pool keeps
+    # that many open when they are returned.
+    for engine in engines(app):
+        size = getattr(engine.pool, 'size', lambda: 1)()
+        connections = []
+        try:
+            for _ in range(size):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(sa.text('SELECT 1'))
+        finally:
+            for connection in connections:
+                connection.close()
+
+
+def prime_caches():
+    from . import password_hasher
+    from .models import confirmation_serializer, role_table
+    role_table()
+    confirmation_serializer()
+    # Starts the hashing processes, when PASSWORD_HASH_WORKERS is set.
+    password_hasher.hash('warm-up')
+
+
+def compile_templates(app):
+    from .jinja import compile_templates
+    compile_templates(app)
+
+
+def render_pages(app):
+    # The pages are rendered through the views, hooks included, but the
+    # response is never processed: no session is saved for these requests.
+    for path in app.config['WARMUP_PATHS']:
+        with app.test_request_context(path,
+                                      environ_base={'flasky.warm_up': True}):
+            response = app.preprocess_request()
+            if response is None:
+                response = app.dispatch_request()
+            app.make_response(response)
+
+
+class _HealthState:
+    def __init__(self, app):
+        self.enabled = app.config['WARMUP_ENABLED']
+        self.lock = threading.RLock()
+        self.pid = None
+        self.thread = None
+        self.ready = False
+        self.error = None
+        self.timings = None
+
+    def reset(self):
+        # State from the master process does not carry over to a fork.
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = None
+                self.ready = not self.enabled
+                self.error = None
+                self.timings = None
+        return self
+
+    def start(self, app):
+        """Run the warm-up in a background thread, unless it is done or
+        already running in this process.
+        """
+        with self.lock:
+            self.reset()
+            if self.ready or (self.thread is not None
+                              and self.thread.is_alive()):
+                return
+            self.thread = threading.Thread(target=self.run, args=(app,),
+                                           name='warm-up', daemon=True)
+            self.thread.start()
+
+    def run(self, app):
+        try:
+            timings = warm_up(app)
+        except Exception as e:
+            # The next readiness check tries again.
+            app.logger.exception('Warm-up failed')
+            self.error = f'{type(e).__name__}: {e}'
+            return
+        self.timings = timings
+        self.error = None
+        self.ready = True
+        app.logger.info('Warm-up done in %.2fs',
+                        sum(timings.values()))
+
+    def wait(self, timeout=None):
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready
+
+
+class Health:
+    """Serves /healthz, which answers as long as the process does, and
+    /readyz, which answers 503 until the process is warmed up (see
+    :func:`warm_up`) and while the database is unreachable.
+
+    The warm-up starts in the background on the first request a process
+    gets, readiness probes included, so that a preloaded master hands
+    nothing half-initialised to its forked workers.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        state = app.extensions['health'] = _HealthState(app)
+        app.add_url_rule('/healthz', 'healthz', self.healthz)
+        app.add_url_rule('/readyz', 'readyz', self.readyz)
+        if state.enabled:
+            app.before_request(self.start_warm_up)
+
+    @property
+    def state(self):
+        return current_app.extensions['health'].reset()
+
+    def start_warm_up(self):
+        state = self.state
+        if not state.ready and 'flasky.warm_up' not in request.environ:
+            state.start(current_app._get_current_object())
+
+    def healthz(self):
+        return jsonify(status='ok')
+
+    def readyz(self):
+        state = self.state
+        if not state.ready:
+            return jsonify(status='warming up', error=state.error), 503
+        try:
+            for engine in engines(current_app):
+                with engine.connect() as connection:
+                    connection.execute(sa.text('SELECT 1'))
+        except sa.exc.SQLAlchemyError as e:
+            return jsonify(status='unavailable',
+                           error=f'{type(e).__name__}: {e}'), 503
+        return jsonify(status='ready', warm_up=state.timings)
+
+
+health = Health()
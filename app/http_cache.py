@@ -0,0 +1,102 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+from . import response_cache
+
+# Stands in for the CSRF token in cached bodies, each response gets the
+# token of its own session.
+CSRF_PLACEHOLDER = '__csrf_token__'
+
+
+def cacheable(response):
+    return (
+        (response.status_code in (200, 404, 500))
+        and (not response.direct_passthrough)
+        and ('Set-Cookie' not in response.headers)
+        and (not session.modified)
+    )
+
+
+def csrf_field_name():
+    return current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')
+
+
+def build_response(entry):
+    body, etag = entry['body'], entry['etag']
+    if entry.get('csrf'):
+        body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+        etag = hashlib.sha1(
+            f'{etag}:{session[csrf_field_name()]}'.encode('utf-8')
+        ).hexdigest()
+    response = current_app.response_class(
+        body, status=entry['status'], mimetype=entry['mimetype']
+    )
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(
+        entry['last_modified'], timezone.utc
+    )
+    # Browsers must revalidate, a cached anonymous page must not be shown
+    # again after logging in.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    if response.status_code == 200:
+        response.make_conditional(request)
+    return response
+
+
+def cached(key=None, vary=None):
+    """Cache the rendered response of an anonymous GET or HEAD request and
+    answer conditional requests for it with 304 Not Modified.
+
+    The cache key is the request URL, or ``key()`` when given, plus the
+    authentication state and any values returned by ``vary()``. Requests
+    from logged in users and requests with flashed messages waiting to be
+    shown always bypass the cache, as do responses that change the session.
+    A CSRF token in the page is not cached, every response is given the
+    token of the session it is sent to.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if (
+                (request.method not in ('GET', 'HEAD'))
+                or (current_user.is_authenticated)
+                or ('_flashes' in session)
+            ):
+                return f(*args, **kwargs)
+            parts = [
+                'anonymous',
+                key() if key is not None else request.full_path
+            ]
+            if vary is not None:
+                parts.extend(vary())
+            cache_key = ':'.join(str(part) for part in parts)
+            entry = response_cache.get(cache_key)
+            if entry is None:
+                response = make_response(f(*args, **kwargs))
+                if not cacheable(response):
+                    return response
+                body = response.get_data(as_text=True)
+                token = g.get(csrf_field_name())
+                csrf = token is not None and token in body
+                if csrf:
+                    body = body.replace(token, CSRF_PLACEHOLDER)
+                entry = {
+                    'body': body,
+                    'status': response.status_code,
+                    'mimetype': response.mimetype,
+                    'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+                    'last_modified': int(time.time()),
+                    'csrf': csrf,
+                }
+                response_cache.set(cache_key, entry)
+            return build_response(entry)
+        return decorated_function
+    return decorator
@@ -0,0 +1,58 @@
+import os
+
+from jinja2 import (BytecodeCache, FileSystemBytecodeCache,
+                    MemcachedBytecodeCache)
+
+from .cache import LRUCache, redis_client
+
+
+class MemoryBytecodeCache(BytecodeCache):
+    """Per-process bytecode cache. Shared between workers only when they
+    are forked from a master that compiled the templates beforehand.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.cache = LRUCache(maxsize=maxsize, ttl=None)
+
+    def load_bytecode(self, bucket):
+        code = self.cache.get(bucket.key)
+        if code is not None:
+            bucket.bytecode_from_string(code)
+
+    def dump_bytecode(self, bucket):
+        self.cache.set(bucket.key, bucket.bytecode_to_string())
+
+    def clear(self):
+        self.cache.clear()
+
+
+def make_bytecode_cache(config):
+    cache_type = config.get('TEMPLATE_CACHE_TYPE', 'filesystem')
+    if cache_type == 'null':
+        return None
+    elif cache_type == 'simple':
+        return MemoryBytecodeCache(config.get('TEMPLATE_CACHE_SIZE', 1024))
+    elif cache_type == 'filesystem':
+        directory = config['TEMPLATE_CACHE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        return FileSystemBytecodeCache(directory)
+    elif cache_type == 'redis':
+        return MemcachedBytecodeCache(
+            redis_client(config.get('TEMPLATE_CACHE_REDIS_URL', 'memory://')),
+            prefix='flasky:template_cache:'
+        )
+    raise ValueError(f'Unknown TEMPLATE_CACHE_TYPE: {cache_type!r}')
+
+
+def configure_templates(app):
+    app.jinja_env.bytecode_cache = make_bytecode_cache(app.config)
+
+
+def compile_templates(app, extensions=('html', 'txt')):
+    """Load every template the application can render, which stores its
+    bytecode in the cache. Returns the names of the compiled templates.
+    """
+    names = app.jinja_env.list_templates(extensions=extensions)
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
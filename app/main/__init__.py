@@ -4,3 +4,9 @@ from flask import Blueprint
 main = Blueprint('main', __name__)
 # Put imports after main to avoid circular import errors
 from . import views, errors
+from ..models import Permission
+
+
+@main.app_context_processor
+def inject_permissions():
+    return dict(Permission=Permission)
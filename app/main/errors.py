@@ -1,13 +1,16 @@
 from flask import render_template
 
+from app.http_cache import cached
 from app.main import main
 
 
 @main.errorhandler(404)
+@cached(key=lambda: 404)
 def page_not_found(e):
     return render_template('404.html'), 404
 
 
 @main.errorhandler(500)
+@cached(key=lambda: 500)
 def internal_server_error(e):
     return render_template('500.html'), 500
@@ -1,13 +1,23 @@
-from flask import current_app, session, redirect, render_template, url_for
+from flask import (current_app, jsonify, session, redirect, render_template,
+                   request, url_for)
+from flask_login import login_required
+from sqlalchemy import select
 
 from app import db
-from app.email import send_email
+from app.database import insert_ignore, prefix_filter, read_replica
+from app.decorators import permission_required
+from app.email import queue_email
+from app.http_cache import cached
 from app.main import main
 from app.main.forms import NameForm
-from app.models import User
+from app.models import Permission, Role, User, default_role_id, role_table
+from app.pagination import keyset_page
+from app.querybudget import query_budget
 
 
 @main.route('/', methods=['GET', 'POST'])
+@query_budget(5)
+@cached(vary=lambda: (session.get('known'),))
 def index():
     app = current_app._get_current_object()
     form = NameForm()
@@ -19,26 +29,123 @@ def index():
             known=session.get('known', False)
         )
     else:
-        user = User.query.filter_by(username=form.name.data).first()
-        if user is not None:
-            session['known'] = True
-        else:
-            user = User(username=form.name.data)
-            db.session.add(user)
-            db.session.commit()
-            session['known'] = False
-            if app.config['MAIL_RECIPIENT']:
-                send_email(
-                    to=app.config['MAIL_RECIPIENT'],
-                    subject='New User', 
-                    template='mail/new_user', 
-                    user=user
-                )
+        # One INSERT ... ON CONFLICT DO NOTHING both creates the user and
+        # tells whether the name was already known.
+        created = insert_ignore(
+            db.session, User,
+            {'username': form.name.data, 'role_id': default_role_id()},
+            ['username']
+        )
+        session['known'] = not created
+        if created and app.config['MAIL_RECIPIENT']:
+            queue_email(
+                to=app.config['MAIL_RECIPIENT'],
+                subject='New User',
+                template='mail/new_user',
+                user={'username': form.name.data}
+            )
+        db.session.commit()
         session['name'] = form.name.data
         form.name.data = ''
         return redirect(url_for('main.index'))
 
 
 @main.route('/user/<name>')
+@query_budget(4)
+@cached()
+@read_replica()
 def user(name):
     return render_template('user.html', name=name)
+
+
+def flag(value):
+    if value.lower() in ['true', 'on', '1']:
+        return True
+    if value.lower() in ['false', 'off', '0']:
+        return False
+    raise ValueError(value)
+
+
+def directory_page():
+    """The page of the user directory asked for by the query string, and
+    the filters to carry over to the neighbouring pages.
+    """
+    config = current_app.config
+    filters = {
+        'q': request.args.get('q', '').strip() or None,
+        'confirmed': request.args.get('confirmed', type=flag),
+        'role_id': request.args.get('role_id', type=int),
+    }
+    per_page = request.args.get('per_page', config['USERS_PER_PAGE'],
+                                type=int)
+    per_page = max(1, min(per_page, config['USERS_MAX_PER_PAGE']))
+    # The role names come with the page, in the same query.
+    statement = (
+        select(User.id, User.username, User.confirmed, User.role_id,
+               Role.name.label('role'))
+        .outerjoin(Role, User.role_id == Role.id)
+        .where(User.username.isnot(None))
+    )
+    if filters['q'] is not None:
+        statement = statement.where(prefix_filter(User.username, filters['q']))
+    if filters['confirmed'] is not None:
+        statement = statement.where(User.confirmed == filters['confirmed'])
+    if filters['role_id'] is not None:
+        statement = statement.where(User.role_id == filters['role_id'])
+    page = keyset_page(
+        db.session, statement, User.username,
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=per_page
+    )
+    filters = {name: value for name, value in filters.items()
+               if value is not None}
+    if per_page != config['USERS_PER_PAGE']:
+        filters['per_page'] = per_page
+    return page, filters
+
+
+def page_urls(endpoint, page, filters):
+    return (
+        url_for(endpoint, after=page.next_cursor, **filters)
+        if page.next_cursor is not None else None,
+        url_for(endpoint, before=page.prev_cursor, **filters)
+        if page.prev_cursor is not None else None,
+    )
+
+
+@main.route('/users')
+@query_budget(4)
+@login_required
+@permission_required(Permission.MODERATE)
+@read_replica()
+def users():
+    page, filters = directory_page()
+    next_url, prev_url = page_urls('main.users', page, filters)
+    return render_template('users.html', page=page, filters=filters,
+                           roles=role_table(), next_url=next_url,
+                           prev_url=prev_url)
+
+
+@main.route('/api/users')
+@query_budget(4)
+@login_required
+@permission_required(Permission.MODERATE)
+@read_replica()
+def users_api():
+    page, filters = directory_page()
+    next_url, prev_url = page_urls('main.users_api', page, filters)
+    return jsonify(
+        users=[
+            {
+                'id': row.id,
+                'username': row.username,
+                'confirmed': row.confirmed,
+                'role_id': row.role_id,
+                'role': row.role,
+                'url': url_for('main.user', name=row.username),
+            }
+            for row in page
+        ],
+        next=next_url,
+        prev=prev_url
+    )
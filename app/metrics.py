@@ -0,0 +1,338 @@
+import hmac
+import ipaddress
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import (
+    Response, abort, current_app, g, has_app_context, has_request_context,
+    request, before_render_template, template_rendered
+)
+
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0
+)
+# For counts, such as the SQL queries per request.
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}'
+        yield f'{name}_bucket{format_labels(labels, le="+Inf")} {self.count}'
+        yield f'{name}_sum{format_labels(labels)} {self.sum}'
+        yield f'{name}_count{format_labels(labels)} {self.count}'
+
+
+class Registry:
+    """Histograms and counters keyed by name and label set, rendered in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix='flasky_',
+                 named_buckets=None):
+        self.buckets = buckets
+        # Buckets for the histograms that do not measure seconds.
+        self.named_buckets = dict(named_buckets or {})
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(
+                    self.named_buckets.get(name, self.buckets)
+                )
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        lines = []
+        with self.lock:
+            seen = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                name = self.prefix + name
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# TYPE {name} histogram')
+                lines.extend(histogram.samples(name, labels))
+            for (name, labels), value in sorted(self.counters.items()):
+                name = self.prefix + name
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name}{format_labels(labels)} {value}')
+        for collector in self.collectors:
+            for name, kind, value in collector():
+                name = self.prefix + name
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class Sampler:
+    """Samples the stacks of the threads serving requests, for writing
+    folded-stack profiles (flamegraph.pl, speedscope) of slow requests.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self, thread_id):
+        with self.lock:
+            self.active[thread_id] = Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='metrics-sampler', daemon=True
+                )
+                self.thread.start()
+
+    def stop(self, thread_id):
+        with self.lock:
+            return self.active.pop(thread_id, None)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                active = dict(self.active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, stacks in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[self.fold(frame)] += 1
+
+    @staticmethod
+    def fold(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(
+                f'{code.co_name} ({os.path.basename(code.co_filename)}:'
+                f'{frame.f_lineno})'
+            )
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+
+class Metrics:
+    """Opt-in request instrumentation enabled by METRICS_ENABLED.
+
+    Records per-endpoint latency, SQL query count and time, template render
+    time and the timers used on hot paths, and serves them at /metrics.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['METRICS_ENABLED']:
+            app.extensions['metrics'] = None
+            return
+        registry = Registry(
+            named_buckets={'request_sql_queries': COUNT_BUCKETS}
+        )
+        app.extensions['metrics'] = registry
+        if app.config['METRICS_PROFILE']:
+            app.extensions['metrics_sampler'] = Sampler(
+                app.config['METRICS_PROFILE_INTERVAL']
+            )
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        before_render_template.connect(self.before_render, app)
+        template_rendered.connect(self.after_render, app)
+
+        with app.app_context():
+            engines = list(app.extensions['sqlalchemy'].engines.values())
+        if 'replica_engine' in app.extensions:
+            engines.append(app.extensions['replica_engine'])
+        for engine in engines:
+            sa.event.listen(engine, 'before_cursor_execute',
+                            self.before_cursor_execute)
+            sa.event.listen(engine, 'after_cursor_execute',
+                            self.after_cursor_execute)
+
+        if 'mail_dispatcher' in app.extensions:
+            pool = app.extensions['mail_dispatcher']
+            registry.collectors.append(lambda: [
+                ('mail_queue_depth', 'gauge', pool.queue.qsize()),
+                ('mail_sent_total', 'counter', pool.sent),
+                ('mail_failed_total', 'counter', pool.failed),
+                ('mail_retried_total', 'counter', pool.retried),
+            ])
+
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    @property
+    def registry(self):
+        if not has_app_context():
+            return None
+        return current_app.extensions.get('metrics')
+
+    @contextmanager
+    def timer(self, name, **labels):
+        registry = self.registry
+        if registry is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            registry.observe(f'{name}_seconds', time.perf_counter() - start,
+                             **labels)
+
+    def scrape_allowed(self):
+        """Whether the client may read /metrics: it connects from one of
+        METRICS_ALLOWED_IPS or sends METRICS_TOKEN as a bearer token.
+        """
+        config = current_app.config
+        token = config['METRICS_TOKEN']
+        if token and hmac.compare_digest(
+            request.headers.get('Authorization', '').encode(),
+            f'Bearer {token}'.encode()
+        ):
+            return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr)
+        except ValueError:
+            return False
+        return any(
+            address in ipaddress.ip_network(network, strict=False)
+            for network in config['METRICS_ALLOWED_IPS']
+        )
+
+    def view(self):
+        if not self.scrape_allowed():
+            abort(403)
+        return Response(
+            self.registry.render(),
+            mimetype='text/plain; version=0.0.4'
+        )
+
+    def before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+        sampler = current_app.extensions.get('metrics_sampler')
+        if sampler is not None:
+            sampler.start(threading.get_ident())
+
+    def after_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        registry = self.registry
+        endpoint = request.endpoint or 'none'
+        registry.observe('request_duration_seconds', elapsed,
+                         endpoint=endpoint, method=request.method)
+        registry.inc('requests_total', endpoint=endpoint,
+                     status=response.status_code)
+        registry.observe('request_sql_queries', g.sql_queries,
+                         endpoint=endpoint)
+        registry.observe('request_sql_seconds', g.sql_seconds,
+                         endpoint=endpoint)
+        sampler = current_app.extensions.get('metrics_sampler')
+        if sampler is not None:
+            stacks = sampler.stop(threading.get_ident())
+            if stacks is not None and elapsed >= current_app.config[
+                    'METRICS_PROFILE_THRESHOLD']:
+                self.write_profile(endpoint, elapsed, stacks)
+        return response
+
+    def teardown_request(self, exc):
+        sampler = current_app.extensions.get('metrics_sampler')
+        if sampler is not None:
+            sampler.stop(threading.get_ident())
+
+    def write_profile(self, endpoint, elapsed, stacks):
+        directory = current_app.config['METRICS_PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory,
+            f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-'
+            f'{int(elapsed * 1000)}ms.folded'
+        )
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        current_app.logger.warning(
+            'Slow request to %s took %.3fs, profile written to %s',
+            endpoint, elapsed, path
+        )
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_seconds += elapsed
+        registry = self.registry
+        if registry is not None:
+            registry.observe('sql_query_seconds', elapsed)
+
+    def before_render(self, app, template, context, **extra):
+        g.setdefault('template_starts', []).append(time.perf_counter())
+
+    def after_render(self, app, template, context, **extra):
+        starts = g.get('template_starts')
+        if starts:
+            self.registry.observe(
+                'template_render_seconds',
+                time.perf_counter() - starts.pop(),
+                template=template.name
+            )
+
+
+metrics = Metrics()
@@ -1,20 +1,79 @@
-from flask import current_app
-from flask_login import UserMixin
+import time
+from datetime import datetime
+
+from flask import current_app, g
+from flask_login import AnonymousUserMixin, UserMixin
+from flask_mail import Message
+from itsdangerous import BadSignature
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import select, update
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db, login_manager, password_hasher, role_cache, user_cache
 
-from . import db, login_manager
+
+class Permission:
+    FOLLOW = 1
+    COMMENT = 2
+    WRITE = 4
+    MODERATE = 8
+    ADMIN = 16
 
 
 class Role(db.Model):
     __tablename__ = 'roles'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), unique=True)
+    default = db.Column(db.Boolean, default=False, index=True)
+    permissions = db.Column(db.Integer)
     users = db.relationship('User', backref='role', lazy='dynamic')
 
+    roles = {
+        'User': [Permission.FOLLOW, Permission.COMMENT, Permission.WRITE],
+        'Moderator': [Permission.FOLLOW, Permission.COMMENT,
+                      Permission.WRITE, Permission.MODERATE],
+        'Administrator': [Permission.FOLLOW, Permission.COMMENT,
+                          Permission.WRITE, Permission.MODERATE,
+                          Permission.ADMIN],
+    }
+    default_role = 'User'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.permissions is None:
+            self.permissions = 0
+
     def __repr__(self):
         return f"<Role '{self.name}'>"
 
+    @staticmethod
+    def insert_roles():
+        """Create or update the roles in ``Role.roles``."""
+        for name, permissions in Role.roles.items():
+            role = Role.query.filter_by(name=name).first()
+            if role is None:
+                role = Role(name=name)
+            role.reset_permissions()
+            for permission in permissions:
+                role.add_permission(permission)
+            role.default = (name == Role.default_role)
+            db.session.add(role)
+        db.session.commit()
+
+    def add_permission(self, permission):
+        if not self.has_permission(permission):
+            self.permissions += permission
+
+    def remove_permission(self, permission):
+        if self.has_permission(permission):
+            self.permissions -= permission
+
+    def reset_permissions(self):
+        self.permissions = 0
+
+    def has_permission(self, permission):
+        return self.permissions & permission == permission
+
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -25,6 +84,11 @@ class User(UserMixin, db.Model):
     confirmed = db.Column(db.Boolean, default=False)
     role_id = db.Column(db.Integer, db.ForeignKey('roles.id'))
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if 'role' not in kwargs and 'role_id' not in kwargs:
+            self.role_id = default_role_id()
+
     def __repr__(self):
         return f"<User '{self.username}'>"
 
@@ -34,29 +98,238 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Accounts created without a password (by the index page or an
+        # import) cannot log in.
+        if self.password_hash is None:
+            return False
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        if self.password_hash is None:
+            return False
+        return password_hasher.needs_rehash(self.password_hash)
 
     def generate_confirmation_token(self, expiration=3600):
-        s = Serializer(current_app.config['SECRET_KEY'], expires_in=expiration)
+        s = confirmation_serializer(expiration)
         return s.dumps({'confirm': self.id}).decode('utf-8')
 
-    def confirm(self, token):
-        s = Serializer(current_app.config['SECRET_KEY'])
+    @staticmethod
+    def verify_confirmation_token(token):
+        """Return the id of the user a confirmation token was issued to,
+        or None if it is invalid or expired. Needs no database access.
+        """
         try:
-            data = s.loads(token.encode('utf-8'))
-        except:
-            return False
-        if data.get('confirm') != self.id:
+            data = confirmation_serializer().loads(token.encode('utf-8'))
+        except BadSignature:
+            return None
+        if not isinstance(data, dict):
+            return None
+        return data.get('confirm')
+
+    def confirm(self, token):
+        if User.verify_confirmation_token(token) != self.id:
             return False
         else:
             self.confirmed = True
             db.session.add(self)
             return True
 
+    @staticmethod
+    def confirm_id(user_id):
+        """Confirm an account with a single UPDATE. Returns False if it
+        was already confirmed or does not exist.
+        """
+        result = db.session.execute(
+            update(User)
+            .where(User.id == user_id, User.confirmed.isnot(True))
+            .values(confirmed=True)
+        )
+        # Bulk updates skip the mapper events that drop cached users.
+        invalidate_user(db.session(), user_id)
+        return result.rowcount == 1
+
+    def can(self, permission):
+        # Resolved from the cached role table, loading self.role would
+        # cost a query.
+        role = role_table().get(str(self.role_id))
+        return (
+            (role is not None)
+            and (role['permissions'] & permission == permission)
+        )
+
+    def is_administrator(self):
+        return self.can(Permission.ADMIN)
+
+    def to_cache(self):
+        return {
+            column.key: getattr(self, column.key)
+            for column in self.__table__.columns
+        }
+
+    @staticmethod
+    def from_cache(data):
+        user = User(**data)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+class AnonymousUser(AnonymousUserMixin):
+    def can(self, permission):
+        return False
+
+    def is_administrator(self):
+        return False
+
+
+login_manager.anonymous_user = AnonymousUser
+
+
+def role_table():
+    """All roles as ``{str(id): {'name', 'permissions', 'default'}}``,
+    loaded with one query and kept in ``ROLE_CACHE``.
+    """
+    roles = role_cache.get('roles')
+    if roles is None:
+        rows = db.session.execute(
+            select(Role.id, Role.name, Role.permissions, Role.default)
+        )
+        # String keys, so that the JSON cache backends round-trip them.
+        roles = {
+            str(id): {'name': name, 'permissions': permissions or 0,
+                      'default': bool(default)}
+            for id, name, permissions, default in rows
+        }
+        role_cache.set('roles', roles)
+    return roles
+
+
+def default_role_id():
+    for id, role in role_table().items():
+        if role['default']:
+            return int(id)
+    return None
+
+
+class ConfirmationSerializer(Serializer):
+    """Token serializer reading the time from ``app.extensions['clock']``
+    when set, so tests can move it instead of sleeping.
+    """
+
+    def now(self):
+        return int(current_app.extensions.get('clock', time.time)())
+
+
+def confirmation_serializer(expiration=3600):
+    # Built once per app and expiration, instead of on every call.
+    serializers = current_app.extensions.setdefault(
+        'confirmation_serializers', {}
+    )
+    s = serializers.get(expiration)
+    if s is None:
+        s = serializers[expiration] = ConfirmationSerializer(
+            current_app.config['SECRET_KEY'], expires_in=expiration
+        )
+    return s
+
+
+def invalidate_user(session, user_id):
+    # Drop the entry at flush time and again once the transaction commits,
+    # so a concurrent cache miss can't re-store the pre-commit row.
+    user_cache.delete(user_id)
+    if session is not None:
+        session.info.setdefault('invalidated_users', set()).add(user_id)
+
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    invalidate_user(db.object_session(target), target.id)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_committed_users(session):
+    for user_id in session.info.pop('invalidated_users', ()):
+        user_cache.delete(user_id)
+
+
+# Same two-step invalidation as for users. Other processes using the
+# 'simple' backend see role changes once ROLE_CACHE_TTL runs out.
+@db.event.listens_for(Role, 'after_insert')
+@db.event.listens_for(Role, 'after_update')
+@db.event.listens_for(Role, 'after_delete')
+def invalidate_role_table(mapper, connection, target):
+    role_cache.delete('roles')
+    session = db.object_session(target)
+    if session is not None:
+        session.info['roles_changed'] = True
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_committed_roles(session):
+    if session.info.pop('roles_changed', False):
+        role_cache.delete('roles')
+
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255))
+    sender = db.Column(db.String(255))
+    recipients = db.Column(db.Text)
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<OutboxMessage {self.id} to '{self.recipients}'>"
+
+    @staticmethod
+    def from_message(msg):
+        return OutboxMessage(
+            subject=msg.subject,
+            sender=msg.sender,
+            recipients=','.join(msg.recipients),
+            body=msg.body,
+            html=msg.html
+        )
+
+    def to_message(self):
+        return Message(
+            self.subject,
+            sender=self.sender,
+            recipients=self.recipients.split(','),
+            body=self.body,
+            html=self.html
+        )
+
+
+class StoredSession(db.Model):
+    __tablename__ = 'sessions'
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<StoredSession {self.id[:8]}>"
+
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Loaded ahead of time by app.aio.preload_user for the async views.
+    user = g.pop('preloaded_user', None)
+    if user is not None and user.id == int(user_id):
+        return user
+    data = user_cache.get(int(user_id))
+    if data is not None:
+        return User.from_cache(data)
+    # From the primary: a lagging replica would put a stale row (an old
+    # role, a confirmation not yet replicated) in the cache for its timeout.
+    user = User.query.get(int(user_id))
+    if user is not None:
+        user_cache.set(user.id, user.to_cache())
+    return user
@@ -0,0 +1,47 @@
+class KeysetPage:
+    """A page of rows in the order of a unique column, with the values
+    of that column to pass as ``after`` or ``before`` for the next and the
+    previous pages (None when there is none).
+    """
+
+    def __init__(self, items, key, has_next, has_prev):
+        self.items = items
+        self.next_cursor = key(items[-1]) if items and has_next else None
+        self.prev_cursor = key(items[0]) if items and has_prev else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_page(session, statement, column, after=None, before=None,
+                per_page=50):
+    """Run ``statement`` for the ``per_page`` rows that follow ``after`` or
+    precede ``before`` in the order of ``column``, which must be unique.
+
+    Unlike OFFSET, the database seeks straight to the page in the index on
+    ``column``, so every page costs the same however deep it is. One query
+    per page: the extra row fetched tells whether there is another page.
+    """
+    if before is not None:
+        rows = session.execute(
+            statement.where(column < before)
+            .order_by(column.desc()).limit(per_page + 1)
+        ).all()
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        # The page was reached from the one after it.
+        has_next = True
+    else:
+        if after is not None:
+            statement = statement.where(column > after)
+        rows = session.execute(
+            statement.order_by(column).limit(per_page + 1)
+        ).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = after is not None
+    return KeysetPage(rows, lambda row: getattr(row, column.key), has_next,
+                      has_prev)
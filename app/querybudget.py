@@ -0,0 +1,193 @@
+import os
+import random
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+from flask import current_app, g, request
+
+
+# Transaction control is not counted against a budget.
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_recorders = ContextVar('query_recorders', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def project_frames(stack):
+    """The frames of a stack that are in this project's own code."""
+    return [
+        frame for frame in stack
+        if frame.filename.startswith(PROJECT_ROOT)
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+
+
+class QueryRecorder:
+    """Records the statements run by every engine while started, in the
+    current thread (or coroutine, and the ones it runs).
+    """
+
+    def __init__(self, stacks=False):
+        self.statements = []
+        self.stacks = [] if stacks else None
+
+    def __len__(self):
+        return len(self.statements)
+
+    def start(self):
+        return _recorders.set(_recorders.get() + (self,))
+
+    def stop(self, token):
+        _recorders.reset(token)
+
+    def record(self, statement):
+        self.statements.append(statement)
+        if self.stacks is not None:
+            self.stacks.append(project_frames(traceback.extract_stack()))
+
+    def repeated(self):
+        """``{statement: count}`` for the statements run more than once."""
+        return {statement: count
+                for statement, count in Counter(self.statements).items()
+                if count > 1}
+
+
+@sa.event.listens_for(sa.engine.Engine, 'before_cursor_execute')
+def record_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    recorders = _recorders.get()
+    if recorders and not statement.lstrip().upper().startswith(
+            TRANSACTION_CONTROL):
+        for recorder in recorders:
+            recorder.record(statement)
+
+
+class QueryBudget:
+    """At most ``max_queries`` statements, none of them run more than
+    ``max_repeats`` times (an N+1 query runs the same statement once per
+    row).
+
+    Decorating a view declares its budget, checked for the whole request
+    by :class:`QueryBudgets`. Used as a context manager, the block raises
+    :class:`QueryBudgetExceeded` when it goes over.
+    """
+
+    def __init__(self, max_queries, max_repeats=1):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+
+    def __call__(self, f):
+        f.query_budget = self
+        return f
+
+    def __enter__(self):
+        self.recorder = QueryRecorder(stacks=True)
+        self.token = self.recorder.start()
+        return self.recorder
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.recorder.stop(self.token)
+        if exc_type is None:
+            self.check(self.recorder, 'block')
+
+    def violations(self, recorder):
+        problems = []
+        if len(recorder) > self.max_queries:
+            problems.append(f'{len(recorder)} queries, the budget is '
+                            f'{self.max_queries}')
+        for statement, count in recorder.repeated().items():
+            if count > self.max_repeats:
+                problems.append(
+                    f'{count} runs of: {" ".join(statement.split())}'
+                )
+        return problems
+
+    def report(self, recorder, problems, name):
+        lines = [f'Query budget exceeded in {name}: ' + '; '.join(problems)]
+        for i, statement in enumerate(recorder.statements, 1):
+            lines.append(f'  {i}. {" ".join(statement.split())}')
+            if recorder.stacks is not None:
+                lines.extend(
+                    '    ' + line.rstrip().replace('\n', '\n    ')
+                    for line in traceback.format_list(recorder.stacks[i - 1])
+                )
+        return '\n'.join(lines)
+
+    def check(self, recorder, name):
+        problems = self.violations(recorder)
+        if problems:
+            raise QueryBudgetExceeded(self.report(recorder, problems, name))
+
+
+def query_budget(max_queries, max_repeats=1):
+    return QueryBudget(max_queries, max_repeats)
+
+
+class QueryBudgets:
+    """Checks the budgets declared with :func:`query_budget` on the views,
+    over the whole request including the hooks.
+
+    ``QUERY_BUDGET_MODE`` 'raise' fails the request with
+    :class:`QueryBudgetExceeded`; 'log' checks a ``QUERY_BUDGET_SAMPLE_RATE``
+    fraction of the requests and logs violations with the stack that ran
+    each statement; 'off' disables the checks.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        mode = app.config['QUERY_BUDGET_MODE']
+        if mode == 'off':
+            return
+        if mode not in ('raise', 'log'):
+            raise ValueError(f'Unknown QUERY_BUDGET_MODE: {mode!r}')
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.stop)
+
+    def start(self):
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if budget is None:
+            return
+        if random.random() >= current_app.config['QUERY_BUDGET_SAMPLE_RATE']:
+            return
+        recorder = QueryRecorder(stacks=True)
+        g.query_budget = (budget, recorder, recorder.start())
+
+    def finish(self, response):
+        if 'query_budget' not in g:
+            return response
+        budget, recorder, token = g.pop('query_budget')
+        recorder.stop(token)
+        problems = budget.violations(recorder)
+        if not problems:
+            return response
+        registry = current_app.extensions.get('metrics')
+        if registry is not None:
+            registry.inc('query_budget_exceeded_total',
+                         endpoint=request.endpoint)
+        message = budget.report(recorder, problems, request.endpoint)
+        if current_app.config['QUERY_BUDGET_MODE'] == 'raise':
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+        return response
+
+    def stop(self, exc):
+        # The request failed before after_request ran.
+        if 'query_budget' in g:
+            budget, recorder, token = g.pop('query_budget')
+            recorder.stop(token)
+
+
+budgets = QueryBudgets()
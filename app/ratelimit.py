@@ -0,0 +1,204 @@
+import re
+import time
+
+from flask import current_app, request, session
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from .cache import redis_client
+
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    """Parse ``'<count>/<period>'``, e.g. ``'5/minute'`` or ``'100/2 hour'``,
+    into ``(count, seconds)``.
+    """
+    match = re.fullmatch(
+        r'\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*', rate
+    )
+    if match is None:
+        raise ValueError(f'Invalid rate limit: {rate!r}')
+    count, multiplier, period = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[period]
+
+
+class MemoryBackend:
+    """In-process token buckets, stored as the time at which each bucket
+    will be full again (the generic cell rate algorithm).
+
+    Every bucket is a single float replaced with one dict assignment, so no
+    lock is taken. Concurrent hits on the same bucket may both be allowed
+    when they race, which is fine for throttling.
+    """
+
+    def __init__(self, clock=time.monotonic, prune_every=10000):
+        self.clock = clock
+        self.prune_every = prune_every
+        self.buckets = {}
+        self.hits = 0
+
+    def hit(self, key, count, period):
+        now = self.clock()
+        interval = period / count
+        tat = max(self.buckets.get(key, now), now)
+        retry_after = tat - (period - interval) - now
+        if retry_after > 0:
+            return False, retry_after
+        self.buckets[key] = tat + interval
+        self.hits += 1
+        if self.hits % self.prune_every == 0:
+            self.prune(now)
+        return True, 0
+
+    def prune(self, now):
+        for key, tat in list(self.buckets.items()):
+            if tat <= now:
+                self.buckets.pop(key, None)
+
+    def reset(self):
+        self.buckets.clear()
+
+
+class RedisBackend:
+    """Token buckets shared by all processes, updated atomically by a Lua
+    script running the same algorithm as :class:`MemoryBackend`.
+    """
+
+    script = """
+        local now = tonumber(ARGV[1])
+        local interval = tonumber(ARGV[2])
+        local period = tonumber(ARGV[3])
+        local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+        local retry_after = tat - (period - interval) - now
+        if retry_after > 0 then
+            return {0, tostring(retry_after)}
+        end
+        tat = tat + interval
+        redis.call('SET', KEYS[1], tostring(tat), 'PX',
+                   math.ceil((tat - now) * 1000))
+        return {1, '0'}
+    """
+
+    def __init__(self, client, prefix='flasky:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._hit = client.register_script(self.script)
+
+    def hit(self, key, count, period):
+        allowed, retry_after = self._hit(
+            keys=[f'{self.prefix}{key}'],
+            args=[time.time(), period / count, period]
+        )
+        return bool(allowed), float(retry_after)
+
+    def reset(self):
+        keys = list(self.client.scan_iter(match=f'{self.prefix}*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def make_backend(config):
+    storage = config.get('RATELIMIT_STORAGE', 'memory')
+    if storage == 'memory':
+        return MemoryBackend()
+    elif storage == 'redis':
+        url = config['RATELIMIT_REDIS_URL']
+        if url == 'memory://':
+            raise ValueError('The redis rate limit backend needs a server.')
+        return RedisBackend(redis_client(url))
+    raise ValueError(f'Unknown RATELIMIT_STORAGE: {storage!r}')
+
+
+def client_ip():
+    # The peer address, or the client address set by the proxies in front
+    # of the application when RATELIMIT_TRUSTED_PROXIES is set.
+    return request.remote_addr or 'unknown'
+
+
+def account():
+    """The account a request acts on: the logged in user, else the email
+    submitted to the login form. Read straight from the session and the
+    request body, without loading the user.
+    """
+    user_id = session.get('_user_id')
+    if user_id is not None:
+        return f'user:{user_id}'
+    email = request.form.get('email', '').strip().lower()
+    return f'email:{email}' if email else None
+
+
+class RateLimiter:
+    """Token bucket limits per client IP and per account, configured for
+    each endpoint in ``RATELIMITS``.
+
+    Limits are checked in a ``before_request`` hook, so rejected requests
+    get a 429 before the view runs its form validation or any query. The
+    IP limit is checked first: a client over it is turned away before its
+    session is loaded or its form is parsed to find the account.
+
+    Behind proxies, set ``RATELIMIT_TRUSTED_PROXIES`` to how many of them
+    append to X-Forwarded-For, otherwise every client shares the proxy's
+    address. The header is ignored when it is 0, since clients can forge it.
+    """
+
+    keys = {'ip': client_ip, 'account': account}
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        proxies = app.config.get('RATELIMIT_TRUSTED_PROXIES', 0)
+        if proxies:
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies,
+                                    x_proto=proxies)
+        if not app.config['RATELIMIT_ENABLED']:
+            return
+        rules = {}
+        for endpoint, rule in app.config['RATELIMITS'].items():
+            methods = {m.upper() for m in rule.get('methods', ())}
+            # In the order of self.keys: the cheap IP key comes first.
+            limits = [(scope, *parse_rate(rule[scope]))
+                      for scope in self.keys if scope in rule]
+            rules[endpoint] = (methods, limits)
+        app.extensions['ratelimit'] = {
+            'backend': make_backend(app.config),
+            'rules': rules,
+        }
+        app.before_request(self.check)
+
+    @property
+    def backend(self):
+        return current_app.extensions['ratelimit']['backend']
+
+    def check(self):
+        rule = current_app.extensions['ratelimit']['rules'].get(
+            request.endpoint
+        )
+        if rule is None:
+            return
+        methods, limits = rule
+        if methods and request.method not in methods:
+            return
+        for scope, count, period in limits:
+            # Each key is only computed once the limits before it passed.
+            key = self.keys[scope]()
+            if key is None:
+                continue
+            allowed, retry_after = self.backend.hit(
+                f'{request.endpoint}:{scope}:{key}', count, period
+            )
+            if not allowed:
+                registry = current_app.extensions.get('metrics')
+                if registry is not None:
+                    registry.inc('ratelimit_rejected_total',
+                                 endpoint=request.endpoint, scope=scope)
+                raise TooManyRequests(retry_after=int(retry_after) + 1)
+
+    def reset(self):
+        self.backend.reset()
+
+
+limiter = RateLimiter()
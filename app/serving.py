@@ -0,0 +1,54 @@
+"""Process lifecycle for the preforking production server, called from the
+hooks in gunicorn.conf.py.
+
+The master imports the application once (``preload_app``) and prepares it
+so that the forked workers share as much of its memory as possible. Every
+worker then drops the database connections it inherited and warms up
+before it accepts requests.
+"""
+import gc
+
+from .database import engines
+
+
+def prepare_master(app):
+    """Compile the templates and close the connections opened while
+    loading the application, then freeze the collector's view of the
+    loaded objects: a collection in a worker would otherwise write to
+    every page it shares with the master.
+    """
+    from .jinja import compile_templates
+    with app.app_context():
+        compile_templates(app)
+        for engine in engines(app):
+            engine.dispose()
+    gc.freeze()
+
+
+def after_fork(app):
+    """Forget the connections inherited from the master. They are not
+    closed: the sockets still belong to the master too.
+    """
+    with app.app_context():
+        for engine in engines(app):
+            engine.dispose(close=False)
+
+
+def warm_worker(app, timeout=None):
+    """Run the warm-up of app/health.py before the worker takes traffic.
+    Returns whether the worker is ready.
+    """
+    state = app.extensions['health'].reset()
+    state.start(app)
+    return state.wait(timeout)
+
+
+def stop_worker(app, timeout=None):
+    """Send the queued mail and stop the helper processes and threads."""
+    from . import password_hasher
+    from .email import dispatcher
+    with app.app_context():
+        dispatcher.shutdown(timeout)
+        password_hasher.shutdown()
+        if 'async_db' in app.extensions:
+            app.extensions['async_db'].shutdown()
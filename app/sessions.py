@@ -0,0 +1,238 @@
+import secrets
+from datetime import datetime
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete, insert, select, update
+
+from . import db
+from .cache import LRUCache
+from .models import StoredSession
+
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSideSession(SessionMixin):
+    """Session whose data lives in a store, keyed by the id in the cookie.
+
+    The data is only fetched the first time the session is used, so
+    requests that never touch it do not reach the store.
+    """
+
+    def __init__(self, sid=None, load=None):
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self._load = load
+        self._data = {} if sid is None else None
+        self.user_id = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._load(self.sid)
+            if self._data is None:
+                # Unknown or expired id, start over with a fresh one.
+                self.sid = None
+                self.new = True
+                self._data = {}
+            self.user_id = self._data.get('_user_id')
+        return self._data
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return self.data[key]
+
+    def __contains__(self, key):
+        # Flask-Login checks for '_remember' after every request, but only
+        # ever sets it and pops it within the same request, so a stored
+        # session never has it and the check need not load the session.
+        if key == '_remember' and not self.loaded:
+            return False
+        self.accessed = True
+        return key in self.data
+
+    def __setitem__(self, key, value):
+        self.accessed = True
+        self.modified = True
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        self.accessed = True
+        self.modified = True
+        del self.data[key]
+
+    def __iter__(self):
+        self.accessed = True
+        return iter(self.data)
+
+    def __len__(self):
+        self.accessed = True
+        return len(self.data)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.sid!r}>'
+
+
+class MemorySessionStore:
+    """Sessions kept in process, for single node deployments. The least
+    recently used sessions are dropped once ``maxsize`` is reached.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.sessions = LRUCache(maxsize=maxsize, ttl=None)
+
+    def load(self, sid):
+        item = self.sessions.get(sid)
+        if item is None:
+            return None
+        data, expires = item
+        if expires <= datetime.utcnow():
+            self.sessions.delete(sid)
+            return None
+        return serializer.loads(data)
+
+    def save(self, sid, data, expires, new):
+        self.sessions.set(sid, (serializer.dumps(data), expires))
+
+    def delete(self, sid):
+        self.sessions.delete(sid)
+
+    def cleanup(self, batch_size=1000):
+        # Expired sessions are dropped when read or evicted by the LRU.
+        return 0
+
+
+class SQLAlchemySessionStore:
+    """Sessions stored in the ``sessions`` table.
+
+    Uses its own short transactions on the engine, so saving the session
+    never commits or rolls back work pending in ``db.session``.
+    """
+
+    def load(self, sid):
+        with db.engine.connect() as connection:
+            data = connection.execute(
+                select(StoredSession.data).where(
+                    StoredSession.id == sid,
+                    StoredSession.expires > datetime.utcnow()
+                )
+            ).scalar()
+        return serializer.loads(data) if data is not None else None
+
+    def save(self, sid, data, expires, new):
+        values = {'data': serializer.dumps(data), 'expires': expires}
+        with db.engine.begin() as connection:
+            if not new:
+                result = connection.execute(
+                    update(StoredSession)
+                    .where(StoredSession.id == sid)
+                    .values(**values)
+                )
+                if result.rowcount:
+                    return
+            connection.execute(insert(StoredSession).values(id=sid, **values))
+
+    def delete(self, sid):
+        with db.engine.begin() as connection:
+            connection.execute(
+                delete(StoredSession).where(StoredSession.id == sid)
+            )
+
+    def cleanup(self, batch_size=1000):
+        """Delete expired sessions ``batch_size`` rows per transaction, so
+        that locks are held briefly. Returns the number of rows deleted.
+        """
+        deleted = 0
+        while True:
+            with db.engine.begin() as connection:
+                ids = connection.execute(
+                    select(StoredSession.id)
+                    .where(StoredSession.expires <= datetime.utcnow())
+                    .limit(batch_size)
+                ).scalars().all()
+                if ids:
+                    connection.execute(
+                        delete(StoredSession)
+                        .where(StoredSession.id.in_(ids))
+                    )
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                return deleted
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps only a random session id in the cookie. The store is written,
+    and the cookie set, only when the session was modified.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSideSession()
+        return ServerSideSession(sid, self.store.load)
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.modified:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=secure, samesite=samesite,
+                                       httponly=httponly)
+            return
+
+        # A new id whenever the logged in user changes, so that an id
+        # planted before login cannot be used afterwards.
+        if session.sid is not None and (
+            session.get('_user_id') != session.user_id
+        ):
+            self.store.delete(session.sid)
+            session.sid = None
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(
+            session.sid, dict(session),
+            datetime.utcnow() + app.permanent_session_lifetime, new
+        )
+        response.set_cookie(name, session.sid,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=httponly, domain=domain, path=path,
+                            secure=secure, samesite=samesite)
+
+
+def make_session_store(config):
+    session_type = config.get('SESSION_TYPE', 'cookie')
+    if session_type == 'memory':
+        return MemorySessionStore(config.get('SESSION_MEMORY_SIZE', 10000))
+    elif session_type == 'sqlalchemy':
+        return SQLAlchemySessionStore()
+    raise ValueError(f'Unknown SESSION_TYPE: {session_type!r}')
+
+
+def configure_sessions(app):
+    if app.config['SESSION_TYPE'] == 'cookie':
+        return
+    app.session_interface = ServerSideSessionInterface(
+        make_session_store(app.config)
+    )
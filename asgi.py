@@ -0,0 +1,11 @@
+"""ASGI entry point, e.g. ``uvicorn asgi:application``.
+
+Needs asgiref. The WSGI application runs on the server's thread pool and,
+with ASYNC_VIEWS, hands its coroutine views to the event loop in app/aio.py.
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from flasky import app
+
+
+application = WsgiToAsgi(app)
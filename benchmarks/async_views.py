@@ -0,0 +1,55 @@
+"""Sync against async views benchmark.
+
+Runs the endpoints that ASYNC_VIEWS turns into coroutines with the sync and
+the async views, at the same concurrency levels:
+
+    python -m benchmarks.async_views
+    python -m benchmarks.async_views -c 1 -c 16 -n 500
+
+Needs aiosqlite. The test client calls the application in-process, so this
+measures the views and the event loop hand-off, not an ASGI server.
+"""
+import argparse
+
+from . import endpoints
+
+
+ENDPOINTS = ['register', 'resend']
+MODES = {'sync': 'benchmark', 'async': 'benchmark-async'}
+
+
+def run(requests, levels, users, names):
+    rows = []
+    for concurrency in levels:
+        for mode, config_name in MODES.items():
+            results = endpoints.run(requests, concurrency, users, names,
+                                    config_name)
+            for name, result in results['results'].items():
+                rows.append(dict(result, endpoint=name, mode=mode))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--concurrency', action='append',
+                        dest='levels', type=int,
+                        help='concurrent clients (repeatable)')
+    parser.add_argument('-n', '--requests', type=int, default=200,
+                        help='requests per endpoint')
+    parser.add_argument('--users', type=int, default=1000,
+                        help='accounts seeded into the benchmark database')
+    parser.add_argument('-e', '--endpoint', action='append', dest='names',
+                        choices=ENDPOINTS, help='endpoint (repeatable)')
+    args = parser.parse_args(argv)
+    rows = run(args.requests, args.levels or [1, 8, 32], args.users,
+               args.names or ENDPOINTS)
+    print(f'{"endpoint":<12}{"mode":<8}{"clients":>8}{"req/s":>10}'
+          f'{"p50 ms":>10}{"p99 ms":>10}')
+    for row in rows:
+        print(f'{row["endpoint"]:<12}{row["mode"]:<8}{row["concurrency"]:>8}'
+              f'{row["rps"]:>10.1f}{row["p50_ms"]:>10.2f}'
+              f'{row["p99_ms"]:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
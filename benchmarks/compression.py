@@ -0,0 +1,84 @@
+"""Response compression benchmark.
+
+Renders the main pages once, then reports the compressed size and the CPU
+time per response for each encoding and level the middleware can use:
+
+    python -m benchmarks.compression
+    python -m benchmarks.compression -l 1 -l 6 -l 9 -n 200
+"""
+import argparse
+import time
+
+from app import create_app
+from app.compression import BrotliCompressor, GzipCompressor, brotli
+
+from .endpoints import seed
+
+
+PAGES = ['/', '/auth/login', '/auth/register', '/user/user0']
+
+
+def render(pages):
+    app = create_app('benchmark')
+    seed(app, 10)
+    client = app.test_client()
+    bodies = {}
+    for page in pages:
+        response = client.get(page)
+        assert 'Content-Encoding' not in response.headers
+        bodies[page] = response.get_data()
+    return bodies
+
+
+def measure(body, make_compressor, count):
+    start = time.process_time()
+    for _ in range(count):
+        compressor = make_compressor()
+        compressed = compressor.compress(body) + compressor.finish()
+    return len(compressed), (time.process_time() - start) / count
+
+
+def run(pages, levels, count):
+    codecs = [(f'gzip-{level}', lambda level=level: GzipCompressor(level))
+              for level in levels]
+    if brotli is not None:
+        codecs += [(f'br-{quality}',
+                    lambda quality=quality: BrotliCompressor(quality))
+                   for quality in levels if quality <= 11]
+    results = []
+    for page, body in render(pages).items():
+        for codec, make_compressor in codecs:
+            size, cpu = measure(body, make_compressor, count)
+            results.append({
+                'page': page,
+                'codec': codec,
+                'original': len(body),
+                'compressed': size,
+                'cpu_ms': cpu * 1000,
+            })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-p', '--page', action='append', dest='pages',
+                        help='page to compress (repeatable)')
+    parser.add_argument('-l', '--level', action='append', dest='levels',
+                        type=int, help='compression level (repeatable)')
+    parser.add_argument('-n', '--count', type=int, default=100,
+                        help='compressions per measurement')
+    args = parser.parse_args(argv)
+    results = run(args.pages or PAGES, args.levels or [1, 4, 6, 9],
+                  args.count)
+    if brotli is None:
+        print('brotli is not installed, reporting gzip only.\n')
+    print(f'{"page":<18}{"codec":<10}{"bytes":>8}{"saved":>10}{"cpu ms":>10}')
+    for result in results:
+        saved = 1 - result['compressed'] / result['original']
+        print(f'{result["page"]:<18}{result["codec"]:<10}'
+              f'{result["compressed"]:>8}{saved:>10.1%}'
+              f'{result["cpu_ms"]:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
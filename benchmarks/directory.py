@@ -0,0 +1,99 @@
+"""User directory benchmark: keyset pagination against OFFSET.
+
+Seeds the benchmark database with ``--users`` accounts and times the
+directory's page query at increasing depths, fetching the page after a
+cursor and skipping rows with OFFSET:
+
+    python -m benchmarks.directory
+    python -m benchmarks.directory --users 500000 -d 0 -d 250000
+"""
+import argparse
+import time
+
+from sqlalchemy import select
+
+from app import create_app, db
+from app.models import Role, User
+from app.pagination import keyset_page
+
+
+def seed(users, batch_size=10000):
+    db.drop_all()
+    db.create_all()
+    Role.insert_roles()
+    db.session.commit()
+    for start in range(0, users, batch_size):
+        db.session.execute(User.__table__.insert(), [
+            {
+                'email': f'user{i}@example.com',
+                'username': f'user{i:07d}',
+                'confirmed': i % 3 != 0,
+                'role_id': 1,
+            }
+            for i in range(start, min(start + batch_size, users))
+        ])
+    db.session.commit()
+
+
+def statement():
+    return (
+        select(User.id, User.username, User.confirmed, User.role_id,
+               Role.name.label('role'))
+        .outerjoin(Role, User.role_id == Role.id)
+        .where(User.username.isnot(None))
+    )
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def run(users, depths, per_page, repeat):
+    app = create_app('benchmark')
+    rows = []
+    with app.app_context():
+        seed(users)
+        for depth in depths:
+            depth = min(depth, users - per_page)
+            # The cursor a client would hold after paging down to ``depth``.
+            cursor = db.session.scalar(
+                select(User.username).order_by(User.username)
+                .offset(depth - 1).limit(1)
+            ) if depth else None
+            offset = best(lambda: db.session.execute(
+                statement().order_by(User.username).offset(depth)
+                .limit(per_page + 1)
+            ).all(), repeat)
+            keyset = best(lambda: keyset_page(
+                db.session, statement(), User.username, after=cursor,
+                per_page=per_page
+            ), repeat)
+            rows.append((depth, offset, keyset))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200000,
+                        help='accounts seeded into the benchmark database')
+    parser.add_argument('-d', '--depth', action='append', dest='depths',
+                        type=int, help='rows before the page (repeatable)')
+    parser.add_argument('--per-page', type=int, default=50,
+                        help='rows per page')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='runs per query, the fastest is reported')
+    args = parser.parse_args(argv)
+    depths = args.depths or [0, 1000, 10000, 100000, args.users]
+    rows = run(args.users, depths, args.per_page, args.repeat)
+    print(f'{"depth":>10}{"OFFSET ms":>12}{"keyset ms":>12}')
+    for depth, offset, keyset in rows:
+        print(f'{depth:>10}{offset:>12.2f}{keyset:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Throughput and latency benchmarks for the main and auth endpoints.
+
+Runs the Flask test client against a freshly seeded SQLite database and
+reports requests per second and p50/p99 latency per endpoint. Normally run
+through ``flask bench``.
+"""
+import itertools
+import json
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app, db, password_hasher
+from app.models import User
+
+
+PASSWORD = 'password'
+
+
+def seed(app, users):
+    """Recreate the benchmark database with ``users`` confirmed accounts
+    plus one unconfirmed account used by the confirmation scenario.
+    """
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password_hash = password_hasher.hash(PASSWORD)
+        db.session.execute(User.__table__.insert(), [
+            {
+                'email': f'user{i}@example.com',
+                'username': f'user{i}',
+                'password_hash': password_hash,
+                'confirmed': True
+            }
+            for i in range(users)
+        ])
+        pending = User(email='pending@example.com', username='pending',
+                       confirmed=False)
+        pending.password_hash = password_hash
+        db.session.add(pending)
+        db.session.commit()
+        return pending.generate_confirmation_token()
+
+
+class Scenarios:
+    """Request factories, one per benchmarked endpoint. Each takes a
+    thread-local test client and the request number.
+    """
+
+    def __init__(self, users, token):
+        self.users = users
+        self.token = token
+        self.registrations = itertools.count()
+
+    def index(self, client, i):
+        return client.get('/')
+
+    def login(self, client, i):
+        return client.post('/auth/login', data={
+            'email': f'user{i % self.users}@example.com',
+            'password': PASSWORD
+        })
+
+    def register(self, client, i):
+        n = next(self.registrations)
+        return client.post('/auth/register', data={
+            'email': f'new{n}@example.com',
+            'username': f'new{n}',
+            'password': PASSWORD,
+            'password2': PASSWORD
+        })
+
+    def confirm(self, client, i):
+        # The first request confirms the account, the rest measure the
+        # repeated clicks that mail clients produce.
+        return client.get(f'/auth/confirm/{self.token}')
+
+    def user(self, client, i):
+        return client.get(f'/user/user{i % self.users}')
+
+    def resend(self, client, i):
+        # Each client logs in as the unconfirmed account once.
+        if not getattr(client, 'logged_in', False):
+            client.post('/auth/login', data={
+                'email': 'pending@example.com', 'password': PASSWORD
+            })
+            client.logged_in = True
+        return client.get('/auth/confirm')
+
+    paths = {
+        'index': '/',
+        'login': '/auth/login',
+        'register': '/auth/register',
+        'confirm': '/auth/confirm/<token>',
+        'user': '/user/<name>',
+        'resend': '/auth/confirm',
+    }
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def measure(app, scenario, requests, concurrency):
+    local = threading.local()
+
+    def call(i):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = scenario(client, i)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 500:
+            raise RuntimeError(f'{response.status} from benchmark request')
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = list(executor.map(call, range(requests)))
+    wall = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'rps': requests / wall,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run(requests=200, concurrency=1, users=1000, endpoints=None,
+        config_name='benchmark'):
+    app = create_app(config_name)
+    token = seed(app, users)
+    scenarios = Scenarios(users, token)
+    results = {}
+    for name in endpoints or Scenarios.paths:
+        scenario = getattr(scenarios, name)
+        # Warm up templates, caches and pooled connections first.
+        measure(app, scenario, min(requests, 10), 1)
+        results[name] = dict(
+            path=Scenarios.paths[name],
+            **measure(app, scenario, requests, concurrency)
+        )
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'users': users,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=0.1):
+    """Return ``(name, metric, baseline, current, change)`` rows and whether
+    any metric regressed by more than ``tolerance``.
+    """
+    rows = []
+    regressed = False
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name)
+        if (
+            (previous is None)
+            or (previous['concurrency'] != result['concurrency'])
+        ):
+            continue
+        for metric, higher_is_better in (('rps', True), ('p50_ms', False),
+                                         ('p99_ms', False)):
+            change = (result[metric] - previous[metric]) / previous[metric]
+            worse = -change if higher_is_better else change
+            regressed = regressed or worse > tolerance
+            rows.append((name, metric, previous[metric], result[metric],
+                         change))
+    return rows, regressed
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
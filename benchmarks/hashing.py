@@ -0,0 +1,90 @@
+"""Password hashing micro-benchmark.
+
+Reports hashes per second for each hashing method and cost setting, inline
+and on a process pool the way the application runs them:
+
+    python -m benchmarks.hashing
+    python -m benchmarks.hashing -m pbkdf2:sha256:600000 -w 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+
+DEFAULT_METHODS = [
+    'pbkdf2:sha256:100000',
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha512:260000',
+    'scrypt:32768:8:1',
+]
+
+
+def supported(method):
+    try:
+        generate_password_hash('', method)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+def hashes_per_second(method, count, executor=None):
+    passwords = [f'password{i}' for i in range(count)]
+    start = time.perf_counter()
+    if executor is None:
+        for password in passwords:
+            generate_password_hash(password, method)
+    else:
+        list(executor.map(
+            generate_password_hash, passwords, [method] * count
+        ))
+    return count / (time.perf_counter() - start)
+
+
+def run(methods, count, workers):
+    results = []
+    executor = ProcessPoolExecutor(workers) if workers else None
+    try:
+        for method in methods:
+            if not supported(method):
+                results.append({'method': method, 'supported': False})
+                continue
+            result = {
+                'method': method,
+                'supported': True,
+                'inline': hashes_per_second(method, count)
+            }
+            if executor is not None:
+                hashes_per_second(method, workers, executor)  # warm up
+                result['pool'] = hashes_per_second(method, count, executor)
+            results.append(result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-m', '--method', action='append', dest='methods',
+                        help='werkzeug hash method (repeatable)')
+    parser.add_argument('-n', '--count', type=int, default=20,
+                        help='hashes per measurement')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='process pool size, 0 to skip the pool')
+    args = parser.parse_args(argv)
+    results = run(args.methods or DEFAULT_METHODS, args.count, args.workers)
+    print(f'{"method":<24}{"inline/s":>12}{"pool/s":>12}')
+    for result in results:
+        if not result['supported']:
+            print(f'{result["method"]:<24}{"unsupported":>12}')
+            continue
+        pool = f'{result["pool"]:.1f}' if 'pool' in result else '-'
+        print(f'{result["method"]:<24}{result["inline"]:>12.1f}{pool:>12}')
+
+
+if __name__ == '__main__':
+    main()
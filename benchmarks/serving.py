@@ -0,0 +1,198 @@
+"""Worker layout benchmark for the production server.
+
+Starts gunicorn with gunicorn.conf.py for each ``WORKERSxTHREADS`` layout,
+with and without preloading, against the seeded benchmark database. Drives
+it over HTTP and reports the throughput, the latency and the memory of the
+master and of each worker:
+
+    python -m benchmarks.serving
+    python -m benchmarks.serving -l 1x8 -l 2x4 -l 4x2 -l 8x1 -d 20
+
+Needs gunicorn and Linux (memory is read from /proc). PSS splits the pages
+shared between processes evenly among them, USS only counts the pages a
+process does not share: preloaded workers should have a smaller USS.
+"""
+import argparse
+import http.client
+import itertools
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from app import create_app
+
+from . import endpoints
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory(pid):
+    """``(rss, pss, uss)`` of a process in MiB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return (fields['Rss'], fields['Pss'],
+            fields['Private_Clean'] + fields['Private_Dirty'])
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+class Server:
+    def __init__(self, workers, threads, preload, env):
+        self.workers = workers
+        self.port = free_port()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            env=dict(env, WEB_BIND=f'127.0.0.1:{self.port}',
+                     WEB_WORKERS=str(workers), WEB_THREADS=str(threads),
+                     WEB_PRELOAD=str(preload).lower())
+        )
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if len(children(self.process.pid)) == self.workers:
+                try:
+                    connection = http.client.HTTPConnection(
+                        '127.0.0.1', self.port, timeout=5
+                    )
+                    connection.request('GET', '/readyz')
+                    if connection.getresponse().status == 200:
+                        return
+                except OSError:
+                    pass
+            time.sleep(0.1)
+        raise RuntimeError('The server did not become ready.')
+
+    def memory(self):
+        workers = [memory(pid) for pid in children(self.process.pid)]
+        return memory(self.process.pid), workers
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        self.process.wait(30)
+
+
+def drive(port, paths, duration, concurrency):
+    """Request ``paths`` in turn from ``concurrency`` keep-alive clients
+    for ``duration`` seconds. Returns the latencies.
+    """
+    latencies = []
+    errors = []
+    counter = itertools.count()
+    deadline = time.monotonic() + duration
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port,
+                                                timeout=30)
+        while time.monotonic() < deadline:
+            path = paths[next(counter) % len(paths)]
+            start = time.perf_counter()
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            if response.status >= 500:
+                errors.append(f'{response.status} from {path}')
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise RuntimeError(errors[0])
+    return latencies
+
+
+def run(layouts, preloads, duration, concurrency, users):
+    env = dict(os.environ, FLASK_CONFIG='benchmark',
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'bench'))
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    endpoints.seed(create_app('benchmark'), users)
+    paths = ['/', '/auth/login'] + [f'/user/user{i}' for i in range(users)]
+    rows = []
+    for (workers, threads), preload in itertools.product(layouts, preloads):
+        server = Server(workers, threads, preload, env)
+        try:
+            server.wait_ready()
+            drive(server.port, paths, min(duration, 2), concurrency)
+            start = time.perf_counter()
+            latencies = drive(server.port, paths, duration, concurrency)
+            wall = time.perf_counter() - start
+            master, worker_memory = server.memory()
+        finally:
+            server.stop()
+        rows.append({
+            'layout': f'{workers}x{threads}',
+            'preload': preload,
+            'rps': len(latencies) / wall,
+            'p50_ms': endpoints.percentile(latencies, 0.50) * 1000,
+            'p99_ms': endpoints.percentile(latencies, 0.99) * 1000,
+            'master_pss': master[1],
+            'worker_pss': sum(m[1] for m in worker_memory) / workers,
+            'worker_uss': sum(m[2] for m in worker_memory) / workers,
+            'total_pss': master[1] + sum(m[1] for m in worker_memory),
+        })
+    return rows
+
+
+def layout(value):
+    workers, _, threads = value.partition('x')
+    return int(workers), int(threads or 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-l', '--layout', action='append', dest='layouts',
+                        type=layout,
+                        help='WORKERSxTHREADS to run (repeatable)')
+    parser.add_argument('-d', '--duration', type=float, default=10,
+                        help='seconds of load per layout')
+    parser.add_argument('-c', '--concurrency', type=int, default=16,
+                        help='concurrent keep-alive clients')
+    parser.add_argument('--users', type=int, default=1000,
+                        help='accounts seeded into the benchmark database')
+    parser.add_argument('--no-preload-comparison', action='store_true',
+                        help='only run the preloaded layouts')
+    args = parser.parse_args(argv)
+    cpus = os.cpu_count() or 1
+    layouts = args.layouts or sorted({
+        (1, 8), (cpus, 4), (cpus + 1, 4), (2 * cpus + 1, 1), (2 * cpus, 2)
+    })
+    preloads = [True] if args.no_preload_comparison else [True, False]
+    rows = run(layouts, preloads, args.duration, args.concurrency,
+               args.users)
+    print(f'{"layout":<8}{"preload":<9}{"req/s":>9}{"p50 ms":>9}'
+          f'{"p99 ms":>9}{"master":>9}{"PSS/w":>9}{"USS/w":>9}'
+          f'{"total":>9}')
+    for row in rows:
+        print(f'{row["layout"]:<8}{str(row["preload"]).lower():<9}'
+              f'{row["rps"]:>9.1f}{row["p50_ms"]:>9.2f}{row["p99_ms"]:>9.2f}'
+              f'{row["master_pss"]:>9.1f}{row["worker_pss"]:>9.1f}'
+              f'{row["worker_uss"]:>9.1f}{row["total_pss"]:>9.1f}')
+    print('Memory in MiB: PSS of the master, PSS and USS per worker, '
+          'PSS of the whole server.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Cold start benchmark.
+
+Starts a fresh interpreter for each scenario under ``python -X importtime``
+and reports the wall time, the total import time and the most expensive
+top-level imports, compared with the committed baseline report:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup -s flasky --save-baseline
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'importtime-baseline.txt')
+
+SCENARIOS = {
+    # What a web worker pays when it imports the application module.
+    'flasky': 'import flasky',
+    'web': 'from app import create_app; create_app("production")',
+    'minimal': 'from app import create_app; '
+               'create_app("production", profile="minimal")',
+}
+
+
+def parse(report):
+    """Return ``(self_us, cumulative_us, depth, module)`` per import."""
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((int(own), int(cumulative), depth, name.strip()))
+    return imports
+
+
+def run(code):
+    env = dict(os.environ, SECRET_KEY=os.environ.get('SECRET_KEY', 'bench'))
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        env=env, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - start, result.stderr
+
+
+def measure(code, repeat):
+    """Return the fastest of ``repeat`` runs as ``(wall, report)``."""
+    return min((run(code) for _ in range(repeat)), key=lambda r: r[0])
+
+
+def top_level(imports, count):
+    first = [i for i in imports if i[2] == 1]
+    return sorted(first, key=lambda i: i[1], reverse=True)[:count]
+
+
+def total(imports):
+    return sum(i[0] for i in imports) / 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--scenario', action='append',
+                        dest='scenarios', choices=SCENARIOS,
+                        help='scenario to run (repeatable)')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='runs per scenario, the fastest is reported')
+    parser.add_argument('-t', '--top', type=int, default=10,
+                        help='top-level imports to list')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help=f'store the first scenario\'s report as '
+                             f'{os.path.relpath(BASELINE)}')
+    args = parser.parse_args(argv)
+    scenarios = args.scenarios or list(SCENARIOS)
+    baseline = None
+    if os.path.exists(BASELINE) and not args.save_baseline:
+        with open(BASELINE) as f:
+            baseline = parse(f.read())
+
+    for i, name in enumerate(scenarios):
+        wall, report = measure(SCENARIOS[name], args.repeat)
+        imports = parse(report)
+        print(f'{name}: {wall * 1000:.0f} ms wall, '
+              f'{total(imports):.0f} ms importing {len(imports)} modules')
+        for own, cumulative, depth, module in top_level(imports, args.top):
+            print(f'    {module:<32}{cumulative / 1000:>8.1f} ms')
+        if i == 0 and args.save_baseline:
+            with open(BASELINE, 'w') as f:
+                f.write(report)
+            print(f'    baseline saved to {os.path.relpath(BASELINE)}')
+    if baseline is not None:
+        print(f'\nbaseline ({os.path.relpath(BASELINE)}): '
+              f'{total(baseline):.0f} ms importing {len(baseline)} modules')
+        for own, cumulative, depth, module in top_level(baseline, args.top):
+            print(f'    {module:<32}{cumulative / 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,9 @@ import os
 
 
 basedir = os.path.abspath(os.path.dirname(__file__))
+cpus = os.cpu_count() or 1
+# Server worker processes, the default of gunicorn.conf.py.
+web_workers = int(os.environ.get('WEB_WORKERS', cpus + 1))
 
 
 class Config:
@@ -19,8 +22,196 @@ class Config:
     MAIL_SUBJECT_PREFIX = '[Flasky]'
     MAIL_SENDER = f'Flasky Admin <{os.environ.get("MAIL_USERNAME")}>'
     MAIL_RECIPIENT = os.environ.get('MAIL_RECIPIENT')
+    MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS', '2'))
+    MAIL_QUEUE_SIZE = int(os.environ.get('MAIL_QUEUE_SIZE', '1000'))
+    MAIL_ENQUEUE_TIMEOUT = float(os.environ.get('MAIL_ENQUEUE_TIMEOUT', '5'))
+    MAIL_IDLE_TIMEOUT = float(os.environ.get('MAIL_IDLE_TIMEOUT', '30'))
+    MAIL_MAX_RETRIES = int(os.environ.get('MAIL_MAX_RETRIES', '3'))
+    MAIL_RETRY_BACKOFF = float(os.environ.get('MAIL_RETRY_BACKOFF', '1'))
+    # Store outgoing mail in the outbox table, sent by 'flask send-mail'.
+    MAIL_OUTBOX = (
+        os.environ.get('MAIL_OUTBOX', 'false').lower()
+        in ['true', 'on', '1']
+    )
+    MAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE', '100'))
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(
+        os.environ.get('MAIL_OUTBOX_MAX_ATTEMPTS', '5')
+    )
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool sizing is left to SQLAlchemy when None. An optional read replica
+    # serves the read-only paths wrapped in app.database.read_replica().
+    DATABASE_POOL_SIZE = None
+    DATABASE_MAX_OVERFLOW = None
+    DATABASE_POOL_TIMEOUT = None
+    DATABASE_POOL_RECYCLE = None
+    DATABASE_POOL_PRE_PING = False
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+    }
+
+    # Serve the auth views that wait on the database and the mail server
+    # as coroutines, on an asyncio engine for ASYNC_DATABASE_URL (default:
+    # the main database with its asyncio driver). See app/aio.py.
+    ASYNC_VIEWS = (
+        os.environ.get('ASYNC_VIEWS', 'false').lower()
+        in ['true', 'on', '1']
+    )
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+
+    # Hashes made with other parameters are upgraded on the next login.
+    PASSWORD_HASH_METHOD = os.environ.get(
+        'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000'
+    )
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '0'))
+
+    # 'simple' (in-process LRU), 'redis' or 'null'. A redis URL of
+    # 'memory://' uses an in-process stand-in for the shared backend.
+    USER_CACHE_TYPE = os.environ.get('USER_CACHE_TYPE', 'simple')
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '300'))
+    USER_CACHE_REDIS_URL = os.environ.get('USER_CACHE_REDIS_URL', 'memory://')
+    # Recently used confirmation tokens, so repeated clicks skip the write.
+    CONFIRM_CACHE_TYPE = os.environ.get('CONFIRM_CACHE_TYPE', 'simple')
+    CONFIRM_CACHE_SIZE = 10000
+    CONFIRM_CACHE_TTL = 3600
+    CONFIRM_CACHE_REDIS_URL = os.environ.get(
+        'CONFIRM_CACHE_REDIS_URL', 'memory://'
+    )
+    # The roles table, read by User.can() on every permission check. With
+    # 'simple', other processes see role changes after ROLE_CACHE_TTL.
+    ROLE_CACHE_TYPE = os.environ.get('ROLE_CACHE_TYPE', 'simple')
+    ROLE_CACHE_SIZE = 1
+    ROLE_CACHE_TTL = int(os.environ.get('ROLE_CACHE_TTL', '60'))
+    ROLE_CACHE_REDIS_URL = os.environ.get('ROLE_CACHE_REDIS_URL', 'memory://')
+    # Rendered anonymous pages, 'simple', 'filesystem', 'redis' or 'null'.
+    # Keep the TTL below WTF_CSRF_TIME_LIMIT, cached forms embed a token.
+    RESPONSE_CACHE_TYPE = os.environ.get('RESPONSE_CACHE_TYPE', 'simple')
+    # Entries kept, in memory or on disk.
+    RESPONSE_CACHE_SIZE = 1000
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '300'))
+    RESPONSE_CACHE_DIR = os.environ.get(
+        'RESPONSE_CACHE_DIR', os.path.join(basedir, 'cache', 'responses')
+    )
+    RESPONSE_CACHE_REDIS_URL = os.environ.get(
+        'RESPONSE_CACHE_REDIS_URL', 'memory://'
+    )
+
+    # Server-side sessions, the cookie only carries a random id. 'sqlalchemy'
+    # (the sessions table, purged by 'flask sessions cleanup'), 'memory'
+    # (single node only) or 'cookie' for Flask's signed cookie sessions.
+    SESSION_TYPE = os.environ.get('SESSION_TYPE', 'sqlalchemy')
+    SESSION_MEMORY_SIZE = int(os.environ.get('SESSION_MEMORY_SIZE', '10000'))
+    SESSION_CLEANUP_BATCH_SIZE = 1000
+
+    # Token bucket limits per endpoint, keyed by client IP and/or account
+    # (the logged in user, or the email posted to the login form). Buckets
+    # live in process ('memory') or in redis, shared by all workers.
+    RATELIMIT_ENABLED = (
+        os.environ.get('RATELIMIT_ENABLED', 'true').lower()
+        in ['true', 'on', '1']
+    )
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE', 'memory')
+    # Reverse proxies whose X-Forwarded-For entries are trusted for the
+    # client IP. Leave at 0 when clients connect directly.
+    RATELIMIT_TRUSTED_PROXIES = int(
+        os.environ.get('RATELIMIT_TRUSTED_PROXIES', '0')
+    )
+    RATELIMIT_REDIS_URL = os.environ.get('RATELIMIT_REDIS_URL', 'memory://')
+    RATELIMITS = {
+        'auth.login': {
+            'methods': ['POST'], 'ip': '20/minute', 'account': '5/minute'
+        },
+        'auth.register': {'methods': ['POST'], 'ip': '10/hour'},
+        'auth.resend_confirmation': {'ip': '10/hour', 'account': '3/hour'},
+    }
+
+    # Compiled template bytecode, 'filesystem' (shared by the workers on a
+    # host), 'redis', 'simple' (per process) or 'null'. Filled at deploy
+    # time by 'flask templates compile'.
+    TEMPLATE_CACHE_TYPE = os.environ.get('TEMPLATE_CACHE_TYPE', 'filesystem')
+    TEMPLATE_CACHE_SIZE = 1024
+    TEMPLATE_CACHE_DIR = os.environ.get(
+        'TEMPLATE_CACHE_DIR', os.path.join(basedir, 'cache', 'templates')
+    )
+    TEMPLATE_CACHE_REDIS_URL = os.environ.get(
+        'TEMPLATE_CACHE_REDIS_URL', 'memory://'
+    )
+
+    # Request instrumentation served at /metrics. With METRICS_PROFILE,
+    # requests slower than the threshold leave a folded-stack profile.
+    METRICS_ENABLED = (
+        os.environ.get('METRICS_ENABLED', 'false').lower()
+        in ['true', 'on', '1']
+    )
+    # Who may read /metrics: clients from these addresses or networks
+    # (comma separated), or presenting 'Authorization: Bearer <token>'.
+    METRICS_ALLOWED_IPS = [
+        network.strip() for network in
+        os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+        if network.strip()
+    ]
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_PROFILE = (
+        os.environ.get('METRICS_PROFILE', 'false').lower()
+        in ['true', 'on', '1']
+    )
+    METRICS_PROFILE_THRESHOLD = float(
+        os.environ.get('METRICS_PROFILE_THRESHOLD', '0.5')
+    )
+    METRICS_PROFILE_INTERVAL = 0.005
+    METRICS_PROFILE_DIR = os.environ.get(
+        'METRICS_PROFILE_DIR', os.path.join(basedir, 'profiles')
+    )
+
+    # Query budgets declared on the views with app.querybudget.query_budget.
+    # 'raise' fails the requests over budget, 'log' logs the violations
+    # with stack traces for a QUERY_BUDGET_SAMPLE_RATE fraction of the
+    # requests, 'off' disables the checks.
+    QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'log')
+    QUERY_BUDGET_SAMPLE_RATE = float(
+        os.environ.get('QUERY_BUDGET_SAMPLE_RATE', '1.0')
+    )
+
+    # The user directory at /users and /api/users. Pages are fetched by
+    # keyset on the username, the query string picks the size up to the max.
+    USERS_PER_PAGE = 50
+    USERS_MAX_PER_PAGE = 500
+
+    # /readyz answers 503 until a worker has opened its database
+    # connections, compiled the templates, rendered WARMUP_PATHS and primed
+    # its caches. The warm-up starts on the first request, probes included.
+    WARMUP_ENABLED = (
+        os.environ.get('WARMUP_ENABLED', 'true').lower()
+        in ['true', 'on', '1']
+    )
+    WARMUP_PATHS = ['/', '/auth/login', '/auth/register']
+
+    # Serve Bootstrap and jQuery from the app instead of a CDN, so that
+    # 'flask assets build' can precompress them.
+    BOOTSTRAP_SERVE_LOCAL = (
+        os.environ.get('BOOTSTRAP_SERVE_LOCAL', 'false').lower()
+        in ['true', 'on', '1']
+    )
+
+    # On-the-fly compression of text responses, see app/compression.py.
+    COMPRESS_ENABLED = (
+        os.environ.get('COMPRESS_ENABLED', 'true').lower()
+        in ['true', 'on', '1']
+    )
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_MIMETYPES = [
+        'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+        'application/javascript', 'application/json', 'application/xml',
+        'image/svg+xml',
+    ]
 
     @staticmethod
     def init_app(app):
@@ -29,6 +220,8 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    COMPRESS_LEVEL = 1
+    COMPRESS_BROTLI_QUALITY = 1
     SQLALCHEMY_DATABASE_URI = (
         os.environ.get('DEV_DATABASE_URL') or
         'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
@@ -37,13 +230,53 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    TEMPLATE_CACHE_TYPE = 'simple'
+    SESSION_TYPE = 'memory'
+    RATELIMIT_ENABLED = False
+    QUERY_BUDGET_MODE = 'raise'
+    WARMUP_ENABLED = False
     SQLALCHEMY_DATABASE_URI = (
         os.environ.get('TEST_DATABASE_URL') or
         'sqlite://'
     )
 
 
+class BenchmarkConfig(TestingConfig):
+    PASSWORD_HASH_METHOD = Config.PASSWORD_HASH_METHOD
+    QUERY_BUDGET_MODE = 'log'
+    QUERY_BUDGET_SAMPLE_RATE = 0.01
+    WARMUP_ENABLED = Config.WARMUP_ENABLED
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = (
+        os.environ.get('BENCH_DATABASE_URL') or
+        'sqlite:///' + os.path.join(basedir, 'data-bench.sqlite')
+    )
+
+
+class AsyncBenchmarkConfig(BenchmarkConfig):
+    ASYNC_VIEWS = True
+
+
 class ProductionConfig(Config):
+    # Every server worker starts a hashing pool of its own, so the server
+    # runs WEB_WORKERS * PASSWORD_HASH_WORKERS hashing processes. By default
+    # the CPUs are split between the workers, at least one process each.
+    PASSWORD_HASH_WORKERS = int(os.environ.get(
+        'PASSWORD_HASH_WORKERS', str(max(1, cpus // web_workers))
+    ))
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', '10'))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', '20'))
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', '30'))
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', '1800'))
+    DATABASE_POOL_PRE_PING = True
+    QUERY_BUDGET_SAMPLE_RATE = float(
+        os.environ.get('QUERY_BUDGET_SAMPLE_RATE', '0.01')
+    )
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+    COMPRESS_BROTLI_QUALITY = int(
+        os.environ.get('COMPRESS_BROTLI_QUALITY', '5')
+    )
     SQLALCHEMY_DATABASE_URI = (
         os.environ.get('DATABASE_URL') or
         'sqlite:///' + os.path.join(basedir, 'data.sqlite')
@@ -53,6 +286,8 @@ class ProductionConfig(Config):
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
+    'benchmark-async': AsyncBenchmarkConfig,
     'production': ProductionConfig,
     'default': DevelopmentConfig
 }
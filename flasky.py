@@ -1,11 +1,21 @@
 import os
+import time
+
+import click
 from app import create_app, db
 from app.models import User, Role
-from flask_migrate import Migrate
 
 
-app = create_app(os.environ.get('FLASK_CONFIG') or 'default')
-migrate = Migrate(app, db)
+# FLASK_PROFILE=minimal speeds up CLI jobs that serve no pages, such as
+# 'flask send-mail' or 'flask sessions cleanup'.
+app = create_app(os.environ.get('FLASK_CONFIG') or 'default',
+                 os.environ.get('FLASK_PROFILE') or 'web')
+
+# Migrations are only run from the flask command, web workers importing
+# this module skip loading Alembic.
+if os.environ.get('FLASK_RUN_FROM_CLI'):
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
 
 
 @app.shell_context_processor
@@ -14,8 +24,244 @@ def make_shell_context():
 
 
 @app.cli.command()
-def test():
+@click.option('--workers', '-j', type=int, default=None,
+              help='Test processes (default: one per CPU).')
+@click.option('--pattern', '-k', default='test*.py',
+              help='Only run the test modules matching this pattern.')
+@click.option('--durations', type=int, default=10,
+              help='Slowest tests to list (0 for all).')
+def test(workers, pattern, durations):
     """Run the unit tests."""
-    import unittest
-    tests = unittest.TestLoader().discover('tests')
-    unittest.TextTestRunner(verbosity=2).run(tests)
\ No newline at end of file
+    from tests import runner
+    start = time.perf_counter()
+    results = runner.run(pattern, workers)
+    for result in results:
+        click.echo(result['output'], nl=False)
+    timings = sorted(
+        (timing for result in results for timing in result['timings']),
+        key=lambda timing: timing[1], reverse=True
+    )
+    click.echo(f'\n{"test":<72}{"seconds":>8}')
+    for name, seconds in timings[:durations or None]:
+        click.echo(f'{name:<72}{seconds:>8.3f}')
+    run, failures, errors, skipped = (
+        sum(result[key] for result in results)
+        for key in ('run', 'failures', 'errors', 'skipped')
+    )
+    click.echo(f'\nRan {run} tests on {len(results)} process(es) in '
+               f'{time.perf_counter() - start:.2f}s: {failures} failures, '
+               f'{errors} errors, {skipped} skipped.')
+    if failures or errors:
+        raise SystemExit(1)
+
+
+@app.cli.command()
+@click.option('--requests', '-n', type=int, default=200,
+              help='Requests per endpoint.')
+@click.option('--concurrency', '-c', type=int, default=1,
+              help='Concurrent test clients.')
+@click.option('--users', type=int, default=1000,
+              help='Accounts seeded into the benchmark database.')
+@click.option('--endpoint', '-e', 'endpoints', multiple=True,
+              type=click.Choice(['index', 'login', 'register', 'confirm',
+                                 'user', 'resend']),
+              help='Only benchmark these endpoints.')
+@click.option('--output', '-o', type=click.Path(),
+              default=os.path.join('benchmarks', 'latest.json'),
+              help='Where to write the results.')
+@click.option('--baseline', type=click.Path(),
+              default=os.path.join('benchmarks', 'baseline.json'),
+              help='Results to compare against.')
+@click.option('--save-baseline', is_flag=True,
+              help='Store these results as the new baseline.')
+@click.option('--tolerance', type=float, default=0.1,
+              help='Allowed regression before failing, as a fraction.')
+def bench(requests, concurrency, users, endpoints, output, baseline,
+          save_baseline, tolerance):
+    """Run the endpoint benchmarks."""
+    from benchmarks import endpoints as suite
+    results = suite.run(requests, concurrency, users, endpoints)
+    click.echo(f'{"endpoint":<26}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}')
+    for result in results['results'].values():
+        click.echo(f'{result["path"]:<26}{result["rps"]:>10.1f}'
+                   f'{result["p50_ms"]:>10.2f}{result["p99_ms"]:>10.2f}')
+    suite.save(results, output)
+    if save_baseline:
+        suite.save(results, baseline)
+        click.echo(f'Baseline saved to {baseline}.')
+    elif os.path.exists(baseline):
+        rows, regressed = suite.compare(results, suite.load(baseline),
+                                        tolerance)
+        click.echo(f'\nCompared with {baseline}:')
+        for name, metric, before, after, change in rows:
+            click.echo(f'{name:<10}{metric:<8}{before:>10.2f}{after:>10.2f}'
+                       f'{change:>+10.1%}')
+        if regressed:
+            raise click.ClickException(
+                f'Performance regressed by more than {tolerance:.0%}.'
+            )
+
+
+@app.cli.command('send-mail')
+@click.option('--batch-size', type=int, default=None,
+              help='Messages sent per SMTP connection.')
+@click.option('--loop/--once', default=False,
+              help='Keep polling the outbox instead of draining it once.')
+@click.option('--interval', type=float, default=5.0,
+              help='Seconds to wait when the outbox is empty.')
+def send_mail(batch_size, loop, interval):
+    """Send the mail queued in the outbox."""
+    from app.email import drain_outbox
+    batch_size = batch_size or app.config['MAIL_OUTBOX_BATCH_SIZE']
+    max_attempts = app.config['MAIL_OUTBOX_MAX_ATTEMPTS']
+    while True:
+        try:
+            sent = drain_outbox(batch_size, max_attempts)
+        except OSError as e:
+            db.session.rollback()
+            click.echo(f'Mail server unavailable: {e}', err=True)
+            sent = 0
+        if sent:
+            click.echo(f'Sent {sent} message(s).')
+        if sent < batch_size:
+            if not loop:
+                break
+            time.sleep(interval)
+
+
+@app.cli.group()
+def assets():
+    """Build the static assets."""
+
+
+@assets.command('build')
+def build_assets():
+    """Fingerprint and precompress the static files."""
+    from app.assets import build, brotli
+    vendor = {}
+    if 'bootstrap' in app.blueprints:
+        vendor['bootstrap'] = app.blueprints['bootstrap'].static_folder
+    manifest = build(app.static_folder, vendor)
+    for name, hashed in sorted(manifest.items()):
+        click.echo(f'{name} -> {hashed}')
+    if brotli is None:
+        click.echo('brotli is not installed, only gzip variants were written.',
+                   err=True)
+
+
+@app.cli.group()
+def templates():
+    """Manage the compiled template cache."""
+
+
+@templates.command('compile')
+@click.option('--clear', is_flag=True,
+              help='Drop the cached bytecode before compiling.')
+def compile_templates(clear):
+    """Compile every template into the bytecode cache."""
+    from app.jinja import compile_templates
+    cache = app.jinja_env.bytecode_cache
+    if cache is None:
+        raise click.ClickException('The template cache is disabled.')
+    if clear:
+        cache.clear()
+    start = time.perf_counter()
+    names = compile_templates(app)
+    click.echo(f'Compiled {len(names)} templates in '
+               f'{time.perf_counter() - start:.2f}s.')
+    if app.config['TEMPLATE_CACHE_TYPE'] == 'simple':
+        click.echo('TEMPLATE_CACHE_TYPE is \'simple\', the compiled '
+                   'templates are not kept after this command.', err=True)
+
+
+@app.cli.group()
+def sessions():
+    """Manage the server-side sessions."""
+
+
+@sessions.command('cleanup')
+@click.option('--batch-size', type=int, default=None,
+              help='Sessions deleted per transaction.')
+def cleanup_sessions(batch_size):
+    """Delete expired sessions."""
+    from app.sessions import make_session_store
+    if app.config['SESSION_TYPE'] == 'cookie':
+        raise click.ClickException('Server-side sessions are not enabled.')
+    deleted = make_session_store(app.config).cleanup(
+        batch_size or app.config['SESSION_CLEANUP_BATCH_SIZE']
+    )
+    click.echo(f'Deleted {deleted} expired sessions.')
+
+
+@app.cli.group()
+def roles():
+    """Manage the user roles."""
+
+
+@roles.command('insert')
+def insert_roles():
+    """Create the roles or reset their permissions to the defaults."""
+    Role.insert_roles()
+    for role in Role.query.order_by(Role.id):
+        click.echo(f'{role.name}: {role.permissions}'
+                   f'{" (default)" if role.default else ""}')
+
+
+@app.cli.group()
+def users():
+    """Bulk import and export user accounts."""
+
+
+def user_file_format(path, fmt):
+    if fmt is not None:
+        return fmt
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+@users.command('import')
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Input format, guessed from the file name by default.')
+@click.option('--batch-size', type=int, default=1000,
+              help='Rows inserted per statement.')
+@click.option('--workers', type=int, default=None,
+              help='Password hashing processes (default: one per CPU).')
+def import_users(source, fmt, batch_size, workers):
+    """Import users from a CSV or JSON Lines file ('-' for stdin)."""
+    from app import password_hasher
+    from app.bulk import import_users, read_users
+    app.config['PASSWORD_HASH_WORKERS'] = workers or os.cpu_count() or 1
+    password_hasher.init_app(app)
+
+    def progress(stats, elapsed):
+        click.echo(
+            f'{stats["read"]} read, {stats["imported"]} imported, '
+            f'{stats["skipped"]} skipped ({stats["read"] / elapsed:.0f} rows/s)',
+            err=True
+        )
+
+    def reject(row, reason):
+        click.echo(f'Rejected {row}: {reason}', err=True)
+
+    try:
+        rows = read_users(source, user_file_format(source.name, fmt))
+        stats = import_users(rows, batch_size, progress, reject)
+    finally:
+        password_hasher.shutdown()
+    click.echo(f'Imported {stats["imported"]} users, '
+               f'skipped {stats["skipped"]} existing, '
+               f'rejected {stats["rejected"]}.')
+
+
+@users.command('export')
+@click.argument('target', type=click.File('w'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Output format, guessed from the file name by default.')
+@click.option('--batch-size', type=int, default=1000,
+              help='Rows fetched per round trip.')
+def export_users(target, fmt, batch_size):
+    """Export users to a CSV or JSON Lines file ('-' for stdout)."""
+    from app.bulk import export_users
+    count = export_users(target, user_file_format(target.name, fmt),
+                         batch_size)
+    click.echo(f'Exported {count} users.', err=True)
@@ -0,0 +1,65 @@
+"""Gunicorn settings for serving wsgi.py in production: ``gunicorn`` from
+this directory. Needs gunicorn.
+
+The application is preloaded by the master and shared copy-on-write by
+the workers, see app/serving.py. WEB_WORKERS and WEB_THREADS override the
+layout picked from the CPU count. Keep DATABASE_POOL_SIZE at or above
+WEB_THREADS: every thread may hold a connection.
+
+Signals: HUP starts new workers and stops the old ones gracefully, but a
+preloaded application is not reimported. Deploy new code with USR2 (a
+new master), then WINCH and QUIT to the old master.
+"""
+import os
+
+from config import web_workers
+
+
+wsgi_app = 'wsgi:application'
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+preload_app = (
+    os.environ.get('WEB_PRELOAD', 'true').lower() in ['true', 'on', '1']
+)
+# A process per CPU for the CPU-bound work (templates, hashing,
+# serialization), plus one, and threads to overlap the waits on the
+# database and the mail server. See benchmarks/serving.py. Each worker
+# sizes its password hashing pool from this, see PASSWORD_HASH_WORKERS.
+workers = web_workers
+threads = int(os.environ.get('WEB_THREADS', '4'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('WEB_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+# Restart the workers now and then, spread out so they never all restart
+# at once. 0 disables it.
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('WEB_ACCESS_LOG')
+errorlog = '-'
+
+
+# The hooks import the application lazily: unless it is preloaded, the
+# master never loads it.
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app.serving import prepare_master
+        prepare_master(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app.serving import after_fork
+        after_fork(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    from app.serving import warm_worker
+    # Bounded well within the timeout after which the master kills it.
+    if not warm_worker(worker.wsgi, timeout=timeout / 2):
+        worker.log.warning('Warm-up not finished, /readyz will report it.')
+
+
+def worker_exit(server, worker):
+    from app.serving import stop_worker
+    stop_worker(worker.wsgi, timeout=graceful_timeout)
@@ -0,0 +1,203 @@
+"""Shared test fixtures: one application and schema per process, each test
+in a transaction that is rolled back afterwards, and a clock tests can move
+instead of sleeping.
+"""
+import os
+import tempfile
+import time
+import unittest
+from contextlib import contextmanager
+from functools import partial
+from unittest import mock
+
+import sqlalchemy as sa
+
+from app import (confirm_cache, create_app, db, response_cache, role_cache,
+                 user_cache)
+from app.database import engines
+from config import config, TestingConfig
+
+
+_app = None
+
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT',
+                        'ROLLBACK TO SAVEPOINT')
+
+
+def get_app():
+    """The 'testing' application, created with its schema on first use."""
+    global _app
+    if _app is None:
+        _app = create_app('testing')
+        create_schema(_app)
+    return _app
+
+
+def make_app(**settings):
+    """An application of its own, with ``settings`` over TestingConfig."""
+    config_class = type('Config', (TestingConfig,), settings)
+    with mock.patch.dict(config, {'custom': config_class}):
+        return create_app('custom')
+
+
+def create_schema(app):
+    # Once per application, the tests then roll back what they change.
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                enable_sqlite_savepoints(engine)
+        db.create_all()
+
+
+def dispose(app):
+    with app.app_context():
+        db.session.remove()
+        for engine in engines(app):
+            engine.dispose()
+
+
+def enable_sqlite_savepoints(engine):
+    # pysqlite opens transactions on its own and breaks SAVEPOINT, let
+    # SQLAlchemy emit BEGIN instead.
+    @sa.event.listens_for(engine, 'connect')
+    def disable_autobegin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @sa.event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.exec_driver_sql('BEGIN')
+
+    # The in-memory database keeps the connection that created it.
+    engine.dispose()
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is rolled back at the end.
+
+    Sessions created inside join it, and their commits only release a
+    SAVEPOINT.
+    """
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    registry = db.session.registry
+    createfunc = registry.createfunc
+    registry.createfunc = partial(
+        createfunc, bind=connection, join_transaction_mode='create_savepoint'
+    )
+    try:
+        yield connection
+    finally:
+        db.session.remove()
+        registry.createfunc = createfunc
+        transaction.rollback()
+        connection.close()
+
+
+@contextmanager
+def emptied():
+    """Create the tables for the block and drop them at the end, for a
+    database the block also reaches through other connections.
+    """
+    db.create_all()
+    try:
+        yield
+    finally:
+        db.session.remove()
+        db.drop_all()
+
+
+class MockClock:
+    """A ``time.time`` replacement that only moves when told to."""
+
+    def __init__(self, now=None):
+        self.now = time.time() if now is None else now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class AppTestCase(unittest.TestCase):
+    """Test case on the shared application, with ``self.clock`` driving the
+    confirmation tokens. Changes to the database are rolled back and the
+    caches emptied after each test.
+
+    ``config`` is applied to the application for each test. The
+    configuration and ``app.extensions`` are restored afterwards, so a test
+    may change settings and run an extension's ``init_app`` again.
+    """
+
+    config = {}
+    rollback = True
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.app = get_app()
+
+    def setUp(self):
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.addCleanup(self.app_context.pop)
+        for patcher in (mock.patch.dict(self.app.config, self.config),
+                        mock.patch.dict(self.app.extensions)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        database = rolled_back() if self.rollback else emptied()
+        database.__enter__()
+        self.addCleanup(database.__exit__, None, None, None)
+        self.clock = self.app.extensions['clock'] = MockClock()
+        for cache in (user_cache, confirm_cache, response_cache, role_cache):
+            self.addCleanup(cache.clear)
+
+    def record_statements(self):
+        """The SQL statements run from now to the end of the test, without
+        the savepoints standing in for the test's commits.
+        """
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if not statement.startswith(SAVEPOINT_STATEMENTS):
+                statements.append(statement)
+
+        sa.event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(sa.event.remove, db.engine, 'before_cursor_execute',
+                        record)
+        return statements
+
+
+class CustomAppTestCase(AppTestCase):
+    """AppTestCase on an application of the class's own, created from
+    TestingConfig with ``settings`` over it, for settings only read when
+    the application is created.
+
+    Set ``database_file`` for tests that reach the database through more
+    than the test's connection (other threads, a second engine): it is
+    then a file in ``cls.tmpdir``, emptied after each test rather than
+    rolled back.
+    """
+
+    settings = {}
+    database_file = False
+
+    @classmethod
+    def setUpClass(cls):
+        super(AppTestCase, cls).setUpClass()
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.tmpdir.cleanup)
+        cls.rollback = not cls.database_file
+        cls.app = make_app(**cls.app_settings())
+        cls.addClassCleanup(dispose, cls.app)
+        if cls.rollback:
+            create_schema(cls.app)
+
+    @classmethod
+    def app_settings(cls):
+        settings = dict(cls.settings)
+        if cls.database_file:
+            path = os.path.join(cls.tmpdir.name, 'test.sqlite')
+            settings['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        return settings
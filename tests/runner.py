@@ -0,0 +1,82 @@
+"""Test runner behind ``flask test``: runs the test modules on a pool of
+processes, each with its own application and in-memory database, and
+reports the time spent in every test.
+"""
+import io
+import multiprocessing
+import os
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+
+class TimingResult(unittest.TextTestResult):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timings = []
+
+    def startTest(self, test):
+        self._started = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        self.timings.append((test.id(), time.perf_counter() - self._started))
+
+
+def iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iter_tests(test)
+        else:
+            yield test
+
+
+def discover(start_dir='tests', pattern='test*.py'):
+    return list(iter_tests(
+        unittest.defaultTestLoader.discover(start_dir, pattern)
+    ))
+
+
+def partition(tests, workers):
+    """Split tests into ``workers`` groups of whole modules, so that each
+    module's fixtures are built in one process only.
+    """
+    modules = {}
+    for test in tests:
+        modules.setdefault(type(test).__module__, []).append(test.id())
+    groups = [[] for _ in range(workers)]
+    for names in sorted(modules.values(), key=len, reverse=True):
+        min(groups, key=len).extend(names)
+    return [group for group in groups if group]
+
+
+def run_tests(names, verbosity=2):
+    """Run the tests with the given ids and return a picklable summary."""
+    stream = io.StringIO()
+    suite = unittest.defaultTestLoader.loadTestsFromNames(names)
+    runner = unittest.TextTestRunner(stream, verbosity=verbosity,
+                                     resultclass=TimingResult)
+    result = runner.run(suite)
+    return {
+        'output': stream.getvalue(),
+        'run': result.testsRun,
+        'failures': len(result.failures),
+        'errors': len(result.errors),
+        'skipped': len(result.skipped),
+        'timings': result.timings,
+    }
+
+
+def run(pattern='test*.py', workers=None, verbosity=2):
+    workers = workers or os.cpu_count() or 1
+    groups = partition(discover(pattern=pattern), workers)
+    if len(groups) <= 1:
+        return [run_tests(group, verbosity) for group in groups]
+    # Spawned, not forked: every worker imports the app afresh.
+    with ProcessPoolExecutor(
+        max_workers=len(groups),
+        mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        return list(executor.map(run_tests, groups,
+                                 [verbosity] * len(groups)))
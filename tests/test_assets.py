@@ -0,0 +1,79 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from flask import url_for
+from flask_bootstrap import bootstrap_find_resource
+
+from app import assets
+from app.assets import build
+from tests.base import AppTestCase
+
+
+class AssetsTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.static_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_folder)
+        os.makedirs(os.path.join(self.static_folder, 'css'))
+        with open(os.path.join(self.static_folder, 'css', 'site.css'),
+                  'w') as f:
+            f.write('body { margin: 0; }\n' * 100)
+        self.addCleanup(setattr, self.app, 'static_folder',
+                        self.app.static_folder)
+        self.app.static_folder = self.static_folder
+        self.client = self.app.test_client()
+
+    def test_unbuilt_files_are_served_as_is(self):
+        assets.load_manifest(self.app)
+        with self.app.test_request_context():
+            self.assertEqual(url_for('static', filename='css/site.css'),
+                             '/static/css/site.css')
+        response = self.client.get('/static/css/site.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+        response.close()
+
+    def test_fingerprinted_url(self):
+        manifest = build(self.static_folder)
+        assets.load_manifest(self.app)
+        hashed = manifest['css/site.css']
+        self.assertRegex(hashed, r'^dist/css/site\.[0-9a-f]{12}\.css$')
+        self.assertTrue(
+            os.path.exists(os.path.join(self.static_folder, hashed + '.gz'))
+        )
+        with self.app.test_request_context():
+            self.assertEqual(url_for('static', filename='css/site.css'),
+                             f'/static/{hashed}')
+            self.assertEqual(url_for('static', filename='missing.js'),
+                             '/static/missing.js')
+
+    def test_precompressed_and_immutable(self):
+        hashed = build(self.static_folder)['css/site.css']
+        assets.load_manifest(self.app)
+        response = self.client.get(f'/static/{hashed}',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        self.assertEqual(gzip.decompress(response.data),
+                         b'body { margin: 0; }\n' * 100)
+        response.close()
+
+        response = self.client.get(f'/static/{hashed}')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, b'body { margin: 0; }\n' * 100)
+        response.close()
+
+    def test_bootstrap_served_locally(self):
+        self.app.config['BOOTSTRAP_SERVE_LOCAL'] = True
+        with self.app.test_request_context():
+            url = bootstrap_find_resource('css/bootstrap.css', 'bootstrap')
+        self.assertTrue(url.startswith('/static/bootstrap/'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        response.close()
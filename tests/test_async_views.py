@@ -0,0 +1,139 @@
+import socket
+import threading
+import unittest
+from unittest import mock
+
+from app import mail
+from app.auth import async_views
+from app.models import OutboxMessage, User
+from tests.base import CustomAppTestCase, make_app
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+try:
+    import aiosmtplib
+    from aiosmtpd.controller import Controller
+except ImportError:
+    aiosmtplib = Controller = None
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+@unittest.skipUnless(aiosqlite, 'aiosqlite is not installed')
+class AsyncViewsTestCase(CustomAppTestCase):
+    settings = {'ASYNC_VIEWS': True, 'WTF_CSRF_ENABLED': False}
+    # Shared by the sync engine and the async one.
+    database_file = True
+
+    def setUp(self):
+        super().setUp()
+        self.state = self.app.extensions['async_db']
+        self.addCleanup(self.state.shutdown)
+        self.client = self.app.test_client()
+
+    def register(self, email='john@example.com', username='john'):
+        return self.client.post('/auth/register', data={
+            'email': email, 'username': username,
+            'password': 'cat', 'password2': 'cat'
+        })
+
+    def test_memory_database_rejected(self):
+        with self.assertRaises(ValueError):
+            make_app(ASYNC_VIEWS=True)
+
+    def test_register(self):
+        with mail.record_messages() as outbox:
+            response = self.register()
+            self.state.join()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(outbox[0].recipients, ['john@example.com'])
+        self.assertIsNotNone(User.query.filter_by(username='john').first())
+
+        # The async validators report duplicates, and no mail goes out.
+        with mail.record_messages() as outbox:
+            response = self.register(username='susan')
+            self.state.join()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Email already registered.', response.data)
+        self.assertEqual(outbox, [])
+
+    def test_outbox(self):
+        self.app.config['MAIL_OUTBOX'] = True
+        self.register()
+        self.assertEqual(OutboxMessage.query.count(), 1)
+
+    def test_resend_confirmation(self):
+        self.register()
+        self.client.post('/auth/login', data={
+            'email': 'john@example.com', 'password': 'cat'
+        })
+        # The user is loaded on the async engine, the sync one is not used.
+        statements = self.record_statements()
+        with mail.record_messages() as outbox:
+            response = self.client.get('/auth/confirm')
+            self.state.join()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(statements, [])
+
+    def test_sync_views_stay_off_the_loop(self):
+        self.register()
+        self.client.post('/auth/login', data={
+            'email': 'john@example.com', 'password': 'cat'
+        })
+        with mock.patch.object(self.state, 'run',
+                               wraps=self.state.run) as run:
+            for url in ('/user/foo', '/auth/login', '/auth/unconfirmed'):
+                self.client.get(url)
+            run.assert_not_called()
+            self.client.get('/auth/confirm')
+            self.assertEqual(run.call_count, 2)
+
+    def test_no_blocking_calls_on_the_loop(self):
+        threads = []
+        real_default_role_id = async_views.default_role_id
+
+        def default_role_id():
+            threads.append(threading.current_thread().name)
+            return real_default_role_id()
+
+        with mock.patch.object(async_views, 'default_role_id',
+                               default_role_id):
+            self.register()
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], 'async-views')
+
+    def test_resend_confirmation_requires_login(self):
+        response = self.client.get('/auth/confirm')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/auth/login', response.headers['Location'])
+
+    @unittest.skipUnless(Controller, 'aiosmtplib or aiosmtpd is not installed')
+    def test_smtp_delivery(self):
+        handler = RecordingHandler()
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        self.app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port,
+                               MAIL_USE_TLS=False, MAIL_USERNAME=None,
+                               MAIL_SUPPRESS_SEND=False,
+                               MAIL_SENDER='flasky@example.com')
+        mail.init_app(self.app)
+        self.register()
+        self.state.join()
+        self.assertEqual(len(handler.messages), 1)
+        self.assertEqual(handler.messages[0].rcpt_tos, ['john@example.com'])
@@ -0,0 +1,129 @@
+from unittest import mock
+
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.auth.forms import RegistrationForm
+from app.models import User
+from tests.base import AppTestCase
+
+
+class AuthTestCase(AppTestCase):
+    config = {'WTF_CSRF_ENABLED': False}
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.app.test_client()
+
+    def register(self, email='john@example.com', username='john'):
+        return self.client.post('/auth/register', data={
+            'email': email,
+            'username': username,
+            'password': 'cat',
+            'password2': 'cat'
+        })
+
+    def test_register(self):
+        response = self.register()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(User.query.count(), 1)
+
+    def test_register_duplicates(self):
+        self.register()
+        statements = self.record_statements()
+        response = self.register(username='john2')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Email already registered.', response.data)
+        self.assertNotIn(b'Username already in use.', response.data)
+        self.assertEqual(
+            len([s for s in statements if s.startswith('SELECT')]), 1
+        )
+        response = self.register(email='john@example.org')
+        self.assertIn(b'Username already in use.', response.data)
+
+    def test_register_race(self):
+        self.register()
+        with mock.patch.object(RegistrationForm, 'taken_fields',
+                               lambda form: set()):
+            response = self.register(email='john@example.org')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Username already in use.', response.data)
+        self.assertEqual(User.query.count(), 1)
+
+    def test_register_race_on_email_containing_username(self):
+        self.register(email='username@example.com')
+        with mock.patch.object(RegistrationForm, 'taken_fields',
+                               lambda form: set()):
+            response = self.register(email='username@example.com',
+                                     username='john2')
+        self.assertIn(b'Email already registered.', response.data)
+        self.assertNotIn(b'Username already in use.', response.data)
+        self.assertEqual(User.query.count(), 1)
+
+    def test_integrity_error_messages(self):
+        messages = {
+            'UNIQUE constraint failed: users.email': 'email',
+            'duplicate key value violates unique constraint "ix_users_email"'
+            '\nDETAIL:  Key (email)=(username@example.com) already exists.':
+                'email',
+            '(1062, "Duplicate entry \'username@example.com\' for key '
+            '\'users.ix_users_email\'")': 'email',
+            '(1062, "Duplicate entry \'email\' for key '
+            '\'ix_users_username\'")': 'username',
+        }
+        data = {'email': 'john@example.com', 'username': 'john',
+                'password': 'cat', 'password2': 'cat'}
+        for message, name in messages.items():
+            with self.app.test_request_context(), self.subTest(message):
+                form = RegistrationForm(data=data)
+                self.assertTrue(form.validate())
+                form.add_integrity_error(
+                    IntegrityError('INSERT', {}, Exception(message))
+                )
+                self.assertEqual(form[name].errors,
+                                 [form.duplicate_messages[name]])
+        with self.app.test_request_context():
+            error = IntegrityError('INSERT', {}, Exception('NOT NULL'))
+            with self.assertRaises(IntegrityError):
+                RegistrationForm().add_integrity_error(error)
+
+    def test_confirm_without_session(self):
+        user = User(email='john@example.com', username='john', password='cat')
+        db.session.add(user)
+        db.session.commit()
+        token = user.generate_confirmation_token()
+        response = self.client.get(f'/auth/confirm/{token}',
+                                   follow_redirects=True)
+        self.assertIn(b'You have confirmed your account', response.data)
+        self.assertTrue(User.query.get(user.id).confirmed)
+
+    def test_confirm_repeated_clicks(self):
+        user = User(email='john@example.com', username='john', password='cat')
+        db.session.add(user)
+        db.session.commit()
+        token = user.generate_confirmation_token()
+        self.client.get(f'/auth/confirm/{token}')
+        statements = self.record_statements()
+        response = self.client.get(f'/auth/confirm/{token}')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(statements, [])
+
+    def test_confirm_invalid_token(self):
+        response = self.client.get('/auth/confirm/not-a-token',
+                                   follow_redirects=True)
+        self.assertIn(b'The confirmation link is invalid', response.data)
+
+    def test_login_rehashes_outdated_password(self):
+        user = User(email='john@example.com', username='john', confirmed=True)
+        user.password_hash = generate_password_hash('cat', 'pbkdf2:sha256:500')
+        db.session.add(user)
+        db.session.commit()
+        response = self.client.post('/auth/login', data={
+            'email': 'john@example.com',
+            'password': 'cat'
+        })
+        self.assertEqual(response.status_code, 302)
+        user = User.query.filter_by(username='john').first()
+        self.assertFalse(user.password_needs_rehash())
+        self.assertTrue(user.verify_password('cat'))
@@ -1,22 +1,27 @@
 import unittest
-from flask import current_app
-from app import create_app, db
 
+from flask import current_app
 
-class BasicsTestCase(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app('testing')
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
+from app import db
+from app.models import User
+from tests.base import AppTestCase, get_app, rolled_back
 
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
 
+class BasicsTestCase(AppTestCase):
     def test_app_exists(self):
         self.assertFalse(current_app is None)
 
     def test_app_is_testing(self):
         self.assertTrue(current_app.config['TESTING'])
+
+
+class RollbackTestCase(unittest.TestCase):
+    def test_commits_are_rolled_back(self):
+        with get_app().app_context():
+            with rolled_back():
+                db.session.add(User(username='john'))
+                db.session.commit()
+                db.session.remove()
+                self.assertEqual(User.query.count(), 1)
+            self.assertEqual(User.query.count(), 0)
+            db.session.remove()
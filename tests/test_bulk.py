@@ -0,0 +1,115 @@
+import io
+from unittest import mock
+
+import sqlalchemy as sa
+
+from app import db
+from app.bulk import export_users, import_users, read_users
+from app.models import User
+from tests.base import AppTestCase
+
+
+class BulkUsersTestCase(AppTestCase):
+    def test_import_skips_existing(self):
+        db.session.add(User(email='john@example.com', username='john'))
+        db.session.commit()
+        source = io.StringIO(
+            'email,username,password,confirmed\n'
+            'john@example.com,johnny,cat,1\n'
+            'susan@example.com,susan,dog,1\n'
+            'david@example.com,david,cat,0\n'
+            'david@example.org,david,cat,0\n'
+        )
+        stats = import_users(read_users(source, 'csv'), batch_size=2)
+        self.assertEqual(stats, {'read': 4, 'imported': 2, 'skipped': 2,
+                                 'rejected': 0})
+        susan = User.query.filter_by(username='susan').first()
+        self.assertTrue(susan.confirmed)
+        self.assertTrue(susan.verify_password('dog'))
+        self.assertFalse(User.query.filter_by(username='david').first()
+                         .confirmed)
+
+    def test_export_round_trip(self):
+        user = User(email='john@example.com', username='john', password='cat',
+                    confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        for fmt in ('csv', 'jsonl'):
+            target = io.StringIO()
+            self.assertEqual(export_users(target, fmt), 1)
+            db.session.query(User).delete()
+            db.session.commit()
+            target.seek(0)
+            stats = import_users(read_users(target, fmt))
+            self.assertEqual(stats['imported'], 1)
+            john = User.query.filter_by(username='john').first()
+            self.assertTrue(john.confirmed)
+            self.assertTrue(john.verify_password('cat'))
+
+    def test_round_trip_without_email_or_password(self):
+        # Accounts created from the index page only have a username.
+        db.session.add_all([User(username='john'), User(username='susan'),
+                            User(email='david@example.com', password='cat')])
+        db.session.commit()
+        for fmt in ('csv', 'jsonl'):
+            target = io.StringIO()
+            self.assertEqual(export_users(target, fmt), 3)
+            db.session.query(User).delete()
+            db.session.commit()
+            target.seek(0)
+            stats = import_users(read_users(target, fmt))
+            self.assertEqual(stats, {'read': 3, 'imported': 3, 'skipped': 0,
+                                     'rejected': 0}, fmt)
+            john = User.query.filter_by(username='john').one()
+            self.assertIsNone(john.email)
+            self.assertIsNone(john.password_hash)
+            david = User.query.filter_by(email='david@example.com').one()
+            self.assertIsNone(david.username)
+            self.assertTrue(david.verify_password('cat'))
+
+    def test_imported_account_without_password_cannot_log_in(self):
+        import_users([{'email': 'alice@example.com', 'username': 'alice'}])
+        user = User.query.filter_by(email='alice@example.com').one()
+        self.assertFalse(user.verify_password(''))
+        self.assertFalse(user.password_needs_rehash())
+        with mock.patch.dict(self.app.config, WTF_CSRF_ENABLED=False):
+            response = self.app.test_client().post('/auth/login', data={
+                'email': 'alice@example.com', 'password': 'cat'
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].endswith('/auth/login'))
+
+    def test_bad_rows_are_rejected(self):
+        source = io.StringIO(
+            'email,username,password,role_id\n'
+            ',,cat,\n'
+            'susan@example.com,susan,dog,admin\n'
+            'david@example.com,david,cat,\n'
+        )
+        rejected = []
+        stats = import_users(read_users(source, 'csv'),
+                             reject=lambda row, reason: rejected.append(row))
+        self.assertEqual(stats, {'read': 3, 'imported': 1, 'skipped': 0,
+                                 'rejected': 2})
+        self.assertEqual([row['username'] for row in rejected], ['', 'susan'])
+        self.assertEqual(User.query.one().username, 'david')
+
+    def test_conflicting_row_does_not_abort_batch(self):
+        db.session.add(User(email='john@example.com', username='john'))
+        db.session.commit()
+        source = io.StringIO(
+            'email,username,password\n'
+            'john@example.com,johnny,cat\n'
+            'susan@example.com,susan,dog\n'
+        )
+        rejected = []
+        # A row taken after the batch was checked, by a concurrent import.
+        with mock.patch('app.bulk.or_', return_value=sa.false()):
+            stats = import_users(
+                read_users(source, 'csv'),
+                reject=lambda row, reason: rejected.append(row)
+            )
+        self.assertEqual(stats['imported'], 1)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(rejected[0]['username'], 'johnny')
+        self.assertIsNotNone(User.query.filter_by(username='susan').first())
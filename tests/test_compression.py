@@ -0,0 +1,100 @@
+import gzip
+import unittest
+
+from flask import Flask, Response, request, stream_with_context
+
+from app.compression import CompressionMiddleware
+from tests.base import AppTestCase
+
+
+class CompressionMiddlewareTestCase(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        self.chunks = []
+
+        @app.route('/large')
+        def large():
+            return 'hello world ' * 200
+
+        @app.route('/small')
+        def small():
+            return 'hello'
+
+        @app.route('/binary')
+        def binary():
+            return Response(b'\0' * 2000, mimetype='application/octet-stream')
+
+        @app.route('/stream')
+        def stream():
+            def generate():
+                for i in range(3):
+                    self.chunks.append(i)
+                    yield f'chunk {i} ' * 50
+            return Response(stream_with_context(generate()),
+                            mimetype='text/plain')
+
+        @app.route('/etag')
+        def etag():
+            response = Response('hello world ' * 200)
+            response.set_etag('abc')
+            return response.make_conditional(request)
+
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app, min_size=500, mimetypes=['text/html', 'text/plain']
+        )
+        self.client = app.test_client()
+
+    def get(self, path, encoding='gzip', headers=None, **kwargs):
+        headers = dict(headers or {}, **{'Accept-Encoding': encoding})
+        return self.client.get(path, headers=headers, **kwargs)
+
+    def test_compresses_large_text(self):
+        response = self.get('/large')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.data),
+                         b'hello world ' * 200)
+        self.assertLess(len(response.data), 200)
+
+    def test_skips_small_binary_and_unaccepted(self):
+        self.assertNotIn('Content-Encoding', self.get('/small').headers)
+        self.assertNotIn('Content-Encoding', self.get('/binary').headers)
+        response = self.get('/large', encoding='identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        response = self.get('/large', encoding='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streams_chunk_by_chunk(self):
+        response = self.get('/stream', buffered=False)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        decompressor = gzip.zlib.decompressobj(31)
+        body = next(response.response)
+        # The first chunk is decodable before the rest is generated.
+        self.assertEqual(self.chunks, [0])
+        first = decompressor.decompress(body)
+        self.assertEqual(first, b'chunk 0 ' * 50)
+        for body in response.response:
+            first += decompressor.decompress(body)
+        response.close()
+        self.assertEqual(self.chunks, [0, 1, 2])
+        self.assertTrue(first.endswith(b'chunk 2 ' * 50))
+
+    def test_etag_is_weakened(self):
+        response = self.get('/etag')
+        self.assertEqual(response.headers['ETag'], 'W/"abc"')
+        response = self.get('/etag', headers={'If-None-Match': 'W/"abc"'})
+        self.assertEqual(response.status_code, 304)
+
+
+class CompressionConfigTestCase(AppTestCase):
+    def test_registered_in_create_app(self):
+        self.assertIsInstance(self.app.wsgi_app, CompressionMiddleware)
+        self.assertEqual(self.app.wsgi_app.level,
+                         self.app.config['COMPRESS_LEVEL'])
+        response = self.app.test_client().get(
+            '/auth/login', headers={'Accept-Encoding': 'gzip'}
+        )
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'<html', gzip.decompress(response.data))
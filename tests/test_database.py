@@ -0,0 +1,44 @@
+import os
+
+from app import db, user_cache
+from app.database import read_replica
+from app.models import User, load_user
+from tests.base import CustomAppTestCase
+
+
+class DatabaseTestCase(CustomAppTestCase):
+    settings = {'DATABASE_POOL_SIZE': 3}
+    # The replica is a second engine, outside the test's transaction.
+    database_file = True
+
+    @classmethod
+    def app_settings(cls):
+        path = os.path.join(cls.tmpdir.name, 'replica.sqlite')
+        return dict(super().app_settings(),
+                    DATABASE_REPLICA_URL=f'sqlite:///{path}')
+
+    def test_sqlite_pragmas(self):
+        self.assertEqual(db.engine.pool.size(), 3)
+        with db.engine.connect() as connection:
+            mode = connection.exec_driver_sql('PRAGMA journal_mode').scalar()
+        self.assertEqual(mode, 'wal')
+
+    def test_read_replica(self):
+        replica = self.app.extensions['replica_engine']
+        db.metadata.create_all(replica)
+        self.addCleanup(db.metadata.drop_all, replica)
+        with replica.begin() as connection:
+            connection.execute(
+                User.__table__.insert(), {'id': 1, 'username': 'replica'}
+            )
+        db.session.add(User(id=1, username='primary'))
+        db.session.commit()
+        db.session.remove()
+        with read_replica():
+            self.assertEqual(User.query.get(1).username, 'replica')
+        db.session.remove()
+        self.assertEqual(User.query.get(1).username, 'primary')
+        db.session.remove()
+        # Cached users are never read from the replica, which may lag.
+        self.assertEqual(load_user('1').username, 'primary')
+        self.assertEqual(user_cache.get(1)['username'], 'primary')
@@ -0,0 +1,127 @@
+from sqlalchemy import select
+
+from app import db
+from app.database import prefix_filter
+from app.models import Role, User
+from app.pagination import keyset_page
+from app.querybudget import QueryRecorder
+from tests.base import AppTestCase
+
+
+NAMES = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi',
+         'ivan', 'judy', 'joe', 'john']
+
+
+class DirectoryTestCase(AppTestCase):
+    config = {'WTF_CSRF_ENABLED': False}
+
+    def setUp(self):
+        super().setUp()
+        Role.insert_roles()
+        self.moderator_role = Role.query.filter_by(name='Moderator').one()
+        for i, name in enumerate(NAMES):
+            db.session.add(User(email=f'{name}@example.com', username=name,
+                                password='cat', confirmed=i % 2 == 0))
+        db.session.add(User(email='mod@example.com', username='mod',
+                            password='cat', confirmed=True,
+                            role=self.moderator_role))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def login(self, email='mod@example.com'):
+        self.client.post('/auth/login', data={
+            'email': email, 'password': 'cat'
+        })
+
+    def usernames(self, statement=None, **kwargs):
+        statement = statement if statement is not None else select(
+            User.username
+        )
+        return keyset_page(db.session, statement, User.username, **kwargs)
+
+    def test_pages_forward_and_back(self):
+        names = sorted(NAMES + ['mod'])
+        pages = []
+        page = self.usernames(per_page=5)
+        while True:
+            pages.append([row.username for row in page])
+            if page.next_cursor is None:
+                break
+            page = self.usernames(after=page.next_cursor, per_page=5)
+        self.assertEqual(pages, [names[:5], names[5:10], names[10:]])
+        self.assertIsNotNone(page.prev_cursor)
+        page = self.usernames(before=page.prev_cursor, per_page=5)
+        self.assertEqual([row.username for row in page], names[5:10])
+        page = self.usernames(before=page.prev_cursor, per_page=5)
+        self.assertEqual([row.username for row in page], names[:5])
+        self.assertIsNone(page.prev_cursor)
+        self.assertEqual(page.next_cursor, names[4])
+
+    def test_one_query_per_page(self):
+        recorder = QueryRecorder()
+        token = recorder.start()
+        try:
+            self.usernames(after='carol', per_page=3)
+        finally:
+            recorder.stop(token)
+        self.assertEqual(len(recorder), 1)
+        self.assertIn('users.username > ?', recorder.statements[0])
+
+    def test_prefix_filter(self):
+        statement = select(User.username).where(
+            prefix_filter(User.username, 'jo')
+        )
+        self.assertEqual([row.username for row in self.usernames(statement)],
+                         ['joe', 'john'])
+        statement = select(User.username).where(
+            prefix_filter(User.username, 'z')
+        )
+        self.assertEqual(len(self.usernames(statement)), 0)
+
+    def test_anonymous_redirected_to_login(self):
+        response = self.client.get('/users')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/auth/login', response.headers['Location'])
+
+    def test_requires_moderator(self):
+        self.login('alice@example.com')
+        self.assertEqual(self.client.get('/users').status_code, 403)
+        self.assertEqual(self.client.get('/api/users').status_code, 403)
+
+    def test_listing(self):
+        self.login()
+        response = self.client.get('/users?per_page=3')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('alice', html)
+        self.assertIn('carol', html)
+        self.assertNotIn('dave', html)
+        self.assertIn('Moderator', html)
+        self.assertIn('after=carol', html)
+
+    def test_api(self):
+        self.login()
+        response = self.client.get('/api/users?q=j&per_page=2')
+        data = response.get_json()
+        self.assertEqual([user['username'] for user in data['users']],
+                         ['joe', 'john'])
+        self.assertEqual(data['users'][0]['role'], 'User')
+        self.assertIsNone(data['prev'])
+        data = self.client.get(data['next']).get_json()
+        self.assertEqual([user['username'] for user in data['users']],
+                         ['judy'])
+        self.assertIsNone(data['next'])
+        self.assertIn('q=j', data['prev'])
+
+    def test_api_filters(self):
+        self.login()
+        data = self.client.get('/api/users?confirmed=false').get_json()
+        self.assertEqual(
+            [user['username'] for user in data['users']],
+            sorted(name for i, name in enumerate(NAMES) if i % 2)
+        )
+        data = self.client.get(
+            f'/api/users?role_id={self.moderator_role.id}'
+        ).get_json()
+        self.assertEqual([user['username'] for user in data['users']],
+                         ['mod'])
@@ -0,0 +1,226 @@
+import smtplib
+import socket
+import unittest
+from unittest import mock
+
+import flask_mail
+
+from app import db, mail
+from app.email import MailQueueFull, dispatcher, drain_outbox, send_email
+from app.models import OutboxMessage, User
+from tests.base import AppTestCase
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.sessions.add(id(session))
+        return '250 OK'
+
+
+class MailDispatcherTestCase(AppTestCase):
+    config = {'MAIL_SENDER': 'flasky@example.com'}
+
+    def setUp(self):
+        super().setUp()
+        # A pool of the test's own, with fresh stats.
+        dispatcher.init_app(self.app)
+
+    def tearDown(self):
+        dispatcher.shutdown(timeout=5)
+
+    def test_send_email(self):
+        with mail.record_messages() as outbox:
+            with self.app.test_request_context():
+                for i in range(5):
+                    send_email(
+                        f'user{i}@example.com', 'New User', 'mail/new_user',
+                        user={'username': f'user{i}'}
+                    )
+            dispatcher.join()
+        self.assertEqual(len(outbox), 5)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertLessEqual(stats['workers'], self.app.config['MAIL_WORKERS'])
+
+    def test_backpressure(self):
+        self.app.config.update(
+            MAIL_WORKERS=0, MAIL_QUEUE_SIZE=1, MAIL_ENQUEUE_TIMEOUT=0.01
+        )
+        dispatcher.init_app(self.app)
+        with self.app.test_request_context():
+            send_email('a@example.com', 'New User', 'mail/new_user',
+                       user={'username': 'a'})
+            with self.assertRaises(MailQueueFull):
+                send_email('b@example.com', 'New User', 'mail/new_user',
+                           user={'username': 'b'})
+
+    def test_restarted_after_fork(self):
+        pool = self.app.extensions['mail_dispatcher']
+        pool.start()
+        parent_queue, parent_workers = pool.queue, list(pool.workers)
+        with mail.record_messages() as outbox, \
+                mock.patch('app.email.os.getpid', return_value=-1):
+            with self.app.test_request_context():
+                send_email('a@example.com', 'New User', 'mail/new_user',
+                           user={'username': 'a'})
+            dispatcher.join()
+            # The forked process got workers of its own.
+            self.assertEqual(len(outbox), 1)
+            self.assertTrue(set(pool.workers).isdisjoint(parent_workers))
+            self.assertIsNot(pool.queue, parent_queue)
+        for worker in parent_workers:
+            parent_queue.put(None)
+        for worker in parent_workers:
+            worker.join(5)
+
+    @unittest.skipIf(Controller is None, 'aiosmtpd is not installed')
+    def test_connection_reuse(self):
+        handler = RecordingHandler()
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        self.app.config.update(
+            MAIL_SERVER='127.0.0.1',
+            MAIL_PORT=port,
+            MAIL_USE_TLS=False,
+            MAIL_USERNAME=None,
+            MAIL_SUPPRESS_SEND=False,
+            MAIL_WORKERS=1
+        )
+        mail.init_app(self.app)
+        dispatcher.init_app(self.app)
+        with self.app.test_request_context():
+            for i in range(3):
+                send_email(
+                    f'user{i}@example.com', 'New User', 'mail/new_user',
+                    user={'username': f'user{i}'}
+                )
+        dispatcher.join()
+        self.assertEqual(len(handler.messages), 3)
+        self.assertEqual(len(handler.sessions), 1)
+
+
+class OutboxTestCase(AppTestCase):
+    config = {'MAIL_SENDER': 'flasky@example.com'}
+
+    def tearDown(self):
+        dispatcher.shutdown(timeout=5)
+
+    def send(self, username):
+        user = User(username=username)
+        db.session.add(user)
+        with self.app.test_request_context():
+            send_email('admin@example.com', 'New User', 'mail/new_user',
+                       user=user)
+
+    def test_outbox_is_transactional(self):
+        self.app.config['MAIL_OUTBOX'] = True
+        self.send('john')
+        db.session.rollback()
+        self.assertEqual(OutboxMessage.query.count(), 0)
+        self.send('susan')
+        db.session.commit()
+        self.assertEqual(OutboxMessage.query.count(), 1)
+
+    def test_drain_outbox(self):
+        self.app.config['MAIL_OUTBOX'] = True
+        for username in ['john', 'susan', 'david']:
+            self.send(username)
+        db.session.commit()
+        with mail.record_messages() as outbox:
+            self.assertEqual(drain_outbox(batch_size=2), 2)
+            self.assertEqual(drain_outbox(batch_size=2), 1)
+            self.assertEqual(drain_outbox(batch_size=2), 0)
+        self.assertEqual(
+            [msg.body for msg in outbox],
+            ['User john has joined.', 'User susan has joined.',
+             'User david has joined.']
+        )
+        self.assertEqual(OutboxMessage.query.count(), 0)
+
+    def test_drain_outbox_failure_mid_batch(self):
+        self.app.config['MAIL_OUTBOX'] = True
+        for username in ['john', 'susan', 'david']:
+            self.send(username)
+        db.session.commit()
+        real_send = flask_mail.Connection.send
+        calls = []
+
+        def send(connection, message):
+            calls.append(message.body)
+            if len(calls) == 2:
+                raise smtplib.SMTPServerDisconnected('Connection closed')
+            return real_send(connection, message)
+
+        host = mock.Mock()
+        host.quit.side_effect = smtplib.SMTPServerDisconnected('closed')
+        with mail.record_messages() as outbox, \
+                mock.patch('flask_mail.Connection.send', send), \
+                mock.patch('flask_mail.Connection.configure_host',
+                           return_value=host), \
+                mock.patch.object(self.app.extensions['mail'], 'suppress',
+                                  False):
+            self.assertEqual(drain_outbox(batch_size=3), 1)
+        self.assertEqual(calls, ['User john has joined.',
+                                 'User susan has joined.'])
+        self.assertEqual(len(outbox), 1)
+        host.close.assert_called_once_with()
+        db.session.remove()
+        # john was sent and deleted, susan's failure was recorded and
+        # david is left for the next run.
+        rows = OutboxMessage.query.order_by(OutboxMessage.id).all()
+        self.assertEqual([(row.body, row.attempts) for row in rows],
+                         [('User susan has joined.', 1),
+                          ('User david has joined.', 0)])
+        self.assertEqual(rows[0].last_error, 'Connection closed')
+
+    def test_drain_outbox_gives_up(self):
+        self.app.config['MAIL_OUTBOX'] = True
+        self.send('john')
+        db.session.commit()
+        refused = smtplib.SMTPRecipientsRefused({})
+        with mock.patch('flask_mail.Connection.send', side_effect=refused):
+            for _ in range(3):
+                self.assertEqual(drain_outbox(max_attempts=2), 0)
+        self.assertEqual(OutboxMessage.query.one().attempts, 2)
+
+    def test_full_queue_falls_back_to_outbox(self):
+        self.app.config.update(
+            MAIL_WORKERS=0, MAIL_QUEUE_SIZE=1, MAIL_ENQUEUE_TIMEOUT=0.01
+        )
+        dispatcher.init_app(self.app)
+        for username in ['john', 'susan', 'david']:
+            self.send(username)
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            db.session.commit()
+        self.assertIn('2 message(s) moved to the outbox', logs.output[0])
+        self.assertEqual(dispatcher.stats()['queue_depth'], 1)
+        self.assertEqual(
+            [row.body for row in
+             OutboxMessage.query.order_by(OutboxMessage.id)],
+            ['User susan has joined.', 'User david has joined.']
+        )
+
+    def test_dispatch_waits_for_commit(self):
+        with mail.record_messages() as outbox:
+            self.send('john')
+            db.session.rollback()
+            self.send('susan')
+            db.session.commit()
+            dispatcher.join()
+        self.assertEqual([msg.body for msg in outbox],
+                         ['User susan has joined.'])
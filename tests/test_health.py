@@ -0,0 +1,87 @@
+import threading
+from unittest import mock
+
+import sqlalchemy as sa
+
+from app import db, role_cache
+from app.health import _HealthState, warm_up
+from app.models import Role
+from tests.base import CustomAppTestCase
+
+
+class HealthTestCase(CustomAppTestCase):
+    settings = {'WARMUP_ENABLED': True}
+    # The warm-up opens the pool's connections from its own thread.
+    database_file = True
+
+    def setUp(self):
+        super().setUp()
+        Role.insert_roles()
+        self.state = self.app.extensions['health'] = _HealthState(self.app)
+        self.addCleanup(self.state.wait, 5)
+        self.client = self.app.test_client()
+
+    def test_healthz(self):
+        response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'status': 'ok'})
+
+    def test_ready_after_warm_up(self):
+        release = threading.Event()
+
+        def held_warm_up(app):
+            release.wait(5)
+            return warm_up(app)
+
+        with mock.patch('app.health.warm_up', held_warm_up):
+            response = self.client.get('/readyz')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.get_json()['status'], 'warming up')
+            release.set()
+            self.assertTrue(self.state.wait(5))
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'ready')
+        self.assertEqual(set(response.get_json()['warm_up']),
+                         {'database', 'caches', 'templates', 'pages'})
+
+    def test_any_request_starts_warm_up(self):
+        with mock.patch('app.health.warm_up', return_value={}) as warm_up:
+            self.client.get('/auth/login')
+            self.assertTrue(self.state.wait(5))
+            self.client.get('/auth/login')
+        warm_up.assert_called_once_with(self.app)
+
+    def test_warm_up(self):
+        warm_up(self.app)
+        names = {key[1] for key in self.app.jinja_env.cache.keys()}
+        self.assertIn('base.html', names)
+        self.assertIn('bootstrap/wtf.html', names)
+        self.assertIn('mail/new_user.txt', names)
+        pool = db.engine.pool
+        self.assertEqual(pool.checkedin(), pool.size())
+        self.assertIsNotNone(role_cache.get('roles'))
+        self.assertIn(3600, self.app.extensions['confirmation_serializers'])
+
+    def test_failed_warm_up_is_retried(self):
+        with mock.patch('app.health.warm_up',
+                        side_effect=[RuntimeError('no database'), {}]):
+            with self.assertLogs(self.app.logger, 'ERROR'):
+                self.client.get('/readyz')
+                self.assertFalse(self.state.wait(5))
+            self.assertEqual(self.state.error, 'RuntimeError: no database')
+            # The next probe starts it again.
+            self.client.get('/readyz')
+            self.assertTrue(self.state.wait(5))
+        self.assertEqual(self.client.get('/readyz').status_code, 200)
+
+    def test_database_unavailable(self):
+        with mock.patch('app.health.warm_up', return_value={}):
+            self.client.get('/healthz')
+            self.assertTrue(self.state.wait(5))
+        self.assertEqual(self.client.get('/readyz').status_code, 200)
+        broken = sa.create_engine('sqlite:////nonexistent/health.sqlite')
+        with mock.patch('app.health.engines', return_value=[broken]):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['status'], 'unavailable')
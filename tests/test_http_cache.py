@@ -0,0 +1,168 @@
+import os
+import re
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from flask import template_rendered
+
+from app import db, response_cache
+from app.cache import FileSystemCache
+from app.http_cache import CSRF_PLACEHOLDER
+from app.models import User
+from tests.base import AppTestCase
+
+
+class ResponseCacheTestCase(AppTestCase):
+    config = {'WTF_CSRF_ENABLED': False}
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.app.test_client()
+        self.rendered = []
+        template_rendered.connect(self.record, self.app)
+        self.addCleanup(template_rendered.disconnect, self.record, self.app)
+
+    def record(self, sender, template, context, **extra):
+        self.rendered.append(template.name)
+
+    def test_anonymous_page_is_cached(self):
+        first = self.client.get('/user/john')
+        second = self.client.get('/user/john')
+        self.assertEqual(self.rendered, ['user.html'])
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertIn('no-cache', second.headers['Cache-Control'])
+        self.client.get('/user/susan')
+        self.assertEqual(self.rendered, ['user.html', 'user.html'])
+
+    def test_conditional_get(self):
+        etag = self.client.get('/user/john').headers['ETag']
+        response = self.client.get('/user/john',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_authenticated_requests_skip_cache(self):
+        user = User(email='john@example.com', username='john', password='cat',
+                    confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        self.client.get('/user/john')
+        self.client.post('/auth/login', data={
+            'email': 'john@example.com',
+            'password': 'cat'
+        })
+        del self.rendered[:]
+        response = self.client.get('/user/john')
+        self.assertIn(b'Log Out', response.data)
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(self.rendered, ['user.html'])
+
+    def test_flashed_messages_skip_cache(self):
+        self.client.get('/user/john')
+        self.client.get('/auth/confirm/not-a-token')
+        response = self.client.get('/user/john')
+        self.assertIn(b'The confirmation link is invalid', response.data)
+        response = self.client.get('/user/john')
+        self.assertNotIn(b'The confirmation link is invalid', response.data)
+
+    def test_index_varies_on_session(self):
+        self.client.get('/')
+        self.client.post('/', data={'name': 'john'})
+        response = self.client.get('/')
+        self.assertIn(b'Pleased to meet you', response.data)
+        self.client.post('/', data={'name': 'john'})
+        response = self.client.get('/')
+        self.assertIn(b'Happy to see you again', response.data)
+
+
+class CSRFResponseCacheTestCase(AppTestCase):
+    def open(self, client, *args, **kwargs):
+        # A fresh application context per request, the CSRF token is kept
+        # on g.
+        with self.app.app_context():
+            return client.open(*args, **kwargs)
+
+    def test_csrf_token_is_not_cached(self):
+        first = self.app.test_client()
+        for _ in range(3):
+            response = self.open(first, '/')
+        self.assertIn('ETag', response.headers)
+        self.assertEqual(len(response_cache.backend), 1)
+        self.assertNotIn(session_token(first),
+                         str(response_cache.backend._data))
+        # A new visitor is served the cached page with a token of its own,
+        # and the form it posts back passes the CSRF check.
+        second = self.app.test_client()
+        with mock.patch('app.main.views.render_template') as render:
+            response = self.open(second, '/')
+        render.assert_not_called()
+        self.assertNotIn(CSRF_PLACEHOLDER.encode(), response.data)
+        token = re.search(rb'id="csrf_token" name="csrf_token" '
+                          rb'type="hidden" value="([^"]+)"',
+                          response.data).group(1).decode()
+        response = self.open(second, '/', method='POST',
+                             data={'name': 'john', 'csrf_token': token})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotEqual(session_token(first), session_token(second))
+
+
+def session_token(client):
+    with client.session_transaction() as session:
+        return session['csrf_token']
+
+
+class FileSystemCacheTestCase(unittest.TestCase):
+    def test_filesystem_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FileSystemCache(directory, ttl=60)
+            cache.set('/user/john', {'body': 'Hello'})
+            other = FileSystemCache(directory)
+            self.assertEqual(other.get('/user/john'), {'body': 'Hello'})
+            other.delete('/user/john')
+            self.assertIsNone(cache.get('/user/john'))
+
+    def test_filesystem_cache_threshold(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FileSystemCache(directory, ttl=60, threshold=3)
+            now = time.time()
+            for i, age in enumerate([50, 30, 40]):
+                cache.set(i, i)
+                os.utime(cache._path(i), (now, now - age))
+            cache.set(3, 3)
+            # The oldest entry went when the fourth one was added.
+            self.assertEqual(len(cache._entries()), 3)
+            self.assertIsNone(cache.get(0))
+            self.assertEqual([cache.get(i) for i in (1, 2, 3)], [1, 2, 3])
+            # Past the threshold, every expired entry goes, not only the
+            # oldest.
+            os.utime(cache._path(1), (0, 0))
+            os.utime(cache._path(3), (0, 0))
+            cache.set(4, 4)
+            self.assertEqual(sorted(path for _, path in cache._entries()),
+                             sorted(cache._path(i) for i in (2, 4)))
+            self.assertEqual(cache._read_count(), 2)
+
+    def test_filesystem_cache_counts_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FileSystemCache(directory, ttl=60, threshold=3)
+            with mock.patch('app.cache.os.scandir',
+                            wraps=os.scandir) as scandir:
+                for i in range(3):
+                    cache.set(i, i)
+                cache.set(0, 0)
+                cache.delete(1)
+                cache.set(3, 3)
+                # The directory is only scanned past the threshold.
+                scandir.assert_not_called()
+                self.assertEqual(cache._read_count(), 3)
+                cache.set(4, 4)
+                scandir.assert_called_once()
+            self.assertEqual(cache._read_count(), 3)
+            # A cache opened on an existing directory counts its entries.
+            os.remove(cache._count_path)
+            self.assertEqual(
+                FileSystemCache(directory, threshold=3)._read_count(), 3
+            )
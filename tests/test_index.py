@@ -0,0 +1,72 @@
+import threading
+from unittest import mock
+
+import flask
+
+from app import mail
+from app.email import TemplateMessage, dispatcher
+from app.models import OutboxMessage, Role, User
+from tests.base import AppTestCase
+
+
+class IndexTestCase(AppTestCase):
+    config = {'WTF_CSRF_ENABLED': False,
+              'MAIL_RECIPIENT': 'admin@example.com'}
+
+    def setUp(self):
+        super().setUp()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.statements = self.record_statements()
+
+    def tearDown(self):
+        dispatcher.shutdown(timeout=5)
+
+    def post(self, name):
+        return self.client.post('/', data={'name': name})
+
+    def test_new_name(self):
+        self.post('warmup')
+        dispatcher.join()
+        del self.statements[:]
+        threads = []
+        real_render = flask.templating._render
+
+        def render(*args):
+            threads.append(threading.current_thread())
+            return real_render(*args)
+
+        with mail.record_messages() as outbox:
+            with mock.patch('flask.templating._render', render):
+                response = self.post('john')
+                dispatcher.join()
+        # Both mail templates were rendered by the mail worker.
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self.statements), 1)
+        self.assertTrue(self.statements[0].startswith('INSERT'))
+        self.assertEqual(len(outbox), 1)
+        self.assertIsInstance(outbox[0], TemplateMessage)
+        self.assertIn('john', outbox[0].body)
+        user = User.query.filter_by(username='john').one()
+        self.assertEqual(user.role.name, 'User')
+        with self.client.session_transaction() as session:
+            self.assertFalse(session['known'])
+
+    def test_known_name(self):
+        self.post('john')
+        dispatcher.join()
+        with mail.record_messages() as outbox:
+            self.post('john')
+            dispatcher.join()
+        self.assertEqual(outbox, [])
+        self.assertEqual(User.query.filter_by(username='john').count(), 1)
+        with self.client.session_transaction() as session:
+            self.assertTrue(session['known'])
+
+    def test_outbox_renders_in_request(self):
+        self.app.config['MAIL_OUTBOX'] = True
+        self.post('john')
+        message = OutboxMessage.query.one()
+        self.assertIn('john', message.body)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+from app import db
+from app.models import User
+from tests.base import CustomAppTestCase
+
+
+class MetricsTestCase(CustomAppTestCase):
+    settings = {
+        'METRICS_ENABLED': True,
+        'METRICS_PROFILE': True,
+        'METRICS_PROFILE_THRESHOLD': 0,
+        'METRICS_PROFILE_INTERVAL': 0.001,
+        'WTF_CSRF_ENABLED': False,
+    }
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.app.config['METRICS_PROFILE_DIR'] = self.profile_dir = tmpdir.name
+        registry = self.app.extensions['metrics']
+        registry.histograms.clear()
+        registry.counters.clear()
+        self.client = self.app.test_client()
+
+    def test_metrics_endpoint(self):
+        user = User(email='john@example.com', username='john', password='cat',
+                    confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        self.client.get('/')
+        self.client.post('/auth/login', data={
+            'email': 'john@example.com',
+            'password': 'cat'
+        })
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE flasky_request_duration_seconds histogram', text)
+        self.assertIn(
+            'flasky_request_duration_seconds_count'
+            '{endpoint="main.index",method="GET"} 1', text
+        )
+        self.assertIn(
+            'flasky_requests_total{endpoint="auth.login",status="302"} 1', text
+        )
+        # Query counts get buckets of their own, not the seconds ones.
+        self.assertIn('flasky_request_sql_queries_bucket'
+                      '{endpoint="auth.login",le="2"}', text)
+        self.assertNotIn('flasky_request_sql_queries_bucket'
+                         '{endpoint="auth.login",le="0.001"}', text)
+        self.assertIn('flasky_template_render_seconds_count'
+                      '{template="index.html"} 1', text)
+        self.assertIn('flasky_password_hash_seconds_count'
+                      '{operation="verify"} 1', text)
+        self.assertIn('flasky_mail_queue_depth 0', text)
+
+    def test_metrics_access(self):
+        remote = {'REMOTE_ADDR': '10.1.2.3'}
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        response = self.client.get('/metrics', environ_base=remote)
+        self.assertEqual(response.status_code, 403)
+        self.app.config['METRICS_TOKEN'] = 'secret'
+        for header, status in (('Bearer secret', 200), ('Bearer wrong', 403),
+                               ('Bearer sécret', 403)):
+            response = self.client.get('/metrics', environ_base=remote,
+                                       headers={'Authorization': header})
+            self.assertEqual(response.status_code, status, header)
+        self.app.config['METRICS_ALLOWED_IPS'] = ['10.0.0.0/8']
+        response = self.client.get('/metrics', environ_base=remote)
+        self.assertEqual(response.status_code, 200)
+
+    def test_slow_request_profile(self):
+        self.client.get('/')
+        profiles = os.listdir(self.profile_dir)
+        self.assertTrue(any('main.index' in name for name in profiles))
@@ -0,0 +1,95 @@
+from unittest import mock
+
+from app import db
+from app.models import Role, User
+from app.querybudget import QueryBudgetExceeded, query_budget
+from tests.base import AppTestCase
+
+
+class QueryBudgetTestCase(AppTestCase):
+    config = {'WTF_CSRF_ENABLED': False}
+
+    def setUp(self):
+        super().setUp()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def over_budget(self, endpoint, budget):
+        view = self.app.view_functions[endpoint]
+        return mock.patch.object(view, 'query_budget', budget)
+
+    def test_within_budget(self):
+        with query_budget(2) as recorder:
+            Role.query.all()
+            User.query.all()
+        self.assertEqual(len(recorder), 2)
+
+    def test_too_many_queries(self):
+        with self.assertRaises(QueryBudgetExceeded) as cm:
+            with query_budget(1, max_repeats=2):
+                Role.query.all()
+                User.query.all()
+        self.assertIn('2 queries, the budget is 1', str(cm.exception))
+
+    def test_repeated_query(self):
+        with self.assertRaises(QueryBudgetExceeded) as cm:
+            with query_budget(10):
+                for role in Role.query.all():
+                    role.users.all()
+        message = str(cm.exception)
+        self.assertIn('3 runs of: SELECT users.', message)
+        # Every statement is reported with the line that ran it.
+        self.assertIn('test_querybudget.py', message)
+        self.assertIn('role.users.all()', message)
+
+    def test_transaction_control_not_counted(self):
+        user = User(email='john@example.com', password='cat')
+        with query_budget(1) as recorder:
+            db.session.add(user)
+            db.session.commit()
+        self.assertEqual(len(recorder), 1)
+
+    def test_views_within_budget(self):
+        user = User(email='john@example.com', username='john',
+                    password='cat', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        token = user.generate_confirmation_token()
+        self.client.get('/auth/login')
+        self.client.post('/auth/login', data={
+            'email': 'john@example.com', 'password': 'cat'
+        })
+        for url in ('/', '/user/john', '/auth/unconfirmed', '/auth/confirm',
+                    f'/auth/confirm/{token}', '/auth/change-password'):
+            self.assertLess(self.client.get(url).status_code, 400, url)
+        self.client.post('/', data={'name': 'susan'})
+        self.client.post('/auth/change-password', data={
+            'old_password': 'cat', 'password': 'dog', 'password2': 'dog'
+        })
+        self.client.get('/auth/logout')
+        self.client.post('/auth/register', data={
+            'email': 'susan@example.com', 'username': 'susan2',
+            'password': 'cat', 'password2': 'cat'
+        })
+
+    def test_raise_mode(self):
+        with self.over_budget('main.index', query_budget(1)):
+            with self.assertRaises(QueryBudgetExceeded) as cm:
+                self.client.post('/', data={'name': 'john'})
+        self.assertIn('main.index', str(cm.exception))
+
+    def test_log_mode(self):
+        with self.over_budget('main.index', query_budget(1)), \
+                mock.patch.dict(self.app.config, QUERY_BUDGET_MODE='log'):
+            with self.assertLogs(self.app.logger, 'WARNING') as logs:
+                response = self.client.post('/', data={'name': 'john'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('Query budget exceeded in main.index', logs.output[0])
+        self.assertIn('views.py', logs.output[0])
+
+    def test_sampled_out(self):
+        with self.over_budget('main.index', query_budget(1)), \
+                mock.patch.dict(self.app.config,
+                                QUERY_BUDGET_SAMPLE_RATE=0.0):
+            response = self.client.post('/', data={'name': 'john'})
+        self.assertEqual(response.status_code, 302)
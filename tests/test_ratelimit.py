@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+
+from app import db
+from app.models import User
+from app.ratelimit import MemoryBackend, RateLimiter, limiter, parse_rate
+from tests.base import CustomAppTestCase
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5/minute'), (5, 60))
+        self.assertEqual(parse_rate('100 / 2 hours'), (100, 7200))
+        with self.assertRaises(ValueError):
+            parse_rate('5 per minute')
+
+    def test_bucket(self):
+        now = [0.0]
+        backend = MemoryBackend(clock=lambda: now[0])
+        for _ in range(3):
+            self.assertTrue(backend.hit('key', 3, 60)[0])
+        allowed, retry_after = backend.hit('key', 3, 60)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 20)
+        self.assertTrue(backend.hit('other', 3, 60)[0])
+        # One token is back after a third of the period.
+        now[0] = 20
+        self.assertTrue(backend.hit('key', 3, 60)[0])
+        self.assertFalse(backend.hit('key', 3, 60)[0])
+
+    def test_prune(self):
+        now = [0.0]
+        backend = MemoryBackend(clock=lambda: now[0], prune_every=2)
+        backend.hit('a', 1, 1)
+        now[0] = 5
+        backend.hit('b', 1, 1)
+        self.assertEqual(list(backend.buckets), ['b'])
+
+
+class RateLimitTestCase(CustomAppTestCase):
+    settings = {
+        'WTF_CSRF_ENABLED': False,
+        'RATELIMIT_ENABLED': True,
+        'RATELIMITS': {
+            'auth.login': {
+                'methods': ['POST'], 'ip': '5/minute', 'account': '2/minute'
+            },
+        },
+    }
+
+    def setUp(self):
+        super().setUp()
+        limiter.reset()
+        db.session.add(User(email='john@example.com', username='john',
+                            password='cat', confirmed=True))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def login(self, email='john@example.com', forwarded_for=None):
+        headers = {}
+        if forwarded_for is not None:
+            headers['X-Forwarded-For'] = forwarded_for
+        return self.client.post('/auth/login', data={
+            'email': email, 'password': 'dog'
+        }, headers=headers)
+
+    def test_per_account(self):
+        self.assertEqual(self.login().status_code, 302)
+        self.assertEqual(self.login('JOHN@example.com').status_code, 302)
+        statements = self.record_statements()
+        with mock.patch.object(User, 'verify_password') as verify_password:
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(statements, [])
+        verify_password.assert_not_called()
+        self.assertEqual(self.login('susan@example.com').status_code, 302)
+
+    def test_per_ip(self):
+        for i in range(5):
+            self.assertEqual(self.login(f'user{i}@example.com').status_code,
+                             302)
+        self.assertEqual(self.login('other@example.com').status_code, 429)
+        # Only the configured methods count.
+        self.assertEqual(self.client.get('/auth/login').status_code, 200)
+
+    def test_ip_checked_first(self):
+        for i in range(5):
+            self.login(f'user{i}@example.com')
+        statements = self.record_statements()
+        account = mock.Mock(return_value='email:other@example.com')
+        with mock.patch.dict(RateLimiter.keys, account=account):
+            # The session cookie makes loading the session a query.
+            self.client.set_cookie('localhost', 'session', 'sid')
+            response = self.login('other@example.com')
+        self.assertEqual(response.status_code, 429)
+        account.assert_not_called()
+        self.assertEqual(statements, [])
+
+    def test_forwarded_for(self):
+        for i in range(5):
+            self.login(f'user{i}@example.com', forwarded_for=f'10.0.0.{i}')
+        response = self.login('other@example.com', forwarded_for='10.0.0.9')
+        # The header is only trusted behind a configured proxy.
+        trusted = self.app.config['RATELIMIT_TRUSTED_PROXIES']
+        self.assertEqual(response.status_code, 302 if trusted else 429)
+
+
+class TrustedProxyTestCase(RateLimitTestCase):
+    settings = dict(RateLimitTestCase.settings, RATELIMIT_TRUSTED_PROXIES=1)
+
+    def test_last_forwarded_for(self):
+        for i in range(5):
+            self.login(f'user{i}@example.com', forwarded_for='10.0.0.1')
+        response = self.login('other@example.com', forwarded_for='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        # Only the entry added by the proxy counts, not the client's own.
+        response = self.login('other@example.com',
+                              forwarded_for='10.0.0.1, 10.0.0.2')
+        self.assertEqual(response.status_code, 302)
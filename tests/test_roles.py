@@ -0,0 +1,71 @@
+from app import db, role_cache
+from app.models import (AnonymousUser, Permission, Role, User, load_user,
+                        role_table)
+from tests.base import AppTestCase
+
+
+class RoleTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        Role.insert_roles()
+        self.statements = self.record_statements()
+
+    def test_default_role(self):
+        user = User(email='john@example.com', password='cat')
+        self.assertEqual(user.role_id,
+                         Role.query.filter_by(name='User').one().id)
+        self.assertTrue(user.can(Permission.WRITE))
+        self.assertFalse(user.can(Permission.MODERATE))
+        self.assertFalse(user.is_administrator())
+
+    def test_explicit_role(self):
+        admin = Role.query.filter_by(name='Administrator').one()
+        user = User(email='john@example.com', password='cat', role=admin)
+        self.assertIs(user.role, admin)
+        self.assertTrue(user.is_administrator())
+
+    def test_anonymous_user(self):
+        user = AnonymousUser()
+        self.assertFalse(user.can(Permission.FOLLOW))
+        self.assertFalse(user.is_administrator())
+
+    def test_can_makes_no_query(self):
+        user = User(email='john@example.com', username='john',
+                    password='cat')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        db.session.remove()
+        load_user(str(user_id))
+        db.session.remove()
+        del self.statements[:]
+        user = load_user(str(user_id))
+        self.assertTrue(user.can(Permission.COMMENT))
+        self.assertFalse(user.can(Permission.ADMIN))
+        self.assertEqual(self.statements, [])
+
+    def test_role_change_invalidates(self):
+        user = User(email='john@example.com', password='cat')
+        self.assertFalse(user.can(Permission.MODERATE))
+        role = Role.query.filter_by(name='User').one()
+        role.add_permission(Permission.MODERATE)
+        db.session.commit()
+        self.assertTrue(user.can(Permission.MODERATE))
+        role.remove_permission(Permission.MODERATE)
+        db.session.commit()
+        self.assertFalse(user.can(Permission.MODERATE))
+
+    def test_new_role_invalidates(self):
+        self.assertEqual(len(role_table()), 3)
+        self.assertIsNotNone(role_cache.get('roles'))
+        db.session.add(Role(name='Guest'))
+        db.session.commit()
+        self.assertIsNone(role_cache.get('roles'))
+
+    def test_insert_roles_is_idempotent(self):
+        Role.insert_roles()
+        self.assertEqual(Role.query.count(), 3)
+        self.assertEqual(
+            [role.name for role in Role.query.filter_by(default=True)],
+            ['User']
+        )
@@ -0,0 +1,50 @@
+import gc
+
+import sqlalchemy as sa
+
+from app import db
+from app.health import _HealthState
+from app.models import Role
+from app.serving import after_fork, prepare_master, stop_worker, warm_worker
+from tests.base import CustomAppTestCase
+
+
+class ServingTestCase(CustomAppTestCase):
+    settings = {'WARMUP_ENABLED': True}
+    database_file = True
+
+    def setUp(self):
+        super().setUp()
+        Role.insert_roles()
+        self.app.extensions['health'] = _HealthState(self.app)
+
+    def test_prepare_master(self):
+        with db.engine.connect() as connection:
+            connection.execute(sa.text('SELECT 1'))
+        self.addCleanup(gc.unfreeze)
+        prepare_master(self.app)
+        self.assertEqual(db.engine.pool.checkedin(), 0)
+        self.assertGreater(gc.get_freeze_count(), 0)
+        names = {key[1] for key in self.app.jinja_env.cache.keys()}
+        self.assertIn('base.html', names)
+
+    def test_after_fork_keeps_inherited_connections_open(self):
+        connection = db.engine.connect()
+        self.addCleanup(connection.close)
+        inherited = connection.connection.dbapi_connection
+        after_fork(self.app)
+        # The parent's connection still works, the pool opens new ones.
+        inherited.execute('SELECT 1')
+        with db.engine.connect() as fresh:
+            self.assertIsNot(fresh.connection.dbapi_connection, inherited)
+
+    def test_warm_worker(self):
+        self.assertTrue(warm_worker(self.app, timeout=5))
+        self.assertEqual(self.app.test_client().get('/readyz').status_code,
+                         200)
+
+    def test_stop_worker(self):
+        pool = self.app.extensions['mail_dispatcher']
+        pool.start()
+        stop_worker(self.app, timeout=5)
+        self.assertEqual(pool.workers, [])
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from app import db
+from app.models import StoredSession, User
+from app.sessions import MemorySessionStore, SQLAlchemySessionStore
+from tests.base import AppTestCase, CustomAppTestCase
+
+
+class ServerSideSessionTestCase(AppTestCase):
+    config = {'WTF_CSRF_ENABLED': False}
+    store_class = MemorySessionStore
+
+    def setUp(self):
+        super().setUp()
+        self.store = self.app.session_interface.store
+        self.client = self.app.test_client()
+
+    def sid(self):
+        for cookie in self.client.cookie_jar:
+            if cookie.name == 'session':
+                return cookie.value
+
+    def login(self):
+        user = User(email='john@example.com', username='john',
+                    password='cat', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        return self.client.post('/auth/login', data={
+            'email': 'john@example.com', 'password': 'cat'
+        })
+
+    def check_session_flow(self):
+        self.client.get('/')
+        self.assertIsNone(self.sid())
+
+        self.client.post('/', data={'name': 'susan'})
+        anonymous = self.sid()
+        self.assertEqual(len(anonymous), 43)
+        self.assertEqual(self.store.load(anonymous)['name'], 'susan')
+
+        # Reading the session neither writes it nor sends the cookie.
+        with mock.patch.object(self.store, 'save') as save:
+            response = self.client.get('/')
+        save.assert_not_called()
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertEqual(response.status_code, 200)
+
+        # Logging in moves the data to a new id.
+        self.login()
+        self.assertNotEqual(self.sid(), anonymous)
+        self.assertIsNone(self.store.load(anonymous))
+        self.assertEqual(self.store.load(self.sid())['name'], 'susan')
+
+        self.client.get('/auth/logout')
+        self.assertIsNone(self.store.load(anonymous))
+
+    def test_session_flow(self):
+        self.assertIsInstance(self.store, self.store_class)
+        self.check_session_flow()
+
+    def test_lazy_load(self):
+        self.client.post('/', data={'name': 'john'})
+        with mock.patch.object(self.store, 'load') as load:
+            self.client.get('/static/favicon.ico').close()
+        load.assert_not_called()
+
+    def test_unknown_id_starts_new_session(self):
+        self.client.set_cookie('localhost', 'session', 'forged')
+        self.client.post('/', data={'name': 'john'})
+        self.assertNotEqual(self.sid(), 'forged')
+        self.assertIsNone(self.store.load('forged'))
+
+
+class SQLAlchemySessionTestCase(ServerSideSessionTestCase,
+                                CustomAppTestCase):
+    settings = {'SESSION_TYPE': 'sqlalchemy'}
+    # The store runs its own transactions on the engine.
+    database_file = True
+    store_class = SQLAlchemySessionStore
+
+    def test_cleanup_in_batches(self):
+        expired = datetime.utcnow() - timedelta(minutes=1)
+        valid = datetime.utcnow() + timedelta(minutes=1)
+        for i in range(5):
+            self.store.save(f'expired{i}', {'i': i}, expired, True)
+        self.store.save('valid', {}, valid, True)
+        self.assertIsNone(self.store.load('expired0'))
+        self.assertEqual(self.store.cleanup(batch_size=2), 5)
+        self.assertEqual(
+            [s.id for s in StoredSession.query.all()], ['valid']
+        )
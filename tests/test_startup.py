@@ -0,0 +1,47 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from app import create_app, db
+
+
+def loaded_modules(code, **env):
+    script = f'import sys\n{code}\nprint(json.dumps(sorted(sys.modules)))'
+    env = dict(os.environ, SECRET_KEY='test', **env)
+    # Set when running under 'flask test', it would load Flask-Migrate.
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    result = subprocess.run(
+        [sys.executable, '-c', f'import json\n{script}'],
+        env=env,
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    return set(json.loads(result.stdout))
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_minimal_profile(self):
+        app = create_app('testing', profile='minimal')
+        self.assertEqual(app.blueprints, {})
+        self.assertNotIn('bootstrap', app.extensions)
+        self.assertIn('mail_dispatcher', app.extensions)
+        with app.app_context():
+            db.create_all()
+            db.drop_all()
+
+    def test_minimal_profile_imports(self):
+        modules = loaded_modules(
+            'from app import create_app\n'
+            'create_app("testing", profile="minimal")'
+        )
+        for module in ('flask_bootstrap', 'flask_moment', 'wtforms',
+                       'flask_migrate', 'concurrent.futures.process'):
+            self.assertNotIn(module, modules)
+
+    def test_web_worker_skips_migrations(self):
+        modules = loaded_modules('import flasky', FLASK_CONFIG='testing')
+        self.assertIn('flask_bootstrap', modules)
+        self.assertNotIn('flask_migrate', modules)
+        self.assertNotIn('alembic', modules)
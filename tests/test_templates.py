@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from jinja2 import FileSystemBytecodeCache
+
+from app.jinja import (MemoryBytecodeCache, compile_templates,
+                       configure_templates)
+from tests.base import AppTestCase
+
+
+class TemplateCacheTestCase(AppTestCase):
+    def configure(self, **settings):
+        """Set up the template cache from ``settings`` like a fresh worker,
+        with no template loaded yet.
+        """
+        env = self.app.jinja_env
+        self.addCleanup(setattr, env, 'bytecode_cache', env.bytecode_cache)
+        self.addCleanup(env.cache.clear)
+        self.app.config.update(settings)
+        configure_templates(self.app)
+        env.cache.clear()
+        return self.app
+
+    def test_default_testing_cache(self):
+        self.assertIsInstance(self.app.jinja_env.bytecode_cache,
+                              MemoryBytecodeCache)
+
+    def test_compile_all_templates(self):
+        app = self.configure()
+        names = compile_templates(app)
+        for name in ('base.html', 'auth/login.html', 'mail/new_user.txt',
+                     'auth/email/confirm.html', 'bootstrap/wtf.html'):
+            self.assertIn(name, names)
+        self.assertEqual(len(app.jinja_env.bytecode_cache.cache), len(names))
+
+    def test_filesystem_cache_shared_between_apps(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = {'TEMPLATE_CACHE_TYPE': 'filesystem',
+                    'TEMPLATE_CACHE_DIR': directory}
+        app = self.configure(**settings)
+        self.assertIsInstance(app.jinja_env.bytecode_cache,
+                              FileSystemBytecodeCache)
+        names = compile_templates(app)
+        self.assertEqual(len(os.listdir(directory)), len(names))
+
+        # A fresh worker loads the bytecode instead of compiling.
+        worker = self.configure(**settings)
+        with mock.patch.object(worker.jinja_env, 'compile',
+                               side_effect=AssertionError('compiled')):
+            with worker.test_request_context():
+                worker.jinja_env.get_template('index.html')
+                worker.jinja_env.get_template('auth/login.html')
+
+    def test_null_cache(self):
+        app = self.configure(TEMPLATE_CACHE_TYPE='null')
+        self.assertIsNone(app.jinja_env.bytecode_cache)
@@ -0,0 +1,96 @@
+import unittest
+
+from app import db, user_cache
+from app.cache import LRUCache, RedisCache, LocalRedis
+from app.models import User, Role, load_user
+from tests.base import AppTestCase
+
+
+class UserCacheTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.statements = self.record_statements()
+
+    def add_user(self):
+        user = User(email='john@example.com', username='john', password='cat')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        db.session.remove()
+        return user_id
+
+    def test_load_user_is_cached(self):
+        user_id = self.add_user()
+        self.assertEqual(load_user(str(user_id)).username, 'john')
+        db.session.remove()
+        del self.statements[:]
+        user = load_user(str(user_id))
+        self.assertEqual(user.username, 'john')
+        self.assertFalse(user.confirmed)
+        self.assertEqual(self.statements, [])
+
+    def test_cached_user_can_be_updated(self):
+        user_id = self.add_user()
+        load_user(str(user_id))
+        db.session.remove()
+        user = load_user(str(user_id))
+        token = user.generate_confirmation_token()
+        self.assertTrue(user.confirm(token))
+        db.session.commit()
+        self.assertIsNone(user_cache.get(user_id))
+        db.session.remove()
+        self.assertTrue(load_user(str(user_id)).confirmed)
+
+    def test_password_change_invalidates(self):
+        user_id = self.add_user()
+        load_user(str(user_id))
+        user = User.query.get(user_id)
+        user.password = 'dog'
+        db.session.commit()
+        self.assertIsNone(user_cache.get(user_id))
+        db.session.remove()
+        self.assertTrue(load_user(str(user_id)).verify_password('dog'))
+
+    def test_role_change_invalidates(self):
+        user_id = self.add_user()
+        load_user(str(user_id))
+        role = Role(name='Moderator')
+        user = User.query.get(user_id)
+        user.role = role
+        db.session.commit()
+        self.assertIsNone(user_cache.get(user_id))
+        db.session.remove()
+        self.assertEqual(load_user(str(user_id)).role.name, 'Moderator')
+
+    def test_missing_user(self):
+        self.assertIsNone(load_user('42'))
+        self.assertIsNone(user_cache.get(42))
+
+
+class CacheBackendTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2, ttl=None)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_lru_expiry(self):
+        now = [0]
+        cache = LRUCache(ttl=10, clock=lambda: now[0])
+        cache.set('a', 1)
+        now[0] = 9
+        self.assertEqual(cache.get('a'), 1)
+        now[0] = 10
+        self.assertIsNone(cache.get('a'))
+
+    def test_shared_backend(self):
+        client = LocalRedis()
+        cache = RedisCache(client, prefix='test:')
+        other = RedisCache(client, prefix='test:')
+        cache.set(1, {'username': 'john'})
+        self.assertEqual(other.get(1), {'username': 'john'})
+        other.delete(1)
+        self.assertIsNone(cache.get(1))
@@ -1,22 +1,13 @@
-import time
-import unittest
-
-from app import db, create_app
-from app.models import User
+from unittest import mock
 
+from werkzeug.security import generate_password_hash
 
-class UserModelTestCase(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app('testing')
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
+from app import db, password_hasher
+from app.models import User
+from tests.base import AppTestCase
 
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
 
+class UserModelTestCase(AppTestCase):
     def test_password_setter(self):
         user = User(password='cat')
         self.assertTrue(user.password_hash is not None)
@@ -36,6 +27,25 @@ class UserModelTestCase(unittest.TestCase):
         user2 = User(password='cat')
         self.assertTrue(user.password_hash != user2.password_hash)
 
+    def test_password_needs_rehash(self):
+        user = User(password='cat')
+        self.assertFalse(user.password_needs_rehash())
+        user.password_hash = generate_password_hash('cat', 'pbkdf2:sha256:500')
+        self.assertTrue(user.verify_password('cat'))
+        self.assertTrue(user.password_needs_rehash())
+
+    def test_password_hashing_pool(self):
+        # The app is shared, restore the inline hasher afterwards.
+        self.addCleanup(password_hasher.init_app, self.app)
+        with mock.patch.dict(self.app.config, PASSWORD_HASH_WORKERS=1):
+            password_hasher.init_app(self.app)
+        self.addCleanup(self.app.extensions['password_hasher'].shutdown)
+        user = User(password='cat')
+        self.assertTrue(user.verify_password('cat'))
+        self.assertFalse(user.verify_password('dog'))
+        hashes = password_hasher.hash_many(['cat', 'dog'])
+        self.assertTrue(password_hasher.verify(hashes[1], 'dog'))
+
     def test_valid_confirmation_token(self):
         user = User(password='cat')
         db.session.add(user)
@@ -57,5 +67,5 @@ class UserModelTestCase(unittest.TestCase):
         db.session.add(user)
         db.session.commit()
         token = user.generate_confirmation_token(expiration=1)
-        time.sleep(2)
+        self.clock.advance(2)
         self.assertFalse(user.confirm(token))
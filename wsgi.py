@@ -0,0 +1,11 @@
+"""WSGI entry point for production servers, e.g. ``gunicorn`` (which reads
+gunicorn.conf.py) or ``gunicorn wsgi:application``.
+
+Uses the 'production' configuration unless FLASK_CONFIG says otherwise.
+"""
+import os
+
+from app import create_app
+
+
+application = create_app(os.environ.get('FLASK_CONFIG') or 'production')